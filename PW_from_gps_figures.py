@@ -348,14 +348,15 @@ def plot_figure_2(path=tela_results_path, plot='WetZ', save=True):
 def plot_figure_3(path=tela_solutions, year=2004, field='WetZ',
                   middle_date='11-25', zooms=[10, 3, 0.5], save=True):
     from gipsyx_post_proc import analyse_results_ds_one_station
+    from gipsyx_post_proc import renamed_ds_to_ragged
+    from gipsyx_post_proc import get_ragged_day
     import xarray as xr
     import matplotlib.pyplot as plt
     import pandas as pd
-    dss = xr.open_dataset(path / 'TELA_ppp_raw_{}.nc'.format(year))
-    nums = sorted(list(set([int(x.split('-')[1])
-                            for x in dss if x.split('-')[0] == field])))
-    ds = dss[['{}-{}'.format(field, i) for i in nums]]
-    da = analyse_results_ds_one_station(dss, field=field, plot=False)
+    ds = xr.open_dataset(path / 'TELA_ppp_raw_{}.nc'.format(year))
+    if 'day' not in ds.dims:
+        ds = renamed_ds_to_ragged(ds)
+    da = analyse_results_ds_one_station(ds, field=field, plot=False)
     fig, axes = plt.subplots(ncols=1, nrows=3, sharex=False, figsize=(16, 10))
     for j, ax in enumerate(axes):
         start = pd.to_datetime('{}-{}'.format(year, middle_date)
@@ -363,8 +364,8 @@ def plot_figure_3(path=tela_solutions, year=2004, field='WetZ',
         end = pd.to_datetime('{}-{}'.format(year, middle_date)
                              ) + pd.Timedelta(zooms[j], unit='D')
         daa = da.sel(time=slice(start, end))
-        for i, ppp in enumerate(ds):
-            ds['{}-{}'.format(field, i)].plot(ax=ax, linewidth=3.0)
+        for i in range(ds['day'].size):
+            get_ragged_day(ds, field, i).plot(ax=ax, linewidth=3.0)
         daa.plot.line(marker='.', linewidth=0., ax=ax, color='k')
         axes[j].set_xlim(start, end)
         axes[j].set_ylim(daa.min() - 0.5, daa.max() + 0.5)
@@ -715,30 +716,13 @@ def plot_figure_7(gis_path=gis_path, save=True):
 
 def plot_figure_8(ims_path=ims_path, dt='2013-10-19T22:00:00', save=True):
     from aux_gps import path_glob
+    from ims_procedures import compute_lapse_rate_series
     import xarray as xr
     import matplotlib.pyplot as plt
     import numpy as np
     import pandas as pd
     # from matplotlib import rc
 
-    def choose_dt_and_lapse_rate(tdf, dt, T_alts, lapse_rate):
-        ts = tdf.loc[dt, :]
-        # dt_col = dt.strftime('%Y-%m-%d %H:%M')
-        # ts.name = dt_col
-        # Tloc_df = Tloc_df.join(ts, how='right')
-        # Tloc_df = Tloc_df.dropna(axis=0)
-        ts_vs_alt = pd.Series(ts.values, index=T_alts)
-        ts_vs_alt_for_fit = ts_vs_alt.dropna()
-        [a, b] = np.polyfit(ts_vs_alt_for_fit.index.values,
-                            ts_vs_alt_for_fit.values, 1)
-        if lapse_rate == 'auto':
-            lapse_rate = np.abs(a) * 1000
-            if lapse_rate < 5.0:
-                lapse_rate = 5.0
-            elif lapse_rate > 10.0:
-                lapse_rate = 10.0
-        return ts_vs_alt, lapse_rate
-
     # rc('text', usetex=False)
     # rc('text',latex.unicode=False)
     glob_str = 'IMS_TD_israeli_10mins*.nc'
@@ -758,7 +742,8 @@ def plot_figure_8(ims_path=ims_path, dt='2013-10-19T22:00:00', save=True):
     # dt_col = dt.strftime('%Y-%m-%d %H:%M')
     dt = pd.to_datetime(dt)
     # prepare the ims coords and temp df(Tloc_df) and the lapse rate:
-    ts_vs_alt, lapse_rate = choose_dt_and_lapse_rate(tdf, dt, T_alts, 'auto')
+    ts_vs_alt = pd.Series(tdf.loc[dt, :].values, index=T_alts)
+    lapse_rate = compute_lapse_rate_series(tdf.loc[[dt], :], T_alts).item()
     fig, ax_lapse = plt.subplots(figsize=(10, 6))
     sns.regplot(x=ts_vs_alt.index, y=ts_vs_alt.values, color='r',
                 scatter_kws={'color': 'k'}, ax=ax_lapse)
@@ -1143,11 +1143,18 @@ def get_minimum_distance(geo_ims, geo_gps, path, plot=True):
 
 def fix_T_height(path, geo_df, lapse_rate=6.5):
     """fix the temperature diffrence due to different height between the IMS
-    and GPS stations"""
+    and GPS stations, lapse_rate can also be a time series(e.g., from
+    ims_procedures.compute_lapse_rate_series)"""
     # use lapse rate of 6.5 K/km = 6.5e-3 K/m
     import xarray as xr
-    lr = 1e-3 * lapse_rate  # convert to K/m
     Tds = xr.open_dataset(path / 'IMS_TD_israeli_for_gps.nc')
+    if isinstance(lapse_rate, pd.Series):
+        lapse_rate = lapse_rate.rename_axis('time').to_xarray()
+        lapse_rate = lapse_rate.reindex(time=Tds['time'])
+    lr = 1e-3 * lapse_rate  # convert to K/m
+    if isinstance(lapse_rate, xr.DataArray):
+        # time varying lapse rate, keep its mean in the attrs:
+        lapse_rate = lapse_rate.mean().item()
     stations = [x for x in Tds.data_vars.keys() if 'missing' not in x]
     ds_list = []
     for st in stations:
@@ -1161,7 +1168,7 @@ def fix_T_height(path, geo_df, lapse_rate=6.5):
                                             'and the gps station is {}'\
                                             .format(lapse_rate, alt_diff)
             Tds[st].attrs['lapse_rate_fix'] = lapse_rate
-            ds_list.append(Tds[st] + lr * alt_diff)
+            ds_list.append((Tds[st] + lr * alt_diff).rename(st))
         except KeyError:
             print('{} station not found in gps data'.format(st))
         continue
@@ -1240,6 +1247,70 @@ def save_GNSS_PW_israeli_stations(savepath=work_yuval, phys=phys_soundings):
     return
 
 
+def load_GNSS_station_zwd(station, sample_rate=None):
+    """load the WetZ and WetZ_error of station as station and station_error
+    fields, returns None if there is no gipsyx solution for station"""
+    ds = load_gipsyx_results(station, sample_rate, plot_fields=None)
+    if ds is None:
+        return None
+    zwd = ds[['WetZ', 'WetZ_error']].load()
+    zwd = zwd.rename({'WetZ': station,
+                      'WetZ_error': '{}_error'.format(station)})
+    zwd.attrs = {}
+    return zwd
+
+
+def save_GNSS_PW_all_stations(savepath=work_yuval, phys=phys_soundings,
+                              model=None, sample_rates=[None, '1H', '3H',
+                                                        'D', 'W', 'MS'],
+                              jobs=4):
+    """batch version of save_GNSS_PW_israeli_stations: the Ts-Tm model is
+    fitted(or loaded from cache) once, the temperature store is opened once
+    per sample rate, the stations zwd are loaded with jobs processes and PW
+    is produced for all stations in one stacked call. sample rate None is
+    the full 5 mins data. model=None is LR, model='bevis' is Bevis 1992."""
+    from concurrent.futures import ProcessPoolExecutor
+    from aux_gps import path_glob
+    import xarray as xr
+    import time
+    sample = {'1H': 'hourly', '3H': '3hourly', 'D': 'Daily', 'W': 'weekly',
+              'MS': 'monthly'}
+    td_sample = {'1H': 'hourly', '3H': '3hourly', 'D': 'daily',
+                 'W': 'weekly', 'MS': 'monthly'}
+    filename = 'israeli_gnss_coords.txt'
+    df = pd.read_csv(Path().cwd() / filename, header=0, delim_whitespace=True)
+    stations = df.index.tolist()
+    if model is None:
+        mda = load_or_fit_ts_tm_models(categories=None, models=['LR'],
+                                       physical_file=phys)
+    elif model == 'bevis':
+        mda = None
+    for skey in sample_rates:
+        t0 = time.time()
+        if skey is None:
+            glob = 'GNSS_5mins_TD_ALL*.nc'
+            filename = 'GNSS_PW.nc'
+        else:
+            glob = 'GNSS_{}_TD_ALL*.nc'.format(td_sample[skey])
+            filename = 'GNSS_{}_PW.nc'.format(sample[skey])
+        Ts = xr.load_dataset(path_glob(ims_path, glob_str=glob)[0])
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            zwds = list(executor.map(load_GNSS_station_zwd, stations,
+                                     [skey] * len(stations)))
+        zwd = xr.merge([x for x in zwds if x is not None])
+        ds = produce_stations_IPW(zwd, Ts, mda)
+        print('produced PW for {} stations in {:.1f} secs'.format(
+            len([x for x in ds.data_vars if '_error' not in x]),
+            time.time() - t0))
+        if savepath is not None:
+            print('saving {} to {}'.format(filename, savepath))
+            comp = dict(zlib=True, complevel=9)  # best compression
+            encoding = {var: comp for var in ds.data_vars}
+            ds.to_netcdf(savepath / filename, 'w', encoding=encoding)
+    print('Done!')
+    return
+
+
 def align_group_pw_and_T_to_long_term_monthly_means_and_save(
         load_path=work_yuval,
         ims_path=ims_path,
@@ -1346,8 +1417,8 @@ def produce_GNSS_station_PW(station='tela', sample_rate=None, model=None,
     upsampled_daily = Ts_daily.resample(time='1D').ffill()
     damped = Ts*0.25 + 0.75*upsampled_daily
     if model is None:
-        mda = ml_models_T_from_sounding(categories=None, models=['LR'],
-                                        physical_file=phys, plot=False)
+        mda = load_or_fit_ts_tm_models(categories=None, models=['LR'],
+                                       physical_file=phys)
     elif model == 'bevis':
         mda = None
     PW = produce_single_station_IPW(zwd, Ts, mda)
@@ -1361,7 +1432,8 @@ def produce_GNSS_station_PW(station='tela', sample_rate=None, model=None,
 def produce_single_station_IPW(zwd, Tds, mda=None, model_name='LR'):
     """input is zwd from gipsy or garner, Tds is the temperature of the
     station, mda is the Ts-Tm relationsship ml models dataarray, model is
-    the ml model chosen."""
+    the ml model chosen. zwd and Tds can also be stacked station X time
+    dataarrays(see produce_stations_IPW)."""
     import xarray as xr
     # hours = dict(zip([12, 0], ['noon', 'midnight']))
     if isinstance(zwd, xr.Dataset):
@@ -1398,14 +1470,12 @@ def produce_single_station_IPW(zwd, Tds, mda=None, model_name='LR'):
         val = mda['{}.hour'.format(time_dim)].values.tolist()
         key = '{}.hour'.format(time_dim)
         hours = {key: val}
-    if 'any_cld' in mda.dims:
-        any_clds = mda.any_cld.values.tolist()
     if len(mda.dims) == 1 and 'name' in mda.dims:
         print('Found whole data Ts-Tm relationship.')
 #        Tmul = mda.sel(parameter='slope').values.item()
 #        Toff = mda.sel(parameter='intercept').values.item()
-        m = mda.sel(name=model_name).values.item()
-        kappa_ds, kappa_err = kappa_ml(Tds, model=m, slope_err=mda.attrs['LR_whole_stderr_slope'])
+        kappa_ds, kappa_err = kappa_ml_categorical(
+            Tds, mda, model_name, slope_err=mda.attrs['LR_whole_stderr_slope'])
         ipw = kappa_ds * zwd
         ipw_error = kappa_ds * zwd_error + zwd * kappa_err
         ipw_error.name = 'PW_error'
@@ -1422,84 +1492,34 @@ def produce_single_station_IPW(zwd, Tds, mda=None, model_name='LR'):
         return ipw
     elif len(mda.dims) == 2 and hours is not None:
         print('Found hourly Ts-Tm relationship slice.')
-        kappa_list = []
-        kappa_err_list = []
-        h_key = [x for x in hours.keys()][0]
-        for hr_num in [x for x in hours.values()][0]:
-            print('working on hour {}'.format(hr_num))
-            sliced = Tds.where(Tds[h_key] == hr_num).dropna(time_dim)
-            m = mda.sel({'name': model_name, h_key: hr_num}).values.item()
-            kappa_part, kappa_err = kappa_ml(sliced, model=m)
-            kappa_list.append(kappa_part)
-            kappa_err_list.append(kappa_err)
         des_attrs = 'hourly data Tm formulation using {} model'.format(
             model_name)
     elif len(mda.dims) == 2 and seasons is not None:
         print('Found season Ts-Tm relationship slice.')
-        kappa_list = []
-        kappa_err_list = []
-        s_key = [x for x in seasons.keys()][0]
-        for season in [x for x in seasons.values()][0]:
-            print('working on season {}'.format(season))
-            sliced = Tds.where(Tds[s_key] == season).dropna('time')
-            m = mda.sel({'name': model_name, s_key: season}).values.item()
-            kappa_part, kappa_err = kappa_ml(sliced, model=m)
-            kappa_list.append(kappa_part)
-            kappa_err_list.append(kappa_err)
         des_attrs = 'seasonly data Tm formulation using {} model'.format(
             model_name)
     elif len(mda.dims) == 2 and set(mda.dims) == set(['any_cld', 'name']):
         print('Found clouds Ts-Tm relationship slice.')
+        des_attrs = 'clouds data Tm formulation using {} model'.format(
+            model_name)
     elif (len(mda.dims) == 3 and set(mda.dims) ==
           set(['any_cld', 'season', 'name'])):
         print('Found clouds and seasonly Ts-Tm relationship slice.')
+        des_attrs = 'clouds and seasonly data Tm formulation using {} model'.format(
+            model_name)
     elif (len(mda.dims) == 3 and set(mda.dims) ==
           set(['any_cld', 'hour', 'name'])):
         print('Found clouds and hour Ts-Tm relationship slice.')
-        # no way to find clouds in historical data ??
-        kappa_list = []
-#        mda_list = []
-#        mda_vals = []
-        for hr_num in hours.keys():
-            for any_cld in any_clds:
-                print('working on any_cld {}, hour {}'.format(
-                    any_cld, hours[hr_num]))
-#                Tmul = models.sel(any_cld=any_cld, hour=hours[hr_num],
-#                                   parameter='slope')
-#                Toff = models.sel(any_cld=any_cld, hour=hours[hr_num],
-#                                   parameter='intercept')
-                sliced = Tds.where(Tds['time.season'] == season).dropna(
-                    'time').where(Tds['time.hour'] == hr_num).dropna('time')
-                m = mda.sel(any_cld=any_cld, hour=hours[hr_num],
-                            name=model_name)
-                kappa_part = kappa_ml(sliced, model=m)
-                kappa_keys = ['T_multiplier', 'T_offset', 'k2', 'k3']
-                kappa_keys = [x + '_' + season + '_' + hours[hr_num] for x in
-                              kappa_keys]
-                mda_list.append(kappa_keys)
-                mda_vals.append([Tmul.values.item(), Toff.values.item(),
-                                 k2, k3])
-                kappa_list.append(kappa_part)
+        des_attrs = 'clouds and hourly data Tm formulation using {} model'.format(
+            model_name)
     elif (len(mda.dims) == 3 and seasons is not None and hours is not None):
         print('Found hourly and seasonly Ts-Tm relationship slice.')
-        kappa_list = []
-        kappa_err_list = []
-        h_key = [x for x in hours.keys()][0]
-        s_key = [x for x in seasons.keys()][0]
-        for hr_num in [x for x in hours.values()][0]:
-            for season in [x for x in seasons.values()][0]:
-                print('working on season {}, hour {}'.format(
-                    season, hr_num))
-                sliced = Tds.where(Tds[s_key] == season).dropna(
-                    time_dim).where(Tds[h_key] == hr_num).dropna(time_dim)
-                m = mda.sel({'name': model_name, s_key: season,
-                             h_key: hr_num}).values.item()
-                kappa_part, kappa_err = kappa_ml(sliced, model=m)
-                kappa_list.append(kappa_part)
-                kappa_err_list.append(kappa_err)
         des_attrs = 'hourly and seasonly data Tm formulation using {} model'.format(model_name)
-    kappa_ds = xr.concat(kappa_list, time_dim)
-    kappa_err_ds = xr.concat(kappa_err_list, time_dim)
+    # no way to find clouds in historical data, kappa_ml_categorical raises:
+    kappa_ds, kappa_err_ds = kappa_ml_categorical(Tds, mda, model_name)
+    # keep only the times that have a category model and a temperature:
+    kappa_ds = kappa_ds.dropna(time_dim, how='all')
+    kappa_err_ds = kappa_err_ds.dropna(time_dim, how='all')
     ipw = kappa_ds * zwd
     ipw_error = kappa_ds * zwd_error + zwd * kappa_err_ds
     ipw_error.name = 'PW_error'
@@ -1516,6 +1536,64 @@ def produce_single_station_IPW(zwd, Tds, mda=None, model_name='LR'):
     return ipw
 
 
+def produce_stations_IPW(zwd, Tds, mda=None, model_name='LR'):
+    """produce PW for all the stations in one call: zwd is a dataset of
+    station and station_error fields and Tds is a dataset of station
+    temperature fields. both are stacked to station X time dataarrays and
+    the returned dataset has station and station_error fields."""
+    import xarray as xr
+    stations = [x for x in zwd.data_vars if '_error' not in x and x in Tds]
+    zwd_error = zwd[['{}_error'.format(x) for x in stations]]
+    zwd_error = zwd_error.rename(dict(zip(zwd_error.data_vars, stations)))
+    zwd_st = xr.Dataset()
+    zwd_st['WetZ'] = zwd[stations].to_array('station')
+    zwd_st['WetZ_error'] = zwd_error.to_array('station')
+    Ts = Tds[stations].to_array('station')
+    ipw = produce_single_station_IPW(zwd_st, Ts, mda, model_name)
+    pw = ipw['PW'].to_dataset('station')
+    pw_error = ipw['PW_error'].to_dataset('station')
+    for sta in stations:
+        pw[sta].attrs = ipw['PW'].attrs
+        pw['{}_error'.format(sta)] = pw_error[sta]
+        pw['{}_error'.format(sta)].attrs = ipw['PW_error'].attrs
+    pw.attrs = ipw.attrs
+    return pw
+
+
+def kappa_ml_categorical(T, mda, model_name='LR', slope_err=None):
+    """vectorized kappa_ml for the Ts-Tm models dataarray (mda) with or
+    without season and/or hour categories: every timestamp of T is mapped to
+    its category with one integer index that gathers the slopes and
+    intercepts of the models, so kappa and its error are computed in a single
+    pass. T can be 1D or stacked station X time."""
+    import numpy as np
+    import pandas as pd
+    import xarray as xr
+    time_dim = mda.attrs['time_dim']
+    models = mda.sel(name=model_name)
+    cat_keys = [x for x in models.dims]
+    for key in cat_keys:
+        if key.split('.')[-1] not in ['season', 'hour']:
+            raise ValueError('no way to find {} in historical data...'.format(key))
+    slopes = np.array([m.coef_[0] for m in models.values.ravel()])
+    intercepts = np.array([m.intercept_ for m in models.values.ravel()])
+    n = T[time_dim].size
+    # C order flat index of each timestamp in the categories array:
+    ind = np.zeros(n, dtype=int)
+    valid = np.ones(n, dtype=bool)
+    for key in cat_keys:
+        codes = pd.Index(models[key].values).get_indexer(T[key].values)
+        valid &= codes >= 0
+        ind = ind * models[key].size + np.where(codes >= 0, codes, 0)
+    coef = xr.DataArray(np.where(valid, slopes[ind], np.nan), dims=[time_dim])
+    coef[time_dim] = T[time_dim]
+    intercept = xr.DataArray(np.where(valid, intercepts[ind], np.nan),
+                             dims=[time_dim])
+    intercept[time_dim] = T[time_dim]
+    return kappa_ml(T, model={'coef': coef, 'intercept': intercept},
+                    slope_err=slope_err)
+
+
 def produce_IPW_field(geo_df, ims_path=ims_path, gps_path=garner_path,
                       savepath=None, lapse_rate=6.5, Tmul=0.72,
                       T_offset=70.2, k2=22.1, k3=3.776e5, station=None,
@@ -1637,7 +1715,10 @@ def kappa_ml(T, model=None, k2=22.1, k3=3.776e5, dk3=0.004e5, dk2=2.2,
             print(
                 'using linear model of Tm = {} * Ts + {}'.format(model['coef'], model['intercept']))
         Tm = (273.15 + T) * model['coef'] + model['intercept']
-        dTm = model['coef'] * dT
+        if slope_err is not None:
+            dTm = model['coef'] * dT + slope_err * Tm
+        else:
+            dTm = model['coef'] * dT
     elif isinstance(model, np.ndarray) and model.ndim == 2:
         print('using model arg as 2d np array with dims: [coef, intercept]')
         coef = model[0, :]
@@ -2189,6 +2270,50 @@ def ml_models_T_from_sounding(sound_path=sound_path, categories=None,
     return results
 
 
+def load_or_fit_ts_tm_models(sound_path=sound_path, categories=None,
+                             models=['LR', 'TSEN'], physical_file=None,
+                             times=['2005', '2019'], station=None,
+                             cache_path=None):
+    """ml_models_T_from_sounding with an on-disk cache of the fitted models
+    dataarray keyed by the sounding file(and its modification time), times,
+    categories and models so that repeated runs skip the sklearn fits.
+    cache_path defaults to sound_path."""
+    import hashlib
+    import pickle
+    from aux_gps import path_glob
+    if cache_path is None:
+        cache_path = sound_path
+    if isinstance(models, str):
+        models = [models]
+    if station is not None:
+        sound_file = path_glob(sound_path, 'station_{}_soundings_ts_tm_tpw*.nc'.format(station))[0]
+    elif physical_file is not None:
+        sound_file = Path(physical_file)
+    else:
+        sound_file = sound_path / 'bet_dagan_sounding_pw_Ts_Tk_with_clouds.nc'
+    if categories is not None and not isinstance(categories, list):
+        categories = [categories]
+    key = '|'.join([sound_file.resolve().as_posix(),
+                    str(sound_file.stat().st_mtime), str(times),
+                    str(categories), str(models)])
+    key = hashlib.md5(key.encode()).hexdigest()[:16]
+    cache_file = cache_path / 'ts_tm_models_{}.pkl'.format(key)
+    if cache_file.is_file():
+        print('loading cached Ts-Tm models from {}'.format(cache_file))
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    mda = ml_models_T_from_sounding(sound_path=sound_path,
+                                    categories=categories, models=models,
+                                    physical_file=physical_file, times=times,
+                                    station=station, plot=False)
+    tmp_file = cache_path / '{}.tmp'.format(cache_file.name)
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(mda, f)
+    tmp_file.replace(cache_file)
+    print('saved Ts-Tm models cache to {}'.format(cache_file))
+    return mda
+
+
 #def linear_T_from_sounding(sound_path=sound_path, categories=None):
 #    import xarray as xr
 #    ds = xr.open_dataset(sound_path / 'bet_dagan_sounding_pw_Ts_Tk_with_clouds.nc')
@@ -2771,59 +2896,138 @@ def classify_tide_events(gnss_path=work_yuval, hydro_path=hydro_path,
     return lr
 
 
+def read_tide_events_starts(hydro_path=hydro_path, hydro_stations=[60190],
+                            freq='1H'):
+    """return a dict of the tide events starts(resampled to freq) of each
+    hydro station"""
+    import xarray as xr
+    tides = xr.open_dataset(hydro_path / 'hydro_tides.nc')
+    tide_starts = {}
+    for hydro_station in hydro_stations:
+        tide = tides['TS_{}_max_flow'.format(hydro_station)]
+        tide = tide.dropna('tide_start')
+        tide = tide.resample(tide_start=freq).mean()
+        tide = tide.dropna('tide_start')
+        tide_starts[hydro_station] = tide.tide_start.values
+    return tide_starts
+
+
+def label_tide_events(start_date, tide_starts, leads):
+    """label each window start_date as True if the start date lead windows
+    later is a tide event start of the hydro stations in tide_starts(see
+    read_tide_events_starts), for all the leads(number of windows)"""
+    import xarray as xr
+    n = len(start_date)
+    y = np.zeros((n, len(tide_starts), len(leads)), dtype=bool)
+    for j, starts in enumerate(tide_starts.values()):
+        is_tide_start = np.isin(start_date, starts)
+        for k, lead in enumerate(leads):
+            y[:max(n - lead, 0), j, k] = is_tide_start[lead:]
+    y = xr.DataArray(y, dims=['start_date', 'hydro_station', 'lead'])
+    y['start_date'] = start_date
+    y['hydro_station'] = list(tide_starts.keys())
+    y['lead'] = leads
+    y.name = 'tide_events'
+    return y
+
+
 def GNSS_pw_to_X_using_window(gnss_path=work_yuval, hydro_path=hydro_path,
                               station='tela', window='1D', sample='hourly',
-                              hydro_station=60190):
+                              hydro_station=60190, lead=None, chunk=None):
     """assemble n window length gnss_pw data array with datetimes and
-    a boolean array of positive or negative tide events"""
+    a boolean array of positive or negative tide events lead windows later
+    (default is the window length). station, hydro_station and lead can
+    also be lists, then X and y of all the stations are concatenated along
+    start_date with a station coord and y gets hydro_station and lead dims.
+    if chunk is an int, returns a generator of (X, y) with up to chunk
+    windows each instead"""
     import xarray as xr
     from aux_gps import time_series_stack_with_window
-    # read PW and select station:
+    from aux_gps import time_series_window_index
+    stations = [station] if isinstance(station, str) else station
+    hydro_stations = np.atleast_1d(hydro_station).tolist()
+    # read PW:
     GNSS_pw = xr.open_dataset(gnss_path / 'GNSS_{}_PW.nc'.format(sample))
-    pw = GNSS_pw[station]
-    # create 1 day length data chunks from pw:
-    ds_X = time_series_stack_with_window(pw, window='1D')
-    # dropna:
-    ds_X = ds_X.dropna('start_date')
-    X = ds_X[station]
-    # read tides and select station:
-    tides = xr.open_dataset(hydro_path / 'hydro_tides.nc')
-    # select station:
-    tide = tides['TS_{}_max_flow'.format(hydro_station)]
-    # dropna:
-    tide = tide.dropna('tide_start')
-    # resample to ds_X time:
-    tide = tide.resample(tide_start=ds_X.attrs['freq']).mean()
-    tide = tide.dropna('tide_start')
-    # now build y:
-    y = np.empty(X.values.shape[0], dtype=bool)
-    start_date = X.start_date.values
-    points = X.points.size
-    tide_start = tide.tide_start.values
-    for i in range(len(start_date) - points):
-        st = start_date[i + points]
-        if st in tide_start:
-            y[i] = True
-        else:
-            y[i] = False
-    y = xr.DataArray(y, dims=['start_date'])
-    y['start_date'] = start_date
-    y.name = 'tide_events'
+    tide_starts = None
+    pws = []
+    ys = []
+    for st in stations:
+        pw = GNSS_pw[st].load()
+        # the windows starts without NaNs:
+        points, freq, inds = time_series_window_index(pw, window=window,
+                                                      dropna=True)
+        if tide_starts is None:
+            tide_starts = read_tide_events_starts(hydro_path, hydro_stations,
+                                                  freq)
+        leads = [points] if lead is None else np.atleast_1d(lead).tolist()
+        y = label_tide_events(pw['time'].values[inds], tide_starts, leads)
+        if np.ndim(hydro_station) == 0:
+            y = y.isel(hydro_station=0, drop=True)
+        if lead is None or np.ndim(lead) == 0:
+            y = y.isel(lead=0, drop=True)
+        if not isinstance(station, str):
+            y.coords['station'] = ('start_date', [st] * y['start_date'].size)
+        pws.append(pw)
+        ys.append(y)
+
+    def station_chunks(pw, y):
+        # create window length data chunks from pw:
+        ds_chunks = time_series_stack_with_window(pw, window=window,
+                                                  dropna=True, chunk=chunk)
+        for i, ds_X in zip(range(0, y['start_date'].size, chunk), ds_chunks):
+            y_chunk = y.isel(start_date=slice(i, i + chunk))
+            X = ds_X[pw.name]
+            if 'station' in y.coords:
+                X = X.rename(None)
+                X.coords['station'] = y_chunk['station']
+            yield X, y_chunk
+
+    if chunk is not None:
+        return (Xy for pw, y in zip(pws, ys) for Xy in station_chunks(pw, y))
+    Xs = []
+    for pw, y in zip(pws, ys):
+        X = time_series_stack_with_window(pw, window=window, dropna=True)[pw.name]
+        if 'station' in y.coords:
+            X = X.rename(None)
+            X.coords['station'] = y['station']
+        Xs.append(X)
+    if isinstance(station, str):
+        return Xs[0], ys[0]
+    X = xr.concat(Xs, 'start_date')
+    X.name = 'pw'
+    y = xr.concat(ys, 'start_date')
     return X, y
 
 
 def produce_all_GNSS_PW_anomalies(load_path=work_yuval, thresh=None,
                                   grp1='hour', grp2='dayofyear',
                                   savepath=work_yuval):
+    """compute the grp1 and grp2 anomalies of all the GNSS stations at once
+    on a stations x time array"""
     import xarray as xr
+    import pandas as pd
+    import numpy as np
+    from aux_gps import time_series_group_codes
+    from aux_gps import remove_group_means
     GNSS_pw = xr.open_dataset(load_path / 'GNSS_PW_{:.0f}.nc'.format(thresh))
-    anom_list = []
     stations_only = [x for x in GNSS_pw.data_vars if '_error' not in x]
-    for station in stations_only:
-        pw = GNSS_pw[station]
-        pw_anom = produce_PW_anomalies(pw, grp1, grp2, False)
-        anom_list.append(pw_anom)
-    GNSS_pw_anom = xr.merge(anom_list)
+    pw = GNSS_pw[stations_only].to_array('station')
+    time_dim = [x for x in pw.dims if x != 'station'][0]
+    freq = pd.infer_freq(pw[time_dim].values)
+    print('computing anomalies for {} stations'.format(len(stations_only)))
+    codes, grps1, grps2 = time_series_group_codes(pw[time_dim].values, grp1,
+                                                  grp2)
+    anoms = remove_group_means(pw.values, codes, len(grps1) * len(grps2))
+    GNSS_pw_anom = xr.Dataset(coords={time_dim: pw[time_dim].values})
+    for station, anom in zip(stations_only, anoms):
+        GNSS_pw_anom[station] = (time_dim, anom)
+        GNSS_pw_anom[station].attrs = dict(GNSS_pw[station].attrs)
+        GNSS_pw_anom[station].attrs['freq'] = freq
+        GNSS_pw_anom[station].attrs['description'] = 'anomalies are computed from {} and {} groupings'.format(grp1, grp2)
+    # keep the span of all the stations on a regular time axis:
+    valid_times = pw[time_dim].values[np.isfinite(anoms).any(axis=0)]
+    new_time = pd.date_range(valid_times.min(), valid_times.max(), freq=freq)
+    GNSS_pw_anom = GNSS_pw_anom.reindex({time_dim: new_time})
     if savepath is not None:
         filename = 'GNSS_PW_anom_{:.0f}_{}_{}.nc'.format(thresh, grp1, grp2)
         comp = dict(zlib=True, complevel=9)  # best compression
@@ -2834,32 +3038,27 @@ def produce_all_GNSS_PW_anomalies(load_path=work_yuval, thresh=None,
 
 
 def produce_PW_anomalies(pw_da, grp1='hour', grp2='dayofyear', plot=True):
-    from aux_gps import time_series_stack
     import xarray as xr
-    from aux_gps import get_unique_index
+    import pandas as pd
+    from aux_gps import time_series_group_codes
+    from aux_gps import remove_group_means
     from aux_gps import xr_reindex_with_date_range
     from scipy import stats
     import matplotlib.pyplot as plt
     time_dim = list(set(pw_da.dims))[0]
     fname = pw_da.name
     print('computing anomalies for {}'.format(fname))
-    stacked_pw = time_series_stack(pw_da, time_dim=time_dim, grp1=grp1,
-                                   grp2=grp2, plot=False)
-    pw_anom = stacked_pw.copy(deep=True)
-    attrs = pw_anom.attrs
-    rest_dim = [x for x in stacked_pw.dims if x != grp1 and x != grp2][0]
-    # compute mean on rest dim and remove it from stacked_da:
-    rest_mean = stacked_pw[fname].mean(rest_dim)
-    for rest in stacked_pw[rest_dim].values:
-        pw_anom[fname].loc[{rest_dim: rest}] -= rest_mean
-    # now, flatten anomalies to restore the time-series structure:
-    vals = pw_anom[fname].values.ravel()
-    times = pw_anom[time_dim].values.ravel()
+    freq = pd.infer_freq(pw_da[time_dim].values)
+    attrs = pw_da.attrs.copy()
+    attrs['freq'] = freq
+    pw = pw_da.dropna(time_dim)
+    # subtract the mean of each (grp1, grp2) group in place:
+    codes, grps1, grps2 = time_series_group_codes(pw[time_dim].values, grp1,
+                                                  grp2)
+    vals = remove_group_means(pw.values, codes, len(grps1) * len(grps2))
     pw_anom = xr.DataArray(vals, dims=[time_dim])
     pw_anom.attrs = attrs
-    pw_anom[time_dim] = times
-    pw_anom = get_unique_index(pw_anom)
-    pw_anom = pw_anom.sortby(time_dim)
+    pw_anom[time_dim] = pw[time_dim].values
     pw_anom = xr_reindex_with_date_range(pw_anom, freq=pw_anom.attrs['freq'])
     pw_anom.name = fname
     pw_anom.attrs['description'] = 'anomalies are computed from {} and {} groupings'.format(grp1, grp2)
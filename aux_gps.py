@@ -229,39 +229,64 @@ def gantt_chart(ds, fw='bold', ax=None,
     return ax
 
 
-def time_series_stack_with_window(ts_da, time_dim='time',
-                                  window='1D'):
-    """make it faster, much faster using isel and then cocant to dataset
-    save also the datetimes"""
+def time_series_window_index(ts_da, time_dim='time', window='1D',
+                             dropna=False):
+    """return the number of points in window, the freq of ts_da and the
+    indices of the windows starts(all but the last window), if dropna, only
+    the windows without NaNs are kept"""
     import pandas as pd
-    import xarray as xr
-    
+    import numpy as np
     window_dt = pd.Timedelta(window)
     freq = pd.infer_freq(ts_da[time_dim].values)
     if not any(i.isdigit() for i in freq):
         freq = '1' + freq
     freq_td = pd.Timedelta(freq)
     window_points = int(window_dt / freq_td)
-    inds = []
     end_index = ts_da[time_dim].size - window_points
-    index_to_run_over = range(0, end_index)
-    for i in range(end_index):
-        inds.append([i, i + window_points])
-    arr_list = []
-    arr_time_list = []
-    ts_arr = ts_da.values
-    ts_time_arr = ts_da[time_dim].values
-    for ind in inds:
-        arr_list.append(ts_arr[ind[0]: ind[1]])
-        arr_time_list.append(ts_time_arr[ind[0]: ind[1]])
-    ds = xr.Dataset()
-    ds[ts_da.name] = xr.DataArray(arr_list, dims=['start_date', 'points'])
-    ds[ts_da.name].attrs = ts_da.attrs
-    ds[time_dim] = xr.DataArray(arr_time_list, dims=['start_date', 'points'])
-    ds['start_date'] = ts_da.isel({time_dim: index_to_run_over})[time_dim].values
-    ds['points'] = range(window_points)
-    ds.attrs['freq'] = freq
-    return ds
+    if not dropna:
+        return window_points, freq, np.arange(end_index)
+    # count the NaNs in each window with a cumulative sum:
+    nans = np.concatenate([[0], np.cumsum(np.isnan(ts_da.values))])
+    nans_in_window = nans[window_points:window_points + end_index] - nans[:end_index]
+    return window_points, freq, np.flatnonzero(nans_in_window == 0)
+
+
+def time_series_stack_with_window(ts_da, time_dim='time', window='1D',
+                                  dropna=False, chunk=None):
+    """stack ts_da into windows that start at each datetime and save also
+    the datetimes. the windows are strided views of the values and datetimes
+    so nothing is copied unless dropna drops the windows with NaNs.
+    if chunk is an int, a generator of datasets with up to chunk windows is
+    returned instead of materializing the full windowed array"""
+    import xarray as xr
+    from numpy.lib.stride_tricks import sliding_window_view
+    window_points, freq, inds = time_series_window_index(ts_da, time_dim,
+                                                         window, dropna)
+    ts_arr = sliding_window_view(ts_da.values, window_points)
+    ts_time_arr = sliding_window_view(ts_da[time_dim].values, window_points)
+
+    def windows_to_ds(sl):
+        ds = xr.Dataset()
+        ds[ts_da.name] = xr.DataArray(ts_arr[sl], dims=['start_date', 'points'])
+        ds[ts_da.name].attrs = ts_da.attrs
+        ds[time_dim] = xr.DataArray(ts_time_arr[sl], dims=['start_date', 'points'])
+        ds['start_date'] = ts_time_arr[sl, 0]
+        ds['points'] = range(window_points)
+        ds.attrs['freq'] = freq
+        return ds
+
+    def chunk_slices():
+        for i in range(0, len(inds), chunk):
+            if dropna:
+                yield inds[i: i + chunk]
+            else:
+                yield slice(i, min(i + chunk, len(inds)))
+
+    if chunk is not None:
+        return (windows_to_ds(sl) for sl in chunk_slices())
+    if dropna:
+        return windows_to_ds(inds)
+    return windows_to_ds(slice(0, len(inds)))
 
 
 def normalize_xr(data, time_dim='time', norm=1, down_bound=-1.,
@@ -789,6 +814,34 @@ def flip_xy_axes(ax, ylim=None):
     return ax
 
 
+def time_series_group_codes(times, grp1='hour', grp2='month'):
+    """return the combined integer group code of each datetime in times
+    (grp1 major, grp2 minor) and the sorted grp1 and grp2 keys"""
+    import xarray as xr
+    import numpy as np
+    dt = xr.DataArray(np.asarray(times), dims=['time']).dt
+    grps1, codes1 = np.unique(getattr(dt, grp1).values, return_inverse=True)
+    grps2, codes2 = np.unique(getattr(dt, grp2).values, return_inverse=True)
+    codes = codes1.ravel() * len(grps2) + codes2.ravel()
+    return codes, grps1, grps2
+
+
+def remove_group_means(values, codes, ngroups):
+    """subtract the nan-mean of each group from values, codes are the group
+    codes along the last axis of values(1D time-series or 2D, e.g.,
+    stations x time) and ngroups is the total number of groups"""
+    import numpy as np
+    vals = np.atleast_2d(values)
+    rows = np.arange(vals.shape[0])[:, None] * ngroups + codes[None, :]
+    valid = ~np.isnan(vals)
+    size = vals.shape[0] * ngroups
+    sums = np.bincount(rows[valid], weights=vals[valid], minlength=size)
+    counts = np.bincount(rows[valid], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return (vals - means[rows]).reshape(np.shape(values))
+
+
 def time_series_stack(time_da, time_dim='time', grp1='hour', grp2='month',
                       plot=True):
     """Takes a time-series xr.DataArray objects and reshapes it using
@@ -796,6 +849,7 @@ def time_series_stack(time_da, time_dim='time', grp1='hour', grp2='month',
     , its datetime-series and the grps. plots the mean also"""
     import xarray as xr
     import pandas as pd
+    import numpy as np
     # try to infer the freq and put it into attrs for later reconstruction:
     freq = pd.infer_freq(time_da[time_dim].values)
     name = time_da.name
@@ -803,35 +857,26 @@ def time_series_stack(time_da, time_dim='time', grp1='hour', grp2='month',
     attrs = time_da.attrs
     # drop all NaNs:
     time_da = time_da.dropna(time_dim)
-    # first grouping:
-    grp_obj1 = time_da.groupby(time_dim + '.' + grp1)
-    da_list = []
-    t_list = []
-    for grp1_name, grp1_inds in grp_obj1.groups.items():
-        da = time_da.isel({time_dim: grp1_inds})
-        # second grouping:
-        grp_obj2 = da.groupby(time_dim + '.' + grp2)
-        for grp2_name, grp2_inds in grp_obj2.groups.items():
-            da2 = da.isel({time_dim: grp2_inds})
-            # extract datetimes and rewrite time coord to 'rest':
-            times = da2[time_dim]
-            times = times.rename({time_dim: 'rest'})
-            times.coords['rest'] = range(len(times))
-            t_list.append(times)
-            da2 = da2.rename({time_dim: 'rest'})
-            da2.coords['rest'] = range(len(da2))
-            da_list.append(da2)
-    # get group keys:
-    grps1 = [x for x in grp_obj1.groups.keys()]
-    grps2 = [x for x in grp_obj2.groups.keys()]
-    # concat and convert to dataset:
-    stacked_ds = xr.concat(da_list, dim='all').to_dataset(name=name)
-    stacked_ds[time_dim] = xr.concat(t_list, 'all')
-    # create a multiindex for the groups:
-    mindex = pd.MultiIndex.from_product([grps1, grps2], names=[grp1, grp2])
-    stacked_ds.coords['all'] = mindex
-    # unstack:
-    ds = stacked_ds.unstack('all')
+    times = time_da[time_dim].values
+    codes, grps1, grps2 = time_series_group_codes(times, grp1, grp2)
+    # the position of each datetime inside its group ('rest'):
+    counts = np.bincount(codes, minlength=len(grps1) * len(grps2))
+    order = np.argsort(codes, kind='stable')
+    starts = np.cumsum(counts) - counts
+    rest = np.empty(len(codes), dtype=int)
+    rest[order] = np.arange(len(codes)) - starts[codes[order]]
+    shape = (counts.max(), len(grps1), len(grps2))
+    vals = np.full(shape, np.nan,
+                   dtype=np.result_type(time_da.dtype, np.float32))
+    t = np.full(shape, np.datetime64('NaT'), dtype=times.dtype)
+    ind = (rest, codes // len(grps2), codes % len(grps2))
+    vals[ind] = time_da.values
+    t[ind] = times
+    dims = ['rest', grp1, grp2]
+    ds = xr.Dataset({name: (dims, vals), time_dim: (dims, t)},
+                    coords={'rest': np.arange(shape[0]), grp1: grps1,
+                            grp2: grps2})
+    ds[name].attrs = attrs
     ds.attrs = attrs
     if plot:
         plot_stacked_time_series(ds[name].mean('rest', keep_attrs=True))
@@ -1202,6 +1247,8 @@ def filter_nan_errors(ds, error_str='_error', dim='time', meta='action'):
             ds[field + error_str])).dropna(dim)
         if meta in ds[field].attrs:
             append = True
+        else:
+            append = False
         add_attr_to_xr(
             ds[field],
             meta,
@@ -6,6 +6,8 @@ Created on Fri Oct 18 15:21:21 2019
 @author: shlomi
 """
 # TODO: add backup option depending on task. use tarfile to compress
+# NOTE: to chain drdump -> edit30hr -> run -> post for several stations
+# without nohup scripts use gipsyx_scheduler.py
 
 def check_python_version(min_major=3, min_minor=6):
     import sys
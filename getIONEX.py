@@ -13,6 +13,7 @@ import datetime
 import scipy.ndimage.filters as myfilter
 import logging
 import os
+import re
 import ftplib
 import socket
 
@@ -89,9 +90,147 @@ def _read_ionex_header(filep):
     return exponent, lonarray, latarray, timearray, dcb_list, station_dcb_list
 
 
+_MARKER_RE = re.compile(rb"START OF (?:TEC|RMS) MAP|END OF (?:TEC|RMS) MAP"
+                        rb"|LAT/LON1/LON2/DLON/H")
+
+
+def _decode_i5_fields(chars):
+    """helper function to decode a (n, 5) array of fixed width (I5) integer
+    fields (ascii codes), returns None if any of them is not a valid I5"""
+    chars = np.ascontiguousarray(chars.T)
+    digits = chars - np.uint8(ord("0"))
+    is_digit = digits < 10
+    is_space = chars == ord(" ")
+    is_minus = chars == ord("-")
+    # right justified: only spaces before a sign and the digits
+    valid = np.all(is_digit | is_space | is_minus, axis=0) & is_digit[-1]
+    values = np.where(is_digit[0], digits[0], 0).astype(np.int64)
+    for i in range(1, chars.shape[0]):
+        valid &= is_space[i - 1] | is_digit[i]
+        values = values * 10 + np.where(is_digit[i], digits[i], 0)
+    if not valid.all():
+        return None
+    values[is_minus.any(axis=0)] *= -1
+    return values.astype(float)
+
+
+def _parse_ionex_maps(body, latarray, lonarray, exponent, shape):
+    """helper function to decode all TEC and RMS maps of an IONEX body at
+    once.
+
+    Args:
+        body (bytes) : the IONEX file content after the header
+        latarray (np.array) : lattitudes of the maps
+        lonarray (np.array) : longitudes of the maps
+        exponent (float) : multiplication factor of the data
+        shape (tuple) : the (time, lat, lon) shape of the maps
+
+    Returns:
+        Tuple[np.array, np.array]: 3D-arrays (time,lat,lon) of TEC and RMS
+    """
+    tecarray = np.zeros(shape, dtype=float)
+    rmsarray = np.zeros_like(tecarray)
+    body = body.replace(b"\r", b"")
+    # find the map boundaries and the latitude bands in one scan:
+    markers = list(_MARKER_RE.finditer(body))
+    if not markers:
+        return tecarray, rmsarray
+    pos = np.array([marker.start() for marker in markers])
+    buf = np.frombuffer(body, dtype=np.uint8)
+    # 0 - latitude band, 1 - start of TEC, 2 - start of RMS, 3 - end of map:
+    kind = np.where(buf[pos] == ord("L"), 0, 3)
+    is_start = buf[pos] == ord("S")
+    kind[is_start] = np.where(buf[pos[is_start] + 9] == ord("T"), 1, 2)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    line_starts = np.concatenate([[0], newlines + 1])
+    line_start = line_starts[np.searchsorted(newlines, pos)]
+    # the map(and its number) each marker belongs to:
+    last_map_marker = np.maximum.accumulate(np.where(kind > 0,
+                                                     np.arange(kind.size), 0))
+    map_kind = kind[last_map_marker]
+    mapnr = np.zeros(kind.size, dtype=int)
+    for i in np.flatnonzero((kind == 1) | (kind == 2)):
+        mapnr[i] = int(body[line_start[i]:pos[i]].split()[0])
+    is_band = (kind == 0) & ((map_kind == 1) | (map_kind == 2))
+    bands = np.flatnonzero(is_band)
+    if bands.size == 0:
+        return tecarray, rmsarray
+    timeidx = mapnr[last_map_marker[bands]] - 1
+    is_tec = map_kind[bands] == 1
+    lats = np.array([float(body[start:end].decode().replace("-", " -").split()[0])
+                     for start, end in zip(line_start[bands], pos[bands])])
+    latidx = np.argmin(np.abs(latarray[np.newaxis] - lats[:, np.newaxis]),
+                       axis=1)
+    # the data of a band is between its header and the next marker's line:
+    nl_after = np.searchsorted(newlines, pos[bands])
+    band_start = np.append(newlines, buf.size - 1)[nl_after] + 1
+    band_end = np.append(line_start, buf.size)[bands + 1]
+    band_newlines = np.searchsorted(newlines, band_end) - nl_after - 1
+    band_chars = band_end - band_start - band_newlines
+    data = None
+    if np.all(band_chars == 5 * lonarray.shape[0]):
+        # decode the fixed width integers of all the maps in one call:
+        in_band = np.zeros(buf.size + 1, dtype=np.int8)
+        in_band[band_start] = 1
+        in_band[band_end] -= 1
+        in_band = np.cumsum(in_band[:-1], dtype=np.int8).astype(bool)
+        chars = buf[in_band & (buf != ord("\n"))].reshape(-1, 5)
+        data = _decode_i5_fields(chars)
+    if data is not None:
+        data = data.reshape(bands.size, lonarray.shape[0]) * exponent
+        tecarray[timeidx[is_tec], latidx[is_tec]] = data[is_tec]
+        rmsarray[timeidx[~is_tec], latidx[~is_tec]] = data[~is_tec]
+        return tecarray, rmsarray
+    # not strictly I5 bands, decode the white space separated values:
+    logging.debug("irregular IONEX bands, decoding them one at a time")
+    for tidx, tec, lidx, start, end in zip(timeidx, is_tec, latidx,
+                                           band_start, band_end):
+        data = np.fromstring(body[start:end].decode().replace("-", " -"),
+                             sep=" ") * exponent
+        if tec:
+            tecarray[tidx, lidx, :data.shape[0]] = data
+        else:
+            rmsarray[tidx, lidx, :data.shape[0]] = data
+    return tecarray, rmsarray
+
+
 def read_tec(filename, _use_filter=None):
     """ returns TEC, RMS longitude, lattitude and time read from an IONEX file.
 
+    Args:
+        filename (string) : the full path to the IONEXfile
+        _use_filter (float) : optional filter the data in space and time
+                             with a gaussian filter with sigma use_filter.
+                             calls scipy.ndimage.filter.gaussian_filter(tec,
+                             use_filter)
+
+    Returns:
+        Tuple[np.array, np.array, np.array, np.array, np.array]:
+            3D-arrays (time,lat,lon) of (optionally filtered) TEC and RMS +
+            longitude, latitude and time array
+    """
+    with open(filename, "r") as ionex_file:
+        exponent, lonarray, latarray, timearray, dcb_list, station_dcb_list = _read_ionex_header(ionex_file)
+    with open(filename, "rb") as ionex_file:
+        body = ionex_file.read().split(b"END OF HEADER", 1)[-1]
+    logging.info("reading data with shapes %d  x %d x %d",
+                 timearray.shape[0],
+                 latarray.shape[0],
+                 lonarray.shape[0])
+    body = body[body.find(b"\n") + 1:]
+    tecarray, rmsarray = _parse_ionex_maps(body, latarray, lonarray, exponent,
+                                           timearray.shape + latarray.shape
+                                           + lonarray.shape)
+    if not _use_filter is None:
+        tecarray = myfilter.gaussian_filter(
+            tecarray, _use_filter, mode='nearest')
+    return tecarray, rmsarray, lonarray, latarray, timearray, dcb_list, station_dcb_list
+
+
+def _read_tec_by_lines(filename, _use_filter=None):
+    """line by line IONEX reader, kept as a reference for read_tec(see
+    benchmark_read_tec).
+
     Args:
         filename (string) : the full path to the IONEXfile
         _use_filter (float) : optional filter the data in space and time
@@ -157,6 +296,81 @@ def read_tec(filename, _use_filter=None):
     return tecarray, rmsarray, lonarray, latarray, timearray, dcb_list, station_dcb_list
 
 
+def _write_synthetic_ionex(filename, day, seed=None):
+    """helper function to write a synthetic 2-hourly global IONEX file of day
+    (datetime.date) with random TEC and RMS maps, used for benchmarking"""
+    rng = np.random.default_rng(seed)
+    lats = np.arange(87.5, -87.5 - 1.25, -2.5)
+    lons = np.arange(-180., 180. + 2.5, 5.)
+    epochs = [datetime.datetime(day.year, day.month, day.day)
+              + datetime.timedelta(hours=h) for h in range(0, 25, 2)]
+
+    def epoch_line(epoch, label):
+        return "{:6d}{:6d}{:6d}{:6d}{:6d}{:6d}".format(
+            epoch.year, epoch.month, epoch.day, epoch.hour, epoch.minute,
+            epoch.second).ljust(60) + label + "\n"
+
+    lines = ["     1.0            IONOSPHERE MAPS     GPS".ljust(60)
+             + "IONEX VERSION / TYPE\n",
+             epoch_line(epochs[0], "EPOCH OF FIRST MAP"),
+             epoch_line(epochs[-1], "EPOCH OF LAST MAP"),
+             "{:6d}".format(7200).ljust(60) + "INTERVAL\n",
+             "{:6d}".format(len(epochs)).ljust(60) + "# OF MAPS IN FILE\n",
+             "  87.5 -87.5  -2.5".rjust(26).ljust(60) + "LAT1 / LAT2 / DLAT\n",
+             "-180.0 180.0   5.0".rjust(26).ljust(60) + "LON1 / LON2 / DLON\n",
+             "{:6d}".format(-1).ljust(60) + "EXPONENT\n",
+             "".ljust(60) + "END OF HEADER\n"]
+    for kind in ["TEC", "RMS"]:
+        for i, epoch in enumerate(epochs):
+            lines.append("{:6d}".format(i + 1).ljust(60)
+                         + "START OF {} MAP\n".format(kind))
+            lines.append(epoch_line(epoch, "EPOCH OF CURRENT MAP"))
+            for lat in lats:
+                lines.append("{:8.1f}{:6.1f}{:6.1f}{:6.1f}{:6.1f}".format(
+                    lat, lons[0], lons[-1], 5.0, 450.0).ljust(60)
+                    + "LAT/LON1/LON2/DLON/H\n")
+                values = rng.integers(-50, 1000, lons.shape[0])
+                values[rng.random(lons.shape[0]) < 0.01] = 9999
+                for j in range(0, values.shape[0], 16):
+                    lines.append("".join("{:5d}".format(v)
+                                         for v in values[j:j + 16]) + "\n")
+            lines.append("{:6d}".format(i + 1).ljust(60)
+                         + "END OF {} MAP\n".format(kind))
+    lines.append("".ljust(60) + "END OF FILE\n")
+    with open(filename, "w") as ionex_file:
+        ionex_file.writelines(lines)
+    return filename
+
+
+def benchmark_read_tec(days=365, outpath=None, seed=42):
+    """compare read_tec against the line by line IONEX reader on a synthetic
+    set of days daily IONEX files, the outputs must be identical"""
+    import tempfile
+    import time
+    tmpdir = None
+    if outpath is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        outpath = tmpdir.name
+    start = datetime.date(2019, 1, 1)
+    filenames = [_write_synthetic_ionex(
+        os.path.join(outpath, "SYNG{:03d}0.19I".format(i + 1)),
+        start + datetime.timedelta(days=i), seed + i) for i in range(days)]
+    t0 = time.time()
+    ref = [_read_tec_by_lines(filename)[:2] for filename in filenames]
+    t_lines = time.time() - t0
+    t0 = time.time()
+    new = [read_tec(filename)[:2] for filename in filenames]
+    t_maps = time.time() - t0
+    for (tec_ref, rms_ref), (tec, rms) in zip(ref, new):
+        assert np.array_equal(tec_ref, tec) and np.array_equal(rms_ref, rms)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    print("line by line reader: {:.3f} secs".format(t_lines))
+    print("vectorized reader: {:.3f} secs".format(t_maps))
+    print("speed up: {:.1f}x".format(t_lines / t_maps))
+    return t_lines, t_maps
+
+
 def readTEC(filename, use_filter=None):
     """oldfunction name for compatibility. Use read_tec."""
 
@@ -197,11 +411,37 @@ def _compute_index_and_weights(maparray, mapvalues):
     return idx1, idx2, weights
 
 
+def _compute_regular_index_and_weights(maparray, mapvalues):
+    '''helper function to get indices and weights for interpolating tecmaps
+    arithmetically from the regular spacing of maparray
+
+
+    Args:
+        maparray (np.array) : regular array to get indices in
+        mapvalues (np.array) :  values to get indices for
+    Returns:
+        Tuple[np.array, np.array, np.array]: idx1,idx2 and weights for idx2,
+                                             idx2 = idx1 + 1
+
+    '''
+    if maparray.shape[0] < 2:
+        idx = np.zeros(mapvalues.shape, dtype=int)
+        return idx, idx, np.zeros(mapvalues.shape)
+    pos = (mapvalues - maparray[0]) / (maparray[1] - maparray[0])
+    # values outside of the map are taken from its edges:
+    idx1 = np.clip(np.floor(np.nan_to_num(pos)).astype(int), 0,
+                   maparray.shape[0] - 2)
+    weights = np.clip(pos - idx1, 0., 1.)
+    return idx1, idx1 + 1, weights
+
+
 def compute_tec_interpol(times, lats, lons, tecinfo, apply_earth_rotation=0):
     '''Get interpolated TEC for array of times/lats and lons
 
     Derive interpolated (4 point in lon,lat,2 point in time) vTEC values,
-    optionally correcting for earth rotation.
+    optionally correcting for earth rotation. All the points (e.g. all the
+    pierce points of all satellites of a day) are interpolated at once, the
+    grid indices are computed from the regular spacing of the IONEX maps.
 
     Args:
         lats (np.array) : angles in degrees between -90 and 90
@@ -220,25 +460,29 @@ def compute_tec_interpol(times, lats, lons, tecinfo, apply_earth_rotation=0):
         parameter would result in an ionosphere that moves with the rotation
         of the earth
     Returns:
-        np.array : interpolated tecvalues
+        np.array : interpolated tecvalues with the broadcasted shape of
+                   times, lats and lons
     '''
-    assert times.shape == lats.shape,\
-        "times and lats should be array with same shape"
-    assert times.shape == lons.shape, \
-        "times and lons should be array with same shape"
+    times, lats, lons = np.broadcast_arrays(np.asarray(times, dtype=float),
+                                            np.asarray(lats, dtype=float),
+                                            np.asarray(lons, dtype=float))
+    shape = times.shape
+    times = times.ravel()
+    lats = lats.ravel()
+    lons = lons.ravel()
     tecdata = tecinfo[0]  # TEC in TECU
     lonarray = tecinfo[2]  # longitude in degrees from West to East (- to +)
     latarray = tecinfo[3]  # lattitude in degrees
     # times in hour of the day (eg. 23.5 for half past 11PM)
     maptimes = tecinfo[4]
 
-    # get indices of nearest 2 time frames + inverse distance weights
+    # get indices of the 2 time frames around times + inverse distance weights
     # assume time is  sorted from early to late
-    timeidx1, timeidx2, time_weights = _compute_index_and_weights(
+    timeidx1, timeidx2, time_weights = _compute_regular_index_and_weights(
         maptimes, times)
 
-    # latarray is sorted small to large
-    latidx1, latidx2, lat_weights = _compute_index_and_weights(
+    # latarray is regular (small to large or large to small)
+    latidx1, latidx2, lat_weights = _compute_regular_index_and_weights(
         latarray, lats)
 
     # for getting lon idx take into account earth_rotation
@@ -252,58 +496,35 @@ def compute_tec_interpol(times, lats, lons, tecinfo, apply_earth_rotation=0):
     rot2 = ((times - maptimes[timeidx2]) * 360. / 24.) * apply_earth_rotation
 
     if not full_circle:
-        lonidx11, lonidx12, lon_weights1 = _compute_index_and_weights(
+        lonidx11, lonidx12, lon_weights1 = _compute_regular_index_and_weights(
             lonarray, lons + rot1)
-        lonidx21, lonidx22, lon_weights2 = _compute_index_and_weights(
+        lonidx21, lonidx22, lon_weights2 = _compute_regular_index_and_weights(
             lonarray, lons + rot2)
     else:
-        lonidx11 = np.argmin(np.absolute(np.remainder(lonarray[np.newaxis]
-                                                      - rot1[:, np.newaxis]
-                                                      - lons[:, np.newaxis]
-                                                      + 180., 360.)
-                                         - 180.), axis=1)
-        lonidx12 = lonidx11.copy()
-        lonidx11[np.remainder(lonarray[lonidx11] - rot1 - lons + 180., 360.)
-                 - 180. > 0] -= 1
-        lonidx12[np.remainder(lonarray[lonidx12] - rot1 - lons + 180., 360.)
-                 - 180. < 0] += 1
-        lonidx11[lonidx11 < 0] += lonarray.shape[0]
-        lonidx12[lonidx12 < 0] += lonarray.shape[0]
-        lonidx11[lonidx11 >= lonarray.shape[0]] -= lonarray.shape[0]
-        lonidx12[lonidx12 >= lonarray.shape[0]] -= lonarray.shape[0]
-        lon_weights1 = np.absolute(np.remainder(lonarray[lonidx11]
-                                                - rot1
-                                                - lons + 180., 360.)
-                                   - 180.) / lonstep
-
-        lonidx21 = np.argmin(np.absolute(np.remainder(lonarray[np.newaxis]
-                                                      - rot2[:, np.newaxis]
-                                                      - lons[:, np.newaxis]
-                                                      + 180., 360.)
-                                         - 180.), axis=1)
-        lonidx22 = lonidx21.copy()
-        lonidx21[np.remainder(lonarray[lonidx21] - rot2 - lons + 180., 360.)
-                 - 180. > 0] -= 1
-        lonidx22[np.remainder(lonarray[lonidx22] - rot2 - lons + 180., 360.)
-                 - 180. < 0] += 1
-        lonidx21[lonidx21 < 0] += lonarray.shape[0]
-        lonidx22[lonidx22 < 0] += lonarray.shape[0]
-        lonidx21[lonidx21 >= lonarray.shape[0]] -= lonarray.shape[0]
-        lonidx22[lonidx22 >= lonarray.shape[0]] -= lonarray.shape[0]
-        lon_weights2 = np.absolute(np.remainder(lonarray[lonidx21]
-                                                - rot2
-                                                - lons + 180., 360.)
-                                   - 180.) / lonstep
-    logging.debug("inidces time %d %d indices lat %d %d indices \
-                  lon %d %d %d %d", timeidx1[0], timeidx2[0],
-                  latidx1[0], latidx2[0],
-                  lonidx11[0], lonidx12[0],
-                  lonidx21[0], lonidx22[0])
-    logging.debug("weights time %f lat %f lon %f %f",
-                  time_weights[0],
-                  lat_weights[0],
-                  lon_weights1[0],
-                  lon_weights2[0])
+        # number of distinct longitudes around the circle:
+        nlon = int(round(360. / lonstep))
+        lonpos1 = np.remainder(lons + rot1 - lonarray[0], 360.) / lonstep
+        lonpos2 = np.remainder(lons + rot2 - lonarray[0], 360.) / lonstep
+        lonidx11 = np.floor(np.nan_to_num(lonpos1)).astype(int)
+        lonidx21 = np.floor(np.nan_to_num(lonpos2)).astype(int)
+        lon_weights1 = lonpos1 - lonidx11
+        lon_weights2 = lonpos2 - lonidx21
+        lonidx11 %= nlon
+        lonidx21 %= nlon
+        # the next longitude is the closing meridian, if it is in the map:
+        lonidx12 = (lonidx11 + 1) % lonarray.shape[0]
+        lonidx22 = (lonidx21 + 1) % lonarray.shape[0]
+    if times.shape[0] > 0:
+        logging.debug("inidces time %d %d indices lat %d %d indices \
+                      lon %d %d %d %d", timeidx1[0], timeidx2[0],
+                      latidx1[0], latidx2[0],
+                      lonidx11[0], lonidx12[0],
+                      lonidx21[0], lonidx22[0])
+        logging.debug("weights time %f lat %f lon %f %f",
+                      time_weights[0],
+                      lat_weights[0],
+                      lon_weights1[0],
+                      lon_weights2[0])
     tecs = (tecdata[timeidx1, latidx1, lonidx11] * (1. - lon_weights1)
             + tecdata[timeidx1, latidx1, lonidx12] * lon_weights1) \
         * (1. - time_weights)
@@ -319,7 +540,7 @@ def compute_tec_interpol(times, lats, lons, tecinfo, apply_earth_rotation=0):
         * (tecdata[timeidx2, latidx2, lonidx21] * (1. - lon_weights2)
            + tecdata[timeidx2, latidx2, lonidx22] * lon_weights2) \
         * (time_weights)
-    return tecs
+    return tecs.reshape(shape)
 
 
 def getTECinterpol(time, lat, lon, tecinfo, apply_earth_rotation=0):
@@ -41,7 +41,17 @@ def check_abs_int(num):
     try:
         num = abs(int(num))
     except ValueError:
-        print('{} needs to be a natural number (>0 and int)'.format(num))
+        raise argparse.ArgumentTypeError(
+            '{} needs to be a natural number (>0 and int)'.format(num))
+    return num
+
+
+def check_abs_float(num):
+    try:
+        num = abs(float(num))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            '{} needs to be a positive number'.format(num))
     return num
 
 
@@ -95,11 +105,100 @@ def plot_gipsy_field(ds, fields='WetZ', with_error=False):
 
 
 def save_all_resampled_versions_gipsyx(load_path, sample):
-    for key in sample.keys():
-        save_resampled_versions_gispyx_results(load_path, sample, key)
+    """resample the final gipsyx results nc file to all the rates in sample
+    in one pass: the hourly sums and counts are computed once and all the
+    coarser means are derived from them and saved"""
+    from aux_gps import path_glob
+    import xarray as xr
+    import logging
+    logger = logging.getLogger('gipsyx_post_proccesser')
+    path = path_glob(load_path, '*.nc')[0]
+    station = path.as_posix().split('/')[-1].split('_')[0]
+    glob = '{}_PPP*.nc'.format(station.upper())
+    try:
+        file = path_glob(load_path, glob_str=glob)[0]
+    except FileNotFoundError:
+        logger.warning(
+            'did not find {} in gipsyx_solutions dir, skipping...'.format(station))
+        return
+    filename = file.as_posix().split('/')[-1].split('.')[0]
+    years_str = filename.split('_')[-1]
+    ds = xr.load_dataset(file)
+    logger.info('resampaling {} to {}'.format(station,
+                                              ', '.join(sample.values())))
+    dsr_dict = resample_gipsyx_from_hourly_aggregates(ds, sample.keys())
+    comp = dict(zlib=True, complevel=9)  # best compression
+    for sample_rate, dsr in dsr_dict.items():
+        new_filename = '_'.join([station.upper(), sample[sample_rate], 'PPP',
+                                 years_str])
+        new_filename = new_filename + '.nc'
+        encoding = {var: comp for var in dsr.data_vars}
+        dsr.to_netcdf(load_path / new_filename, 'w', encoding=encoding)
+        logger.info('{} was saved to {}'.format(new_filename, load_path))
+    logger.info('Done resampling!')
     return
 
 
+def resample_gipsyx_from_hourly_aggregates(ds, sample_rates, time_dim='time'):
+    """resample ds to the mean of each rate in sample_rates (all multiples of
+    1H, e.g., '3H', 'D', 'W', 'MS'). the hourly sums and valid counts are
+    computed once and each rate is their summed ratio, which is the same as
+    the skipna mean of the raw values (also for the error fields)"""
+    df = ds.to_dataframe()
+    hsum = df.resample('1H').sum()
+    hcnt = df.resample('1H').count()
+    dsr_dict = {}
+    for sample_rate in sample_rates:
+        if sample_rate in ['1H', 'H']:
+            sums = hsum
+            cnts = hcnt
+        else:
+            sums = hsum.resample(sample_rate).sum()
+            cnts = hcnt.resample(sample_rate).sum()
+        dfr = sums / cnts.where(cnts > 0)
+        dfr.index.name = time_dim
+        dsr = dfr.to_xarray()
+        for da in dsr.data_vars:
+            dsr[da].attrs = ds[da].attrs
+        dsr.attrs = ds.attrs
+        dsr_dict[sample_rate] = dsr
+    return dsr_dict
+
+
+def benchmark_resampling(days=365, seed=42):
+    """compare the hourly aggregates resampler against resampling the 5 mins
+    dataset separately to each rate"""
+    import numpy as np
+    import pandas as pd
+    import xarray as xr
+    import time
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2019-01-01', periods=days * 288, freq='5min')
+    fields = ['WetZ', 'WetZ_error', 'GradNorth', 'GradEast', 'lat', 'alt']
+    ds = xr.Dataset()
+    for field in fields:
+        vals = rng.normal(size=index.size)
+        vals[rng.random(index.size) < 0.2] = np.nan
+        ds[field] = xr.DataArray(vals, dims=['time'], coords={'time': index})
+    sample_rates = ['1H', '3H', 'D', 'W', 'MS']
+    t0 = time.time()
+    ref = {}
+    for sample_rate in sample_rates:
+        ref[sample_rate] = ds.resample(time=sample_rate).mean(skipna=True)
+    t_loop = time.time() - t0
+    t0 = time.time()
+    dsr_dict = resample_gipsyx_from_hourly_aggregates(ds, sample_rates)
+    t_agg = time.time() - t0
+    for sample_rate in sample_rates:
+        for field in fields:
+            assert np.allclose(dsr_dict[sample_rate][field].values,
+                               ref[sample_rate][field].values, equal_nan=True)
+    print('per rate resampling: {:.3f} secs'.format(t_loop))
+    print('hourly aggregates: {:.3f} secs'.format(t_agg))
+    print('speed up: {:.1f}x'.format(t_loop / t_agg))
+    return t_loop, t_agg
+
+
 def save_resampled_versions_gispyx_results(load_path, sample,
                                            sample_rate='1H'):
     from aux_gps import path_glob
@@ -298,20 +397,13 @@ def post_procces_gipsyx_yearly_file(path_file, savepath=None, plot=False,
     year = path_file.as_posix().split('/')[-1].split('_')[-1].split('.')[0]
     logger.info('proccessing {} station in year: {}'.format(station, year))
     dss = xr.open_dataset(path_file)
-    da_fs = []
-    # attrs_list = []
-    vars_list = list(set([x.split('-')[0] for x in dss.data_vars.keys()]))
-    for field in vars_list:
-        try:
-            da_field = analyse_results_ds_one_station(dss, field, verbose=verbose)
-        except ValueError as e:
-            logger.warning('ValueError: {}, meaning only single 24hr day files in all {}'.format(e, year))
-            return None
-        da_year = replace_fields_in_ds(dss, da_field, field, verbose=verbose)
-        da_fs.append(da_year)
-        # attrs_list += [(x, y) for x, y in da_year.attrs.items()]
-    # attrs = list(set(attrs_list))
-    ds = xr.merge(da_fs)
+    if 'day' not in dss.dims:
+        dss = renamed_ds_to_ragged(dss)
+    try:
+        ds = stitch_all_fields_in_ragged_ds(dss, verbose=verbose)
+    except ValueError as e:
+        logger.warning('ValueError: {}, meaning only single 24hr day files in all {}'.format(e, year))
+        return None
     # convert attrs list after set to dict:
 #    vars_attr = {}
 #    for attr in attrs:
@@ -366,55 +458,105 @@ def post_procces_gipsyx_yearly_file(path_file, savepath=None, plot=False,
     return ds
 
 
+def ppps_to_ragged_ds(ppps, meta, station):
+    """ppps is a dict of rinex name : ppp dataframe (one day solution each).
+    return a dataset of all the days' samples along one 'sample' dim (a
+    contiguous ragged array), with a 'day' dim holding the rinex date and the
+    offset(day_start) and length(day_count) of each day in 'sample'"""
+    import numpy as np
+    import xarray as xr
+    from aux_gps import get_timedate_and_station_code_from_rinex
+    rfns = [x for x in ppps.keys()]
+    df_list = [x for x in ppps.values()]
+    days = [get_timedate_and_station_code_from_rinex(x, just_dt=True) for x
+            in rfns]
+    counts = np.array([len(x) for x in df_list], dtype='int64')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype('int64')
+    ds = xr.Dataset()
+    for col in df_list[0].columns:
+        ds[col] = ('sample', np.concatenate([x[col].values for x in df_list]))
+    ds.coords['time'] = ('sample', np.concatenate([x.index.values for x in
+                                                   df_list]))
+    ds.coords['day'] = ('day', np.array(days, dtype='datetime64[ns]'))
+    ds.coords['day_start'] = ('day', starts)
+    ds.coords['day_count'] = ('day', counts)
+    ds['day_count'].attrs['sample_dimension'] = 'sample'
+    ds['day_start'].attrs['long_name'] = 'offset of the first sample of each day'
+    ds.attrs['station'] = station
+    for key, val in meta['units'].items():
+        ds.attrs[key + '>units'] = val
+    for key, val in meta['desc'].items():
+        ds.attrs[key + '>desc'] = val
+    return ds
+
+
+def renamed_ds_to_ragged(dss):
+    """convert the old raw layout (WetZ-0, time-0, WetZ-1, time-1 ...) to the
+    ragged layout of ppps_to_ragged_ds"""
+    import numpy as np
+    import pandas as pd
+    import xarray as xr
+    fields = sorted(list(set([x.split('-')[0] for x in dss.data_vars])))
+    nums = sorted(list(set([int(x.split('-')[1]) for x in dss.data_vars])))
+    times = [dss['time-{}'.format(i)].values for i in nums]
+    counts = np.array([len(x) for x in times], dtype='int64')
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype('int64')
+    days = [(pd.Timestamp(x[0]) + (pd.Timestamp(x[-1]) -
+                                   pd.Timestamp(x[0])) / 2).floor('D')
+            for x in times]
+    ds = xr.Dataset()
+    for field in fields:
+        ds[field] = ('sample', np.concatenate(
+            [dss['{}-{}'.format(field, i)].values for i in nums]))
+    ds.coords['time'] = ('sample', np.concatenate(times))
+    ds.coords['day'] = ('day', np.array(days, dtype='datetime64[ns]'))
+    ds.coords['day_start'] = ('day', starts)
+    ds.coords['day_count'] = ('day', counts)
+    ds['day_count'].attrs['sample_dimension'] = 'sample'
+    ds.attrs = dss.attrs
+    return ds
+
+
+def get_ragged_day(dss, field, i):
+    """return the i-th day of field from the ragged dss as a time dataarray"""
+    start = int(dss['day_start'][i])
+    end = start + int(dss['day_count'][i])
+    da = dss[field].isel(sample=slice(start, end))
+    da = da.swap_dims({'sample': 'time'}).drop_vars(['sample'], errors='ignore')
+    da.name = '{}-{}'.format(field, i)
+    return da
+
+
+def stitch_all_fields_in_ragged_ds(dss, verbose=0):
+    """stitch and replace the daily discontinuities of all the fields in the
+    ragged raw dss, raises ValueError if there are no overlapping days"""
+    import xarray as xr
+    da_fs = []
+    for field in dss.data_vars:
+        da_field = analyse_results_ds_one_station(dss, field, verbose=verbose)
+        da_fs.append(replace_fields_in_ds(dss, da_field, field,
+                                          verbose=verbose))
+    return xr.merge(da_fs)
+
+
 def replace_fields_in_ds(dss, da_repl, field='WetZ', verbose=None):
     """replaces dss overlapping field(and then some) with the stiched signal
     fron da_repl. be carful with the choices for field"""
-    from aux_gps import get_unique_index
     import xarray as xr
     import logging
     logger = logging.getLogger('gipsyx_post_proccesser')
     if verbose == 0:
         logger.info('replacing {} field.'.format(field))
-    # choose the field from the bigger dss:
-    nums = sorted(list(set([int(x.split('-')[1])
-                            for x in dss if x.split('-')[0] == field])))
-    ds = dss[['{}-{}'.format(field, i) for i in nums]]
-    da_list = []
-    for i, _ in enumerate(ds):
-        if i == len(ds) - 1:
-            break
-        first = ds['{}-{}'.format(field, i)]
-        time0 = list(set(first.dims))[0]
-        second = ds['{}-{}'.format(field, i+1)]
-        time1 = list(set(second.dims))[0]
-        try:
-            min_time = first.dropna(time0)[time0].min()
-            max_time = second.dropna(time1)[time1].max()
-        except ValueError:
-            if verbose == 1:
-                logger.warning('item {}, {} - {} is lonely'.format(field, i, i+1))
-            continue
-        try:
-            da = da_repl.sel(time=slice(min_time, max_time))
-        except KeyError:
-            if verbose == 1:
-                logger.warning('item {}, {} - {} is lonely'.format(field, i, i+1))
-            continue
-        if verbose == 1:
-            logger.info('proccesing {} and {}'.format(first.name, second.name))
-        # utime = dim_union([first, second], 'time')
-        first_time = set(first.dropna(time0)[time0].values).difference(set(da.time.values))
-        second_time = set(second.dropna(time1)[time1].values).difference(set(da.time.values))
-        first = first.sel({time0: list(first_time)})
-        second = second.sel({time1: list(second_time)})
-        first = first.rename({time0: 'time'})
-        second = second.rename({time1: 'time'})
-        da_list.append(xr.concat([first, da, second], 'time'))
-    da_final = xr.concat(da_list, 'time')
-    da_final = da_final.sortby('time')
+    if 'day' not in dss.dims:
+        dss = renamed_ds_to_ragged(dss)
+    time, vals = replace_ragged_field(dss['time'].values, dss[field].values,
+                                      dss['day_start'].values,
+                                      dss['day_count'].values,
+                                      da_repl['time'].values,
+                                      da_repl.values)
+    da_final = xr.DataArray(vals, dims=['time'], coords={'time': time})
     da_final.name = field
     da_final.attrs = da_repl.attrs
-    da_final = get_unique_index(da_final, 'time')
     return da_final
 
 
@@ -439,6 +581,232 @@ def stitch_two_cols(df, window=25, order=3, method='smooth_mean',
     return df
 
 
+def find_ragged_overlaps(time, starts, counts):
+    """for each sample of the ragged array (time, starts, counts) return the
+    index of the sample with the same time in the next day, or -1 if the next
+    day does not have that time"""
+    import numpy as np
+    t = time.astype('datetime64[ns]').view('int64')
+    day_of = np.repeat(np.arange(len(counts)), counts)
+    # sort all samples by time and then day, equal times of adjacent days
+    # end up next to each other:
+    order = np.lexsort((day_of, t))
+    ts = t[order]
+    days = day_of[order]
+    same = (ts[1:] == ts[:-1]) & (days[1:] == days[:-1] + 1)
+    match = np.full(t.shape, -1, dtype='int64')
+    match[order[:-1][same]] = order[1:][same]
+    return match
+
+
+def stitch_ragged_field(time, vals, starts, counts, method='smooth_mean',
+                        window=25, order=3, hours_offset=3):
+    """stitch all the adjacent days of one field at once, time and vals are
+    the ragged sample arrays and starts/counts the offset/length of each day.
+    for each pair of overlapping days, the first day's samples from the start
+    of the overlap - hours_offset up to the end of the overlap + hours_offset
+    are combined with the second day's samples at the same times using the
+    stitch_two_cols method rules (smooth_mean, simple_mean or error_mean).
+    returns the stitched time and values (in the order of the days)"""
+    import numpy as np
+    from scipy.signal import savgol_filter
+    nd = len(counts)
+    day_of = np.repeat(np.arange(nd), counts)
+    t = time.astype('datetime64[ns]')
+    match = find_ragged_overlaps(t, starts, counts)
+    matched = match >= 0
+    # first and last overlapping time of each day with the next day:
+    tint = t.view('int64')
+    big = np.iinfo('int64').max
+    ov_start = np.full(nd, big)
+    ov_end = np.full(nd, -big)
+    np.minimum.at(ov_start, day_of[matched], tint[matched])
+    np.maximum.at(ov_end, day_of[matched], tint[matched])
+    has_ov = ov_start != big
+    offset = int(hours_offset * 3600 * 1e9) if hours_offset is not None else 0
+    in_win = has_ov[day_of] & (tint >= ov_start[day_of] - offset) & (
+        tint <= ov_end[day_of] + offset)
+    win = np.flatnonzero(in_win)
+    first = vals[win]
+    # the second day reindexed to the first day's times:
+    second = np.full(win.shape, np.nan)
+    found = match[win] >= 0
+    second[found] = vals[match[win][found]]
+    if method == 'error_mean':
+        stitched = np.sqrt(np.nan_to_num(first)**2 +
+                           np.nan_to_num(second)**2)
+    else:
+        stitched = np.where(np.isnan(second), first,
+                            np.where(np.isnan(first), second,
+                                     (first + second) / 2))
+    if method == 'smooth_mean' and win.size > 0:
+        # savgol each pair's window, all windows of the same length at once:
+        seg_start = np.flatnonzero(np.diff(np.concatenate(
+            [[-1], day_of[win]])))
+        seg_len = np.diff(np.concatenate([seg_start, [win.size]]))
+        for length in np.unique(seg_len):
+            segs = seg_start[seg_len == length]
+            ind = segs[:, None] + np.arange(length)
+            stitched[ind] = savgol_filter(stitched[ind], window, order,
+                                          axis=-1)
+    return t[win], stitched
+
+
+def select_two_days_from_ragged(time, vals, starts, counts, i,
+                                hours_offset=None):
+    """selects two adjacent days(i, i+1) from the ragged arrays by their
+    offsets in the sample dim. the dataframe index is the first day's time
+    (the second day is reindexed to it)"""
+    import numpy as np
+    import pandas as pd
+    ends = starts + counts
+    time0 = time[starts[i]: ends[i]]
+    time1 = time[starts[i + 1]: ends[i + 1]]
+    vals0 = vals[starts[i]: ends[i]]
+    vals1 = vals[starts[i + 1]: ends[i + 1]]
+    # only the tail of the first day can overlap the head of the second:
+    tail = time0[np.searchsorted(time0, time1[0]):]
+    head = time1[:np.searchsorted(time1, time0[-1], 'right')]
+    time = np.intersect1d(tail, head)
+    if time.size == 0:
+        return None
+    if hours_offset is not None:
+        offset = np.timedelta64(int(hours_offset * 3600), 's')
+        start = time[0] - offset
+        end = time[-1] + offset
+    else:
+        start = time[0]
+        end = time[-1]
+    first = slice(np.searchsorted(time0, start),
+                  np.searchsorted(time0, end, 'right'))
+    time = time0[first]
+    # reindex the second day to the first day's time:
+    second = np.full(time.shape, np.nan)
+    ind = np.searchsorted(time1, time).clip(max=len(time1) - 1)
+    found = time1[ind] == time
+    second[found] = vals1[ind[found]]
+    df = pd.DataFrame({'first': vals0[first], 'second': second},
+                      index=pd.DatetimeIndex(time, name='time'))
+    return df
+
+
+def stitch_ragged_field_loop(time, vals, starts, counts,
+                             method='smooth_mean', window=25, order=3,
+                             hours_offset=3):
+    """the pair by pair version of stitch_ragged_field with stitch_two_cols,
+    kept as a reference for it"""
+    import numpy as np
+    time_list = []
+    vals_list = []
+    for i in range(len(counts) - 1):
+        df = select_two_days_from_ragged(time, vals, starts, counts, i,
+                                         hours_offset)
+        if df is None:
+            continue
+        df = stitch_two_cols(df, window, order, method=method)
+        time_list.append(df.index.values)
+        vals_list.append(df['stitched_signal'].values)
+    if not time_list:
+        return time[:0], vals[:0]
+    return np.concatenate(time_list), np.concatenate(vals_list)
+
+
+def replace_ragged_field(time, vals, starts, counts, repl_time, repl_vals):
+    """replace the samples of each pair of adjacent days (from the first
+    valid time of the first day to the last valid time of the second) with
+    the stitched signal (repl_time, repl_vals, sorted by time), keep the rest
+    of the valid samples of the two days. where a time appears more than once
+    the earlier pair wins. returns the time sorted time and values"""
+    import numpy as np
+    nd = len(counts)
+    day_of = np.repeat(np.arange(nd), counts)
+    tint = time.astype('datetime64[ns]').view('int64')
+    rint = repl_time.astype('datetime64[ns]').view('int64')
+    valid = ~np.isnan(vals)
+    big = np.iinfo('int64').max
+    tmin = np.full(nd, big)
+    tmax = np.full(nd, -big)
+    np.minimum.at(tmin, day_of[valid], tint[valid])
+    np.maximum.at(tmax, day_of[valid], tint[valid])
+    has_valid = tmin != big
+    pairs = np.flatnonzero(has_valid[:-1] & has_valid[1:])
+    lo = np.searchsorted(rint, tmin[pairs])
+    hi = np.searchsorted(rint, tmax[pairs + 1], 'right')
+    # where each sample time sits in the stitched signal:
+    pos = np.searchsorted(rint, tint)
+    in_repl = np.zeros(tint.shape, dtype=bool)
+    ok = pos < rint.size
+    in_repl[ok] = rint[pos[ok]] == tint[ok]
+    blocks_time = []
+    blocks_vals = []
+    blocks_key = []
+    for block, day_shift in [(0, 0), (2, 1)]:
+        # the days of each pair that are kept outside the stitched span:
+        p_of = np.full(nd, -1)
+        p_of[pairs + day_shift] = np.arange(pairs.size)
+        p = p_of[day_of]
+        keep = valid & (p >= 0)
+        pp = p[keep]
+        inside = in_repl[keep] & (pos[keep] >= lo[pp]) & (pos[keep] < hi[pp])
+        sel = np.flatnonzero(keep)[~inside]
+        blocks_time.append(tint[sel])
+        blocks_vals.append(vals[sel])
+        blocks_key.append(np.stack([pairs[p[sel]], np.full(sel.size, block),
+                                    sel]))
+    # the stitched span of each pair:
+    lengths = hi - lo
+    ind = np.repeat(lo - np.concatenate([[0], np.cumsum(lengths)[:-1]]),
+                    lengths) + np.arange(lengths.sum())
+    blocks_time.append(rint[ind])
+    blocks_vals.append(repl_vals[ind])
+    blocks_key.append(np.stack([np.repeat(pairs, lengths),
+                                np.ones(ind.size, dtype='int64'), ind]))
+    t = np.concatenate(blocks_time)
+    v = np.concatenate(blocks_vals)
+    key = np.concatenate(blocks_key, axis=1)
+    # sort by time and then by pair, block(first, stitched, second) and
+    # sample, and keep the first of each time:
+    order = np.lexsort((key[2], key[1], key[0], t))
+    t = t[order]
+    v = v[order]
+    first = np.concatenate([[True], t[1:] != t[:-1]]) if t.size else t.astype(bool)
+    return t[first].view('datetime64[ns]'), v[first]
+
+
+def benchmark_stitching(days=365, seed=42):
+    """compare stitch_ragged_field and replace_ragged_field to the pair by
+    pair loop on days of synthetic 5 minute 30hr WetZ windows"""
+    import numpy as np
+    import pandas as pd
+    import time as clock
+    rng = np.random.default_rng(seed)
+    time_list = []
+    vals_list = []
+    for day in pd.date_range('2019-01-01', periods=days, freq='D'):
+        t = pd.date_range(day - pd.Timedelta(3, unit='h'),
+                          day + pd.Timedelta(27, unit='h'), freq='5min')
+        time_list.append(t.values)
+        vals_list.append(15 + np.cumsum(rng.normal(0, 0.1, t.size)))
+    counts = np.array([x.size for x in time_list])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    time = np.concatenate(time_list)
+    vals = np.concatenate(vals_list)
+    t0 = clock.perf_counter()
+    lt, lv = stitch_ragged_field_loop(time, vals, starts, counts)
+    t_loop = clock.perf_counter() - t0
+    t0 = clock.perf_counter()
+    vt, vv = stitch_ragged_field(time, vals, starts, counts)
+    t_vect = clock.perf_counter() - t0
+    if not (np.array_equal(lt, vt) and np.allclose(lv, vv, equal_nan=True)):
+        raise ValueError('vectorized stitching differs from the loop!')
+    t0 = clock.perf_counter()
+    replace_ragged_field(time, vals, starts, counts, vt, vv)
+    t_repl = clock.perf_counter() - t0
+    print('{} days, {} samples: loop {:.3f} s, vectorized {:.4f} s ({:.0f}x), replace {:.4f} s'.format(
+        days, time.size, t_loop, t_vect, t_loop / t_vect, t_repl))
+    return t_loop, t_vect
+
+
 def analyse_results_ds_one_station(dss, field='WetZ', verbose=None,
                                    plot=False):
     """analyse and find an overlapping signal to fields 'WetZ' or 'WetZ_error'
@@ -451,35 +819,6 @@ def analyse_results_ds_one_station(dss, field='WetZ', verbose=None,
     import pandas as pd
     import logging
 
-    def select_two_ds_from_gipsyx_results(ds, names=['WetZ_0', 'WetZ_1'],
-                                          hours_offset=None):
-        """selects two dataarrays from the raw gipsyx results dataset"""
-        import pandas as pd
-        import xarray as xr
-        time0 = list(set(ds[names[0]].dims))[0]
-        time1 = list(set(ds[names[1]].dims))[0]
-        time = list(set(ds[names[0]][time0].values).intersection(set(ds[names[1]][time1].values)))
-        # time = dim_intersection([ds[names[0]], ds[names[1]]], dim='time')
-        if not time:
-            return None
-        time = sorted(pd.to_datetime(time))
-        if hours_offset is not None:
-            # freq = pd.infer_freq(time)
-            start = time[0] - pd.DateOffset(hours=hours_offset)
-            end = time[-1] + pd.DateOffset(hours=hours_offset)
-            # time = pd.date_range(start, end, freq=freq)
-            first = ds[names[0]].sel({time0: slice(start, end)})
-            second = ds[names[1]].sel({time1: slice(start, end)})
-        else:
-            first = ds[names[0]].sel({time0: time})
-            second = ds[names[1]].sel({time1: time})
-        first = first.rename({time0: 'time'})
-        second = second.rename({time1: 'time'})
-        two = xr.Dataset()
-        two[first.name] = first
-        two[second.name] = second
-        df = two.to_dataframe()
-        return df
     logger = logging.getLogger('gipsyx_post_proccesser')
     if verbose == 0:
         logger.info('analysing {} field.'.format(field))
@@ -489,41 +828,35 @@ def analyse_results_ds_one_station(dss, field='WetZ', verbose=None,
     to_error_mean = [x + '_error' for x in to_smooth] + [x + '_error' for x in
                                                          to_simple_mean]
     # second, select the field to work on:
-    nums = sorted(list(set([int(x.split('-')[1])
-                            for x in dss if x.split('-')[0] == field])))
-    ds = dss[['{}-{}'.format(field, i) for i in nums]]
-    df_list = []
-    for i, _ in enumerate(ds):
-        if i == len(ds) - 1:
-            break
-        first = ds['{}-{}'.format(field, i)]
-        second = ds['{}-{}'.format(field, i + 1)]
-        if verbose == 1:
-            print('proccesing {} and {}'.format(first.name, second.name))
-        # 3 hours addition to each side:
-        df = select_two_ds_from_gipsyx_results(ds, [first.name, second.name],
-                                               3)
-        if df is not None:
-            if field in to_smooth:
-                wn = 25
-                order = 3
-                stitched = stitch_two_cols(df, wn, order, method='smooth_mean')
-                action = 'stitched and replaced daily discontinuities '\
-                    'with smooth(savgol filter, window:{}, order:{}) mean'.format(wn, order)
-            elif field in to_simple_mean:
-                stitched = stitch_two_cols(df, method='simple_mean')
-                action = 'stitched and replaced daily discontinuities '\
-                    'with simple mean'
-            elif field in to_error_mean:
-                stitched = stitch_two_cols(df, method='error_mean')
-                action = 'stitched and replaced daily discontinuities '\
-                    'with error mean (sqrt(errorA^2 + errorB^2))'
-            df_list.append(stitched)
-            # df_list.append(find_cross_points(df, None))
-        elif df is None:
-            if verbose:
-                logger.warning('skipping {} and {}...'.format(first.name, second.name))
-    da = pd.concat([x['stitched_signal'] for x in df_list]).to_xarray()
+    if 'day' not in dss.dims:
+        dss = renamed_ds_to_ragged(dss)
+    if field in to_smooth:
+        wn = 25
+        order = 3
+        method = 'smooth_mean'
+        action = 'stitched and replaced daily discontinuities '\
+            'with smooth(savgol filter, window:{}, order:{}) mean'.format(wn, order)
+    elif field in to_simple_mean:
+        wn = 25
+        order = 3
+        method = 'simple_mean'
+        action = 'stitched and replaced daily discontinuities '\
+            'with simple mean'
+    elif field in to_error_mean:
+        wn = 25
+        order = 3
+        method = 'error_mean'
+        action = 'stitched and replaced daily discontinuities '\
+            'with error mean (sqrt(errorA^2 + errorB^2))'
+    # stitch all adjacent days at once, 3 hours addition to each side:
+    time, vals = stitch_ragged_field(dss['time'].values, dss[field].values,
+                                     dss['day_start'].values,
+                                     dss['day_count'].values, method, wn,
+                                     order, 3)
+    if time.size == 0:
+        raise ValueError('No overlapping days to stitch')
+    da = pd.Series(vals, index=pd.DatetimeIndex(time, name='time'),
+                   name='stitched_signal').to_xarray()
     attrs_list = [(x, y)
                   for x, y in dss.attrs.items() if field == x.split('>')[0]]
     attrs_list.append(('{}>action'.format(field), action))
@@ -533,8 +866,8 @@ def analyse_results_ds_one_station(dss, field='WetZ', verbose=None,
     if plot:
         fig, ax = plt.subplots(figsize=(16, 5))
         da.plot.line(marker='.', linewidth=0., ax=ax, color='k')
-        for i, ppp in enumerate(ds):
-            ds['{}-{}'.format(field, i)].plot(ax=ax)
+        for i in range(dss['day'].size):
+            get_ragged_day(dss, field, i).plot(ax=ax)
         units = dss.attrs['{}>units'.format(field)]
         sta = da.attrs['station']
         desc = da.attrs['{}>desc'.format(field)]
@@ -634,25 +967,43 @@ def analyse_results_ds_one_station(dss, field='WetZ', verbose=None,
 #    return errors_sorted, df
 
 
-def save_yearly_gipsyx_results(path, savepath):
+def save_one_year_gipsyx_results(path, savepath, year):
+    """read the tdp files of one year in path and save them to the yearly raw
+    file in savepath, the file is written to a temp name and renamed only when
+    complete, so a failed year leaves no partial file behind. returns the year,
+    and the failed rinex names (None if the whole year failed)"""
+    import logging
+    logger = logging.getLogger('gipsyx_post_proccesser')
+    try:
+        ds, errors = read_one_station_gipsyx_results(path, savepath, year)
+    except Exception as e:
+        logger.error('failed to process year {}: {}'.format(year, e))
+        return year, None
+    return year, errors
+
+
+def save_yearly_gipsyx_results(path, savepath, jobs=1):
     """call read one station for each year and save the results, then
-    concat and save to a bigger raw file, can add postproccess function"""
+    concat and save to a bigger raw file, can add postproccess function.
+    jobs: number of years to read at once, each year is saved independently
+    so a failed year does not affect the others"""
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import as_completed
     from aux_gps import path_glob
     from aux_gps import get_timedate_and_station_code_from_rinex
     import logging
     import pandas as pd
-    global cnt
-    global tot
     logger = logging.getLogger('gipsyx_post_proccesser')
     files = path_glob(path, '*.tdp')
     tot = len(files)
-    est_time_per_single_run = 0.3  # seconds
+    est_time_per_single_run = 0.05  # seconds
     logger.info('found {} _smoothFinal tdp files in {} to process.'.format(tot, path))
     dtt = pd.to_timedelta(est_time_per_single_run, unit='s') * tot
     extra_dtt = pd.to_timedelta(0.4, unit='s') * tot
     resample_dtt = pd.to_timedelta(0.75, unit='s') * tot
     dtt += extra_dtt
     dtt += resample_dtt
+    dtt /= min(jobs, tot) if tot > 0 else 1
     logger.info('estimated time to completion of run: {}'.format(dtt))
     logger.info('check again in {}'.format(pd.Timestamp.now() + dtt))
     rfns = [x.as_posix().split('/')[-1][0:12] for x in files]
@@ -660,121 +1011,158 @@ def save_yearly_gipsyx_results(path, savepath):
            rfn in rfns]
     _, station = get_timedate_and_station_code_from_rinex(rfns[0])
     years = list(set([dt.year for dt in dts]))
-    cnt = {'succ': 0, 'failed': 0}
+    years_to_run = []
     for year in sorted(years):
         filename = '{}_ppp_raw_{}.nc'.format(station, year)
         if (savepath / filename).is_file():
             logger.warning('{} already in {}, skipping...'.format(filename, savepath))
             continue
-        _, _ = read_one_station_gipsyx_results(path, savepath, year)
+        years_to_run.append(year)
+    cnt = {'succ': 0, 'failed': 0}
+    failed_years = []
+
+    def count(year, errors):
+        year_tot = len([x for x in dts if x.year == year])
+        if errors is None:
+            failed_years.append(year)
+            errors = [None] * year_tot
+        cnt['succ'] += year_tot - len(errors)
+        cnt['failed'] += len(errors)
+        logger.info('year {} done ({}/{} files)'.format(
+            year, cnt['succ'] + cnt['failed'], tot))
+        return
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(save_one_year_gipsyx_results, path,
+                                       savepath, year)
+                       for year in years_to_run]
+            for future in as_completed(futures):
+                count(*future.result())
+    else:
+        for year in years_to_run:
+            count(*save_one_year_gipsyx_results(path, savepath, year))
     total = cnt['failed'] + cnt['succ']
     logger.info('Total files: {}, success: {}, failed: {}'.format(
             total, cnt['succ'], cnt['failed']))
+    if failed_years:
+        logger.warning('failed years: {}, rerun to retry them.'.format(
+            sorted(failed_years)))
     return
 
 
 def read_one_station_gipsyx_results(path, savepath=None,
                                     year=None):
     """read one station (all years) consisting of many tdp files"""
-    import xarray as xr
-    from aux_gps import get_timedate_and_station_code_from_rinex
-    from aux_gps import path_glob
     import logging
     logger = logging.getLogger('gipsyx_post_proccesser')
     if year is not None:
         year = int(year)
         logger.info('getting tdp files from year {}'.format(year))
-    df_list = []
-    errors = []
-    dts = []
-    # logger.info('reading folder:{}'.format(path))
-    files = path_glob(path, '*.tdp')
-    for tdp_file in files:
-        rfn = tdp_file.as_posix().split('/')[-1][0:12]
-        dt, station = get_timedate_and_station_code_from_rinex(rfn)
-        if year is not None:
-            if dt.year != year:
-                continue
-            else:
-                logger.info(
-                        'processing {} ({}, {}/{})'.format(
-                                rfn,
-                                dt.strftime('%Y-%m-%d'), cnt['succ'] + cnt['failed'], tot))
-                try:
-                    df, meta = process_one_day_gipsyx_output(tdp_file)
-                    dts.append(df.index[0])
-                    cnt['succ'] += 1
-                except TypeError:
-                    logger.error('problem reading {}, appending to errors...'.format(rfn))
-                    errors.append(rfn)
-                    cnt['failed'] += 1
-                    continue
-                df_list.append(df)
-        elif year is None:
-            try:
-                df, meta = process_one_day_gipsyx_output(tdp_file)
-                dts.append(df.index[0])
-                cnt['succ'] += 1
-            except TypeError:
-                logger.error('problem reading {}, appending to errors...'.format(rfn))
-                errors.append(rfn)
-                cnt['failed'] += 1
-                continue
-            df_list.append(df)
-    # sort by first dates of each df:
-    df_dict = dict(zip(dts, df_list))
-    df_list = []
-    for key in sorted(df_dict):
-        df_list.append(df_dict[key])
-    dss = [df.to_xarray() for df in df_list]
-    dss_new = []
-    for i, ds in enumerate(dss):
-        keys_to_rename = [x for x in ds.data_vars.keys()]
-        keys_to_rename.append('time')
-        values_to_rename = [x + '-{}'.format(i) for x in keys_to_rename]
-        dict_to_rename = dict(zip(keys_to_rename, values_to_rename))
-        dss_new.append(ds.rename(dict_to_rename))
-    ds = xr.merge(dss_new)
-    ds.attrs['station'] = station
-    for key, val in meta['units'].items():
-        ds.attrs[key + '>units'] = val
-    for key, val in meta['desc'].items():
-        ds.attrs[key + '>desc'] = val
+    ppps, meta, errors = read_all_tdp_files(path, year)
+    if not ppps:
+        raise ValueError('no valid tdp files in {} for year {}'.format(path,
+                                                                      year))
+    station = list(ppps.keys())[0][0:4].upper()
+    logger.info('processed {} tdp files, success: {}, failed: {}'.format(
+        len(ppps) + len(errors), len(ppps), len(errors)))
+    ds = ppps_to_ragged_ds(ppps, meta, station)
     if savepath is not None:
         comp = dict(zlib=True, complevel=9)  # best compression
         encoding = {var: comp for var in ds.data_vars}
         filename = '{}_ppp_raw_{}.nc'.format(station, year)
-        ds.to_netcdf(savepath / filename, 'w', encoding=encoding)
+        # write to a temp file first so a crash never leaves a partial year:
+        tmp_file = savepath / '{}.tmp'.format(filename)
+        ds.to_netcdf(tmp_file, 'w', encoding=encoding)
+        tmp_file.replace(savepath / filename)
         logger.info('{} was saved to {}'.format(filename, savepath))
     return ds, errors
 
 
+def read_tdp_file(path_and_file, keys=['WetZ', 'GradNorth', 'GradEast',
+                                        'Pos.X', 'Pos.Y', 'Pos.Z']):
+    """single pass reader of a GipsyX smoothFinal.tdp file: tokenize the file
+    once, and bucket the rows by the parameter name (last col) into
+    preallocated arrays. returns the seconds (since 2000-01-01T12:00:00) and
+    a (time, 2 * len(keys)) array of the value and error of each key"""
+    import numpy as np
+    with open(path_and_file, 'rb') as f:
+        tokens = f.read().split()
+    if not tokens or len(tokens) % 5 != 0:
+        raise TypeError('{} is not a 5 column tdp file'.format(path_and_file))
+    # bucket by the parameter name, e.g., .Station.TELA.Trop.WetZ:
+    names, inverse = np.unique(np.array(tokens[4::5]), return_inverse=True)
+    tokens = np.array(tokens, dtype=object).reshape(-1, 5)
+    names = [x.decode() for x in names]
+    rows = []
+    for key in keys:
+        codes = [i for i, x in enumerate(names) if key in x]
+        rows.append(np.flatnonzero(np.isin(inverse, codes)))
+    # make sure that all keys in df have the same length:
+    assert len(set([len(x) for x in rows])) == 1
+    try:
+        seconds = tokens[rows[0], 0].astype(float)
+        values = np.empty((len(rows[0]), 2 * len(keys)), dtype=float)
+        for i, row in enumerate(rows):
+            values[:, 2 * i] = tokens[row, 2].astype(float)
+            values[:, 2 * i + 1] = tokens[row, 3].astype(float)
+    except ValueError:
+        raise TypeError('could not parse {}'.format(path_and_file))
+    return seconds, values
+
+
+def read_all_tdp_files(path, year=None, glob_str='*.tdp'):
+    """batch read all tdp files in path (or only of year) with read_tdp_file,
+    returns a dict of rinex name : ppp dataframe (sorted by date), the meta
+    dict and a list of the rinex names that failed"""
+    from aux_gps import get_timedate_and_station_code_from_rinex
+    from aux_gps import path_glob
+    import logging
+    import time
+    logger = logging.getLogger('gipsyx_post_proccesser')
+    files = path_glob(path, glob_str)
+    rfns = [x.as_posix().split('/')[-1][0:12] for x in files]
+    dts = [get_timedate_and_station_code_from_rinex(rfn, just_dt=True) for
+           rfn in rfns]
+    ppps = {}
+    errors = []
+    meta = None
+    start_time = time.time()
+    for dt, rfn, tdp_file in sorted(zip(dts, rfns, files)):
+        if year is not None and dt.year != int(year):
+            continue
+        try:
+            ppps[rfn], meta = process_one_day_gipsyx_output(tdp_file)
+        except TypeError:
+            logger.error('problem reading {}, appending to errors...'.format(rfn))
+            errors.append(rfn)
+    elapsed = time.time() - start_time
+    if elapsed > 0:
+        logger.info('read {} tdp files in {:.1f} s ({:.1f} files per second)'.format(
+            len(ppps) + len(errors), elapsed,
+            (len(ppps) + len(errors)) / elapsed))
+    return ppps, meta, errors
+
+
 def process_one_day_gipsyx_output(path_and_file, plot=False):
     # path_and_file = work_yuval / 'smoothFinal.tdp'
     import pandas as pd
     # import pyproj
-    import matplotlib.pyplot as plt
     # from aux_gps import get_latlonalt_error_from_geocent_error
-    df_raw = pd.read_csv(path_and_file, header=None, delim_whitespace=True)
-    # get all the vars from smoothFinal.tdp file and put it in a df_list:
+    # get all the vars from smoothFinal.tdp file in one pass:
     keys = ['WetZ', 'GradNorth', 'GradEast', 'Pos.X', 'Pos.Y', 'Pos.Z']
-    df_list = [df_raw[df_raw.iloc[:, -1].str.contains(x)] for x in keys]
-    # make sure that all keys in df have the same length:
-    assert len(set([len(x) for x in df_list])) == 1
+    seconds, values = read_tdp_file(path_and_file, keys)
     # translate the seconds col to datetime:
-    seconds = df_list[0].iloc[:, 0]
     dt = pd.to_datetime('2000-01-01T12:00:00')
     time = dt + pd.to_timedelta(seconds, unit='sec')
     # build a new df that contains all the vars(from keys):
-    ppp = pd.DataFrame(index=time)
+    columns = []
+    for key in keys:
+        # rename all the Pos. to nothing:
+        key = key.replace('Pos.', '')
+        columns += [key, key + '_error']
+    ppp = pd.DataFrame(values, index=time, columns=columns)
     ppp.index.name = 'time'
-    for i, df in enumerate(df_list):
-        df.columns = ['seconds', 'to_drop', keys[i], keys[i] + '_error',
-                      'meta']
-        ppp[keys[i]] = df[keys[i]].values
-        ppp[keys[i] + '_error'] = df[keys[i] + '_error'].values
-    # rename all the Pos. to nothing:
-    ppp.columns = ppp.columns.str.replace('Pos.', '')
     desc = ['Zenith Wet Delay', 'North Gradient of Zenith Wet Delay',
             'East Gradient of Zenith Wet Delay',
             'WGS84(geocentric) X coordinate',
@@ -788,6 +1176,7 @@ def process_one_day_gipsyx_output(path_and_file, plot=False):
     trop_cols = ppp.columns.values[0:6]
     ppp[trop_cols] = ppp[trop_cols].mul(100.0)
     if plot:
+        import matplotlib.pyplot as plt
         fig, axes = plt.subplots(3, 2, figsize=(12, 10), sharex=True)
 
         for ax, field, name, unit in zip(axes.flatten(), fields, desc, units):
@@ -800,6 +1189,245 @@ def process_one_day_gipsyx_output(path_and_file, plot=False):
     return ppp, meta
 
 
+def read_ingested_manifest(savepath, station):
+    """return the set of tdp file names already ingested to the final
+    products of station in savepath (empty if there is no manifest)"""
+    manifest = savepath / '{}_ingested_tdp.txt'.format(station.upper())
+    if not manifest.is_file():
+        return set()
+    with open(manifest) as f:
+        return set([x.strip() for x in f.readlines() if x.strip()])
+
+
+def write_ingested_manifest(savepath, station, filenames):
+    """write the tdp file names ingested to the final products of station"""
+    manifest = savepath / '{}_ingested_tdp.txt'.format(station.upper())
+    tmp_file = savepath / '{}.tmp'.format(manifest.name)
+    with open(tmp_file, 'w') as f:
+        for item in sorted(filenames):
+            f.write("%s\n" % item)
+    tmp_file.replace(manifest)
+    return
+
+
+def stitch_new_day_with_neighbours(tdp_files, i, hours_offset=3):
+    """read the i-th tdp file of tdp_files (sorted by date) with its previous
+    and next days, stitch them and return the stitched fields only in the span
+    that the new day changes(from its start - hours_offset to its end)"""
+    import numpy as np
+    import pandas as pd
+    from aux_gps import get_unique_index
+    ppps = {}
+    meta = None
+    for tdp_file in tdp_files[max(i - 1, 0): i + 2]:
+        rfn = tdp_file.as_posix().split('/')[-1][0:12]
+        try:
+            ppps[rfn], meta = process_one_day_gipsyx_output(tdp_file)
+        except TypeError:
+            continue
+    rfn = tdp_files[i].as_posix().split('/')[-1][0:12]
+    if rfn not in ppps:
+        raise TypeError('problem reading {}'.format(rfn))
+    new_time = ppps[rfn].index
+    station = rfn[0:4].upper()
+    dss = ppps_to_ragged_ds(ppps, meta, station)
+    try:
+        ds = stitch_all_fields_in_ragged_ds(dss)
+    except ValueError:
+        # lonely 24hr day, nothing to stitch:
+        ds = ppps[rfn].to_xarray()
+        for field in ds.data_vars:
+            for key, val in dss.attrs.items():
+                if key.split('>')[0] == field:
+                    ds[field].attrs[key] = val
+    ds = get_unique_index(ds, 'time')
+    start = new_time.min() - pd.Timedelta(hours_offset, unit='h')
+    end = new_time.max()
+    ds = ds.sel(time=slice(start, end))
+    return ds.isel(time=np.isfinite(ds['WetZ'].values) |
+                   np.isfinite(ds['X'].values))
+
+
+def update_resampled_versions_gipsyx(load_path, sample, ds, spans):
+    """recompute only the resampled bins of ds(the final 5 mins dataset) that
+    intersect the (start, end) spans and replace them in the resampled files
+    of save_all_resampled_versions_gipsyx"""
+    from aux_gps import path_glob
+    import pandas as pd
+    import xarray as xr
+    import logging
+    logger = logging.getLogger('gipsyx_post_proccesser')
+    station = ds.attrs['station'].upper()
+    ymin = ds.time.min().dt.year.item()
+    ymax = ds.time.max().dt.year.item()
+    globs = ['{}_{}_PPP_*.nc'.format(station, x) for x in sample.values()]
+    if any([not path_glob(load_path, x, True) for x in globs]):
+        logger.warning('resampled files not found, resampling all of them.')
+        save_all_resampled_versions_gipsyx(load_path, sample)
+        return
+    # pad with the longest bin so that the edge bins are complete:
+    pad = pd.Timedelta('31D')
+    dsr_lists = dict((x, []) for x in sample.keys())
+    for start, end in spans:
+        window = ds.sel(time=slice(pd.Timestamp(start) - pad,
+                                   pd.Timestamp(end) + pad))
+        dsr_dict = resample_gipsyx_from_hourly_aggregates(window, sample.keys())
+        for sample_rate in sample.keys():
+            # the labels of all the bins between start and end:
+            labels = pd.Series([0, 0], index=pd.to_datetime([start, end])).resample(
+                sample_rate).sum().index
+            dsr = dsr_dict[sample_rate]
+            dsr_lists[sample_rate].append(dsr.sel(time=dsr.time.isin(labels)))
+    for sample_rate, name in sample.items():
+        files = path_glob(load_path, '{}_{}_PPP_*.nc'.format(station, name))
+        dsr = xr.concat(dsr_lists[sample_rate], 'time')
+        # spans may share bins(e.g., the same month):
+        dsr = dsr.isel(time=~dsr.indexes['time'].duplicated()).sortby('time')
+        labels = dsr.time
+        old = xr.load_dataset(files[0])
+        dsr = dsr.combine_first(old)
+        for field in dsr.data_vars:
+            if field in old:
+                dsr[field].attrs = old[field].attrs
+        dsr.attrs = old.attrs
+        new_filename = '{}_{}_PPP_{}-{}.nc'.format(station, name, ymin, ymax)
+        comp = dict(zlib=True, complevel=9)  # best compression
+        encoding = {var: comp for var in dsr.data_vars}
+        tmp_file = load_path / '{}.tmp'.format(new_filename)
+        dsr.to_netcdf(tmp_file, 'w', encoding=encoding)
+        if files[0].name != new_filename:
+            files[0].unlink()
+        tmp_file.replace(load_path / new_filename)
+        logger.info('updated {} bins of {}'.format(dsr.time.isin(labels).sum().item(),
+                                                   new_filename))
+    return
+
+
+def keep_iqr_with_old(ds, old, fields, iqr_k=3.0):
+    """NaN the values of fields in ds(the new days) outside the IQR bounds of
+    the existing series in old together with ds, fields not in old are left
+    as is"""
+    import xarray as xr
+    from aux_gps import add_attr_to_xr
+    for field in [x for x in fields if x in old and x in ds]:
+        both = xr.concat([old[field].dropna('time'), ds[field].dropna('time')],
+                         'time')
+        low, high = both.quantile([0.25, 0.75], 'time').values
+        iqr = high - low
+        attrs = ds[field].attrs
+        ds[field] = ds[field].where((ds[field] < high + iqr * iqr_k) &
+                                    (ds[field] > low - iqr * iqr_k))
+        ds[field].attrs = attrs
+        add_attr_to_xr(ds[field], 'action',
+                       ', kept IQR ({}, {}, {})'.format(0.25, 0.75, iqr_k),
+                       'action' in attrs)
+    return ds
+
+
+def update_gipsyx_results_incremental(tdppath, savepath, iqr_k=3.0,
+                                      sample=None):
+    """ingest only the tdp files in tdppath that are not in the manifest of
+    savepath: stitch each new day with its neighbours, clean it and merge it
+    into the final *_PPP_<ymin>-<ymax>.nc and resampled files. runs the full
+    post proccessing if there is no final file yet. note that the yearly raw
+    and post files are not updated in this mode."""
+    from aux_gps import path_glob
+    from aux_gps import get_timedate_and_station_code_from_rinex
+    from aux_gps import filter_nan_errors
+    from aux_gps import transform_ds_to_lat_lon_alt
+    from aux_gps import xr_reindex_with_date_range
+    import numpy as np
+    import xarray as xr
+    import logging
+    logger = logging.getLogger('gipsyx_post_proccesser')
+    files = path_glob(tdppath, '*.tdp')
+    rfns = [x.as_posix().split('/')[-1][0:12] for x in files]
+    dts = get_timedate_and_station_code_from_rinex(rfns)
+    files = [x for _, x in sorted(zip(dts, files))]
+    station = rfns[0][0:4].upper()
+    names = [x.name for x in files]
+    ingested = read_ingested_manifest(savepath, station)
+    final = path_glob(savepath, '{}_PPP_*.nc'.format(station), True)
+    if not final:
+        logger.warning('no final {} PPP file in {}, running full post proccessing.'.format(
+            station, savepath))
+        save_yearly_gipsyx_results(tdppath, savepath)
+        post_procces_gipsyx_all_years(savepath, False)
+        read_gipsyx_all_yearly_files(savepath, savepath, iqr_k, False)
+        if sample is not None:
+            save_all_resampled_versions_gipsyx(savepath, sample)
+        write_ingested_manifest(savepath, station, names)
+        return
+    new = [i for i, x in enumerate(names) if x not in ingested]
+    if not new:
+        logger.info('no new tdp files for {}, nothing to do.'.format(station))
+        return
+    logger.info('found {} new tdp files for {}.'.format(len(new), station))
+    old = xr.load_dataset(final[0])
+    chunks = []
+    for i in new:
+        try:
+            chunks.append(stitch_new_day_with_neighbours(files, i))
+        except TypeError:
+            logger.error('problem reading {}, skipping...'.format(names[i]))
+            continue
+        ingested.add(names[i])
+    if not chunks:
+        return
+    # the time spans that the new days replace(each stitched chunk):
+    spans = [(x.time.min().values, x.time.max().values) for x in chunks]
+    ds = xr.concat(chunks, 'time')
+    # consecutive new days overlap, the later day's stitch takes precedence:
+    ds = ds.isel(time=~ds.indexes['time'].duplicated(keep='last'))
+    ds = ds.sortby('time')
+    fields = [x for x in ds.data_vars]
+    for field in fields:
+        for key in [x for x in ds[field].attrs.keys()]:
+            ds[field].attrs[key.split('>')[-1]] = ds[field].attrs.pop(key)
+        if 'desc' in ds[field].attrs.keys():
+            ds[field].attrs['full_name'] = ds[field].attrs.pop('desc')
+    # clean the same fields as the full post proccessing, before the
+    # lat/lon/alt transform:
+    ds = keep_iqr_with_old(ds, old, fields, iqr_k)
+    ds = filter_nan_errors(ds, error_str='_error', dim='time')
+    ds = transform_ds_to_lat_lon_alt(ds, ['X', 'Y', 'Z'], '_error', 'time')
+    if not all(x in old for x in ['X', 'Y', 'Z']):
+        # the final file has only lat/lon/alt, clean the positions with them:
+        lla = ['lon', 'lat', 'alt']
+        ds = keep_iqr_with_old(ds, old, lla + [x + '_error' for x in lla],
+                               iqr_k)
+        valid = np.isfinite(ds['lon']) & np.isfinite(ds['lat']) & np.isfinite(ds['alt'])
+        for field in ['X', 'Y', 'Z'] + lla:
+            ds[field] = ds[field].where(valid)
+    # the new days take precedence over the old values only in their spans:
+    old_time = old.indexes['time']
+    in_spans = np.zeros(old_time.size, dtype=bool)
+    for start, end in spans:
+        in_spans |= (old_time >= start) & (old_time <= end)
+    old_out = old.isel(time=~in_spans)
+    ds = ds[[x for x in old.data_vars if x in ds]].combine_first(old_out)
+    for field in old.data_vars:
+        ds[field].attrs = old[field].attrs
+    ds.attrs = old.attrs
+    ds = xr_reindex_with_date_range(ds, 'time', '5min')
+    comp = dict(zlib=True, complevel=9)  # best compression
+    encoding = {var: comp for var in ds.data_vars}
+    ymin = ds.time.min().dt.year.item()
+    ymax = ds.time.max().dt.year.item()
+    new_filename = '{}_PPP_{}-{}.nc'.format(station, ymin, ymax)
+    tmp_file = savepath / '{}.tmp'.format(new_filename)
+    ds.to_netcdf(tmp_file, 'w', encoding=encoding)
+    if final[0].name != new_filename:
+        final[0].unlink()
+    tmp_file.replace(savepath / new_filename)
+    logger.info('{} was updated with {} new days.'.format(new_filename,
+                                                          len(chunks)))
+    if sample is not None:
+        update_resampled_versions_gipsyx(savepath, sample, ds, spans)
+    write_ingested_manifest(savepath, station, ingested)
+    return
+
+
 if __name__ == '__main__':
     """tdppath is where the gipsyx results are (tdp files).
     e.g., /rinex/tela/30hr/results. savepath is where the raw/final post
@@ -811,6 +1439,7 @@ if __name__ == '__main__':
     from PW_paths import geo_path
     from PW_paths import cwd
     from aux_gps import configure_logger
+    from aux_gps import path_glob
     garner_path = work_yuval / 'garner'
     ims_path = work_yuval / 'IMS_T'
     gis_path = work_yuval / 'gis'
@@ -830,7 +1459,14 @@ if __name__ == '__main__':
         help="a full path to the tdp files path of the station, /home/ziskin/Work_Files/PW_yuval/rinex/tela/30hr/results",
         type=check_path)
     optional.add_argument('--iqr_k', help='InterQuartile Range multiplier parameter(e.g., 1.5), Defualt=3.0',
+                          type=check_abs_float)
+    optional.add_argument('--jobs', help='number of years to read at once, Defualt=1',
                           type=check_abs_int)
+    optional.add_argument(
+            '--incremental',
+            dest='incremental',
+            action='store_true',
+            help='only ingest tdp files that are new since the last run')
 
 #    optional.add_argument(
 #            '--rewrite',
@@ -839,21 +1475,34 @@ if __name__ == '__main__':
 #            help='overwrite files in prep/run mode')
 
     parser._action_groups.append(optional)  # added this line
-#    parser.set_defaults(rewrite=False)
+    parser.set_defaults(incremental=False)
     args = parser.parse_args()
     if args.tdppath is None:
         print('tdppath is a required argument, run with -h...')
         sys.exit()
     station = args.tdppath.as_posix().split('/')[-4].upper()
     logger.info('Starting post proccessing {} station'.format(station))
-    save_yearly_gipsyx_results(args.tdppath, args.savepath)
-    post_procces_gipsyx_all_years(args.savepath, False)
+    if args.jobs is None:
+        jobs = 1
+    else:
+        jobs = args.jobs
     if args.iqr_k is None:
         iqr_k = 3.0
     else:
         iqr_k = args.iqr_k
-    read_gipsyx_all_yearly_files(args.savepath, args.savepath, iqr_k, False)
     sample = {'1H': 'hourly', '3H': '3hourly', 'D': 'Daily', 'W': 'weekly',
               'MS': 'monthly'}
-    save_all_resampled_versions_gipsyx(args.savepath, sample)
+    if args.incremental:
+        update_gipsyx_results_incremental(args.tdppath, args.savepath, iqr_k,
+                                          sample)
+    else:
+        save_yearly_gipsyx_results(args.tdppath, args.savepath, jobs)
+        post_procces_gipsyx_all_years(args.savepath, False)
+        read_gipsyx_all_yearly_files(args.savepath, args.savepath, iqr_k,
+                                     False)
+        save_all_resampled_versions_gipsyx(args.savepath, sample)
+        # remember what was ingested for later --incremental runs:
+        write_ingested_manifest(args.savepath, station,
+                                [x.name for x in path_glob(args.tdppath,
+                                                           '*.tdp')])
     logger.info('Done post proccessing station {}.'.format(station))
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:44 2026
+Methodology:
+    build one task graph for all stations with a node per station, day and
+    stage (drdump -> edit30hr -> run) and a post node per station, then run it
+    on a bounded local process pool. a node starts as soon as all of its
+    dependencies are done, so all cores are kept busy across all stations.
+    nodes whose output files already exist on disk are marked as done when the
+    graph is built, so re-running the scheduler resumes where it stopped.
+@author: shlomi
+"""
+
+stages = ['drdump', 'edit30hr', 'run', 'post']
+
+
+def check_station_name(name):
+    name = str(name).lower()
+    if len(name) != 4:
+        raise argparse.ArgumentTypeError(name + ' should be 4 letters...')
+    return name
+
+
+def run_post_proc_one_station(tdppath, savepath, iqr_k=None, workdir=None):
+    """runs gipsyx_post_proc.py on the tdp files in tdppath and saves the
+    results to savepath, logs are written to savepath.
+    returns 'succ' or 'failed'."""
+    import subprocess
+    from subprocess import CalledProcessError
+    from pathlib import Path
+    import logging
+    logger = logging.getLogger('gipsyx')
+    if workdir is None:
+        workdir = Path().cwd()
+    station = tdppath.as_posix().split('/')[-4]
+    pwpath = Path(__file__).resolve().parent
+    command = 'python -u {} --tdppath {} --savepath {}'.format(
+        pwpath / 'gipsyx_post_proc.py', tdppath.as_posix(),
+        savepath.as_posix())
+    if iqr_k is not None:
+        command += ' --iqr_k {}'.format(iqr_k)
+    command += ' > {}/{}_post.log 2>{}/{}_post.err'.format(
+        savepath.as_posix(), station, savepath.as_posix(), station)
+    savepath.mkdir(parents=True, exist_ok=True)
+    try:
+        subprocess.run(command, shell=True, check=True, cwd=workdir)
+    except CalledProcessError:
+        logger.error('gipsyx_post_proc.py failed on {}...'.format(station))
+        return 'failed'
+    return 'succ'
+
+
+def build_station_graph(station_path, staDb, tree, date_range=None,
+                        iqr_k=None):
+    """build the task graph of one station (in station_path), returns a dict
+    with (station, day, stage) keys and node dicts as values. each node holds
+    the worker func and its args (see run_gipsyx), its deps (set of keys),
+    the scratch path to run in and whether its output already exists
+    (done). the post node only waits for its deps to finish (wait_only), so
+    a failed day does not stop the post processing of the other days."""
+    from run_gipsyx import read_organize_rinex
+    from run_gipsyx import run_dataRecordDump_one_file
+    from run_gipsyx import run_rnxEditGde_one_file
+    from run_gipsyx import run_edit30hr_one_triplet
+    from run_gipsyx import run_gd2e_one_file
+    from aux_gps import path_glob
+    import pandas as pd
+    import logging
+    logger = logging.getLogger('gipsyx')
+    station = station_path.as_posix().split('/')[-1]
+    rinexpath = station_path / 'rinex'
+    dr_path = rinexpath / 'dr'
+    hr30 = rinexpath / '30hr'
+    results_path = hr30 / 'results'
+    savepath = station_path / 'gipsyx_solutions'
+    for path in [dr_path, hr30, results_path]:
+        path.mkdir(parents=True, exist_ok=True)
+    if date_range is not None:
+        # read one more day at each end so that the edges can still be merged
+        # with their neighbours:
+        date_range = pd.to_datetime(date_range)
+        padded = [date_range[0] - pd.Timedelta(1, unit='D'),
+                  date_range[1] + pd.Timedelta(1, unit='D')]
+        rinex_df = read_organize_rinex(rinexpath, date_range=padded)
+    else:
+        rinex_df = read_organize_rinex(rinexpath)
+    rinex_files = dict((x.as_posix().split('/')[-1][0:12], x) for x in
+                       path_glob(rinexpath, '*.Z'))
+    graph = {}
+    for i, date in enumerate(rinex_df.index):
+        rfn = rinex_df.loc[date, 'rinex']
+        if pd.isna(rfn):
+            continue
+        day = date.strftime('%Y-%m-%d')
+        graph[(station, day, 'drdump')] = {
+            'func': run_dataRecordDump_one_file,
+            'args': (rinex_files[rfn], dr_path, False),
+            'deps': set(),
+            'scratch': dr_path,
+            'done': (dr_path / '{}.dr.gz'.format(rfn)).is_file()}
+    for i, date in enumerate(rinex_df.index):
+        rfn = rinex_df.loc[date, 'rinex']
+        if pd.isna(rfn):
+            continue
+        if date_range is not None:
+            if date < date_range[0] or date > date_range[1]:
+                continue
+        day = date.strftime('%Y-%m-%d')
+        if rinex_df.loc[date, '30hr'] == 1:
+            days = [rinex_df.index[i - 1], date, rinex_df.index[i + 1]]
+            rfns = [rinex_df.loc[x, 'rinex'] for x in days]
+            filenames = [x + '.dr.gz' for x in rfns]
+            edited = '{}_edited30hr.dr.gz'.format(rfn)
+            graph[(station, day, 'edit30hr')] = {
+                'func': run_edit30hr_one_triplet,
+                'args': (filenames, dr_path, hr30, staDb, False),
+                'deps': set((station, x.strftime('%Y-%m-%d'), 'drdump')
+                            for x in days),
+                'scratch': hr30,
+                'done': (hr30 / edited).is_file()}
+        else:
+            edited = '{}_edited24hr.dr.gz'.format(rfn)
+            graph[(station, day, 'edit30hr')] = {
+                'func': run_rnxEditGde_one_file,
+                'args': (rfn + '.dr.gz', dr_path, hr30, staDb, False),
+                'deps': set([(station, day, 'drdump')]),
+                'scratch': hr30,
+                'done': (hr30 / edited).is_file()}
+        graph[(station, day, 'run')] = {
+            'func': run_gd2e_one_file,
+            'args': (hr30 / edited, staDb, tree, results_path, False),
+            'deps': set([(station, day, 'edit30hr')]),
+            'scratch': results_path,
+            'done': (results_path / '{}_smoothFinal.tdp'.format(rfn)).is_file()}
+    run_keys = [x for x in graph.keys() if x[2] == 'run']
+    ppp_files = path_glob(savepath, '{}_PPP_*.nc'.format(station.upper()),
+                          True) if savepath.is_dir() else []
+    graph[(station, 'all', 'post')] = {
+        'func': run_post_proc_one_station,
+        'args': (results_path, savepath, iqr_k),
+        'deps': set(run_keys),
+        'wait_only': True,
+        'scratch': results_path,
+        'done': bool(ppp_files) and all(graph[x]['done'] for x in run_keys)}
+    logger.info('built task graph for {} with {} nodes.'.format(station,
+                                                                len(graph)))
+    return graph
+
+
+def build_task_graph(workpath, stations, staDb, tree, date_range=None,
+                     iqr_k=None):
+    """build one task graph for all stations in workpath"""
+    graph = {}
+    for station in stations:
+        graph.update(build_station_graph(workpath / station, staDb, tree,
+                                         date_range, iqr_k))
+    return graph
+
+
+def graph_status(graph):
+    """return a dataframe of done/failed/total nodes per station and stage"""
+    import pandas as pd
+    df = pd.DataFrame([(x[0], x[2], node['done'], node.get('failed', False))
+                       for x, node in graph.items()],
+                      columns=['station', 'stage', 'done', 'failed'])
+    status = df.groupby(['station', 'stage']).agg(
+        done=('done', 'sum'), failed=('failed', 'sum'),
+        total=('done', 'count'))
+    status = status.unstack('stage').swaplevel(axis=1)
+    return status.reindex(columns=[x for x in stages if x in
+                                   status.columns.levels[0]], level=0)
+
+
+def run_task_graph(graph, jobs=4):
+    """run all the nodes of graph that are not done on a process pool with
+    jobs workers. a node is submitted once all of its deps are done, a failed
+    node fails all of its dependents, except for wait_only nodes that are
+    submitted once all of their deps are done or failed. returns the
+    success/failure counter dict."""
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import FIRST_COMPLETED
+    from concurrent.futures import wait
+    from run_gipsyx import run_in_scratch_dir
+    import time
+    import logging
+    logger = logging.getLogger('gipsyx')
+    cnt = {'succ': 0, 'failed': 0, 'skipped': 0}
+    dependents = dict((x, []) for x in graph.keys())
+    for key, node in graph.items():
+        # drop deps on days that are not in the graph (i.e., already deleted):
+        node['deps'] = set(x for x in node['deps'] if x in graph)
+        for dep in node['deps']:
+            dependents[dep].append(key)
+    remaining = dict((key, len([x for x in node['deps'] if not
+                                graph[x]['done']]))
+                     for key, node in graph.items() if not node['done'])
+    tot = len(remaining)
+    logger.info('{} nodes to run out of {} nodes in graph.'.format(tot,
+                                                                   len(graph)))
+    # run later stages first so finished days flow through to the results:
+    ready = sorted([key for key, num in remaining.items() if num == 0],
+                   key=lambda x: (-stages.index(x[2]), x[1]))
+    failed = set()
+    start_time = time.time()
+
+    def release(dep):
+        remaining[dep] -= 1
+        if remaining[dep] == 0:
+            ready.insert(0, dep)
+        return
+
+    def fail_dependents(key):
+        graph[key]['failed'] = True
+        for dep in dependents[key]:
+            if dep not in remaining or dep in failed:
+                continue
+            if graph[dep].get('wait_only', False):
+                # the failed dep is finished as far as dep is concerned:
+                release(dep)
+                continue
+            logger.warning('skipping {} since {} failed.'.format(dep, key))
+            failed.add(dep)
+            cnt['skipped'] += 1
+            fail_dependents(dep)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while ready or running:
+            while ready and len(running) < jobs:
+                key = ready.pop(0)
+                node = graph[key]
+                name = '_'.join([key[0], key[1], key[2]])
+                future = executor.submit(run_in_scratch_dir, node['func'],
+                                         name, node['scratch'], *node['args'])
+                running[future] = key
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = running.pop(future)
+                try:
+                    _, status = future.result()
+                except Exception as e:
+                    logger.error('{} raised {}'.format(key, e))
+                    status = 'failed'
+                if status == 'failed':
+                    cnt['failed'] += 1
+                    failed.add(key)
+                    fail_dependents(key)
+                else:
+                    cnt['succ'] += 1
+                    graph[key]['done'] = True
+                    for dep in dependents[key]:
+                        if dep not in remaining or dep in failed:
+                            continue
+                        release(dep)
+                ready.sort(key=lambda x: (-stages.index(x[2]), x[1]))
+                logger.info('{} {} {} ({}/{}, {:.2f} files per minute)'.format(
+                    key[0], key[1], key[2], sum(cnt.values()), tot,
+                    sum(cnt.values()) / ((time.time() - start_time) / 60.0)))
+    logger.info('Done!')
+    logger.info('Total nodes: {}, success: {}, failed: {}, skipped: {}'.format(
+        tot, cnt['succ'], cnt['failed'], cnt['skipped']))
+    failed_days = sorted(x for x in failed if x[2] == 'run')
+    for station in sorted(set(x[0] for x in failed_days)):
+        days = [x[1] for x in failed_days if x[0] == station]
+        logger.warning('{} days of {} failed or were skipped: {}'.format(
+            len(days), station, ', '.join(days)))
+    return cnt
+
+
+if __name__ == '__main__':
+    """run the whole gipsyX pipeline (drdump, edit30hr, run and post) for
+    several stations in $PWORK with one command, e.g.,
+    python gipsyx_scheduler.py --station tela alon --jobs 8
+    --status only prints what is done for each station and stage."""
+    import argparse
+    import sys
+    from pathlib import Path
+    from aux_gps import configure_logger
+    from aux_gps import get_var
+    from run_gipsyx import check_abs_int
+    import pandas as pd
+    logger = configure_logger(name='gipsyx')
+    parser = argparse.ArgumentParser(
+        description='a command line tool for running the gipsyX pipeline for' +
+        ' several stations on a local process pool.')
+    optional = parser._action_groups.pop()
+    required = parser.add_argument_group('required arguments')
+    required.add_argument('--station', help="GPS station name four lowercase letters,",
+                          nargs='+', type=check_station_name)
+    optional.add_argument('--daterange', help='add specific date range, can be one day',
+                          type=str, nargs=2)
+    optional.add_argument(
+        '--staDb',
+        help='add a station DB file for antennas and receivers in $PWCORE',
+        type=str)
+    optional.add_argument('--tree', help='gipsyX tree directory in $PWCORE.',
+                          type=str)
+    optional.add_argument('--iqr_k', help='iqr k data filter criterion',
+                          type=float)
+    optional.add_argument('--jobs', help='number of tasks to run at once',
+                          type=check_abs_int)
+    optional.add_argument('--status', action='store_true',
+                          help='only print the done/total nodes per stage')
+    parser._action_groups.append(optional)  # added this line
+    parser.set_defaults(jobs=4, status=False)
+    args = parser.parse_args()
+    if args.station is None:
+        print('station is a required argument, run with -h...')
+        sys.exit()
+    pwpath = get_var('PWCORE')
+    workpath = get_var('PWORK')
+    if pwpath is None:
+        raise ValueError('Put source code folder at $PWCORE')
+    if workpath is None:
+        raise ValueError('Put source code folder at $PWORK')
+    pwpath = Path(pwpath)
+    workpath = Path(workpath)
+    isr_stations = pd.read_csv(pwpath / 'stations_approx_loc.txt',
+                               delim_whitespace=True)
+    isr_stations = isr_stations.index.tolist()
+    if args.station == ['isr1']:
+        args.station = isr_stations
+    # use ISR stations db for israeli stations and ocean loading also:
+    if all(a in isr_stations for a in args.station) and args.tree is None and args.staDb is None:
+        args.tree = pwpath / 'my_trees/ISROcnld'
+        args.staDb = pwpath / 'ALL.staDb'
+    else:
+        if args.staDb is not None:
+            args.staDb = pwpath / args.staDb
+        else:
+            args.staDb = pwpath / 'ALL.staDb'
+        if args.tree is not None:
+            args.tree = pwpath / args.tree
+        else:
+            args.tree = Path(' ')
+    graph = build_task_graph(workpath, args.station, args.staDb, args.tree,
+                             args.daterange, args.iqr_k)
+    print(graph_status(graph))
+    if args.status:
+        sys.exit()
+    if get_var('GCORE') is None:
+        raise ValueError('Run source ~/GipsyX-1.1/rc_GipsyX.sh first !')
+    run_task_graph(graph, args.jobs)
+    print(graph_status(graph))
@@ -104,6 +104,231 @@ def parse_cv_results(grid_search_cv):
     return cds
 
 
+def compute_lapse_rate_series(tdf, T_alts, lapse_min=5.0, lapse_max=10.0):
+    """least squares slope of temperature vs. altitude for every timestamp of
+    tdf(time X stations dataframe, NaNs allowed) at once with masked sums,
+    T_alts are the stations altitudes in meters. returns the absolute slope
+    in K/km clipped to lapse_min-lapse_max as a series with tdf index(NaN
+    where less than two stations are available)"""
+    import numpy as np
+    import pandas as pd
+    y = tdf.values.astype(float)
+    mask = ~np.isnan(y)
+    x = np.where(mask, np.asarray(T_alts, dtype=float)[None, :], 0.0)
+    y = np.where(mask, y, 0.0)
+    n = mask.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(mask, x - x_mean[:, None], 0.0)
+        dy = np.where(mask, y - y_mean[:, None], 0.0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    slope[n < 2] = np.nan
+    lapse_rate = np.clip(np.abs(slope) * 1000.0, lapse_min, lapse_max)
+    return pd.Series(lapse_rate, index=tdf.index, name='lapse_rate')
+
+
+def variogram_function(variogram_model='spherical'):
+    """return the variogram function(params, d) of variogram_model with the
+    same parameters as in pykrige"""
+    import numpy as np
+
+    def linear(m, d):
+        return m[0] * d + m[1]
+
+    def power(m, d):
+        return m[0] * d**m[1] + m[2]
+
+    def gaussian(m, d):
+        return m[0] * (1. - np.exp(-d**2. / (m[1] * 4. / 7.)**2.)) + m[2]
+
+    def exponential(m, d):
+        return m[0] * (1. - np.exp(-d / (m[1] / 3.))) + m[2]
+
+    def spherical(m, d):
+        d = np.asarray(d, dtype=float)
+        return np.where(d <= m[1],
+                        m[0] * ((3. * d) / (2. * m[1]) -
+                                (d**3.) / (2. * m[1]**3.)) + m[2],
+                        m[0] + m[2])
+    funcs = {'linear': linear, 'power': power, 'gaussian': gaussian,
+             'exponential': exponential, 'spherical': spherical}
+    if variogram_model not in funcs.keys():
+        raise Exception('{} is not supported yet...'.format(variogram_model))
+    return funcs[variogram_model]
+
+
+def fit_variogram_model(lags, semivariance, variogram_model='spherical'):
+    """fit the variogram model parameters to the experimental semivariance
+    the same way pykrige does it (soft l1 least squares)"""
+    from scipy.optimize import least_squares
+    import numpy as np
+    func = variogram_function(variogram_model)
+    smax = np.amax(semivariance)
+    smin = np.amin(semivariance)
+    if variogram_model == 'linear':
+        x0 = [(smax - smin) / (np.amax(lags) - np.amin(lags)), smin]
+        bnds = ([0., 0.], [np.inf, smax])
+    elif variogram_model == 'power':
+        x0 = [(smax - smin) / (np.amax(lags) - np.amin(lags)), 1.1, smin]
+        bnds = ([0., 0.001, 0.], [np.inf, 1.999, smax])
+    else:
+        x0 = [smax - smin, 0.25 * np.amax(lags), smin]
+        bnds = ([0., 0., 0.], [10. * smax, np.amax(lags), smax])
+    res = least_squares(lambda m: func(m, lags) - semivariance, x0,
+                        bounds=bnds, loss='soft_l1')
+    return res.x
+
+
+def knn_interpolate_batched(X, Y, Xp, n_neighbors=5):
+    """inverse distance weighted n_neighbors interpolation(like sklearn's
+    KNeighborsRegressor with weights='distance') of all the rows of Y(time X
+    points at X) to Xp at once. all rows of Y must share the same points."""
+    from scipy.spatial.distance import cdist
+    import numpy as np
+    k = min(n_neighbors, X.shape[0])
+    dist = cdist(Xp, X)
+    ind = np.argsort(dist, axis=1, kind='stable')[:, :k]
+    dist = np.take_along_axis(dist, ind, axis=1)
+    with np.errstate(divide='ignore'):
+        w = 1.0 / dist
+    inf_mask = np.isinf(w)
+    inf_row = np.any(inf_mask, axis=1)
+    w[inf_row] = inf_mask[inf_row]
+    W = np.zeros((Xp.shape[0], X.shape[0]))
+    np.put_along_axis(W, ind, w / w.sum(axis=1)[:, None], axis=1)
+    return Y @ W.T
+
+
+def okrig_interpolate_batched(X, Y, Xp, variogram_model='spherical',
+                              nlags=6, n_closest_points=10, eps=1e-10,
+                              chunk=2000):
+    """ordinary kriging(like pykrige's Krige with method='ordinary') of all
+    the rows of Y(time X points at X) to Xp. the distances, lag bins and the
+    n_closest_points neighbours of Xp are computed once, the experimental
+    variograms of all rows are computed at once and the kriging systems
+    are solved in stacked chunks. the variogram model is still fitted to
+    each row since its parameters depend on the values."""
+    from scipy.spatial.distance import cdist
+    from scipy.spatial.distance import pdist
+    import numpy as np
+    func = variogram_function(variogram_model)
+    n = X.shape[0]
+    # pykrige shifts the coords to their center and back, keep its rounding
+    # since the variogram fit is sensitive to it:
+    center = (np.amax(X, axis=0) + np.amin(X, axis=0)) / 2.0
+    X = (X - center) + center
+    Xp = (Xp - center) + center
+    # experimental variogram lag bins (depend only on the points):
+    d = pdist(X)
+    ii, jj = np.triu_indices(n, k=1)
+    dmin = np.amin(d)
+    dmax = np.amax(d)
+    dd = (dmax - dmin) / nlags
+    bins = [dmin + i * dd for i in range(nlags)] + [dmax + 0.001]
+    lag_masks = [(d >= bins[i]) & (d < bins[i + 1]) for i in range(nlags)]
+    lag_masks = [x for x in lag_masks if x.any()]
+    lags = np.array([d[x].mean() for x in lag_masks])
+    g = 0.5 * (Y[:, ii] - Y[:, jj])**2.0
+    # 1D means of each row to keep the summation order of pykrige:
+    params = [fit_variogram_model(lags, np.array([row[x].mean() for x in
+                                                  lag_masks]),
+                                  variogram_model) for row in g]
+    # the moving window of the closest points to each predicted point:
+    k = min(n_closest_points, n)
+    dist = cdist(Xp, X)
+    ind = np.argsort(dist, axis=1, kind='stable')[:, :k]
+    bd = np.take_along_axis(dist, ind, axis=1)
+    dfull = cdist(X, X)
+    dsub = dfull[ind[:, :, None], ind[:, None, :]]
+    m = Xp.shape[0]
+    diag = np.eye(k, dtype=bool)
+    zvalues = np.empty((Y.shape[0], m))
+    for start in range(0, Y.shape[0], chunk):
+        rows = range(start, min(start + chunk, Y.shape[0]))
+        a = np.ones((len(rows), m, k + 1, k + 1))
+        b = np.ones((len(rows), m, k + 1))
+        for r, row in enumerate(rows):
+            a[r, :, :k, :k] = -func(params[row], dsub)
+            b[r, :, :k] = -func(params[row], bd)
+        a[:, :, :k, :k][..., diag] = 0.0
+        a[:, :, k, k] = 0.0
+        b[:, :, :k][:, np.abs(bd) <= eps] = 0.0
+        x = np.linalg.solve(a, b[..., None])[..., :k, 0]
+        zvalues[start: start + len(rows)] = np.sum(x * Y[start: start + len(rows)][:, ind], axis=-1)
+    return zvalues
+
+
+def interpolate_ims_to_gnss_batched(values, X, Xp, method='okrig',
+                                    variogram='spherical', n_neighbors=3):
+    """interpolate values(time X ims stations, NaNs allowed) at ims coords X
+    to coords Xp for all times: times are grouped by their ims stations
+    availability mask and each group is interpolated at once"""
+    import numpy as np
+    valid = ~np.isnan(values)
+    masks, inverse = np.unique(valid, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    out = np.full((values.shape[0], Xp.shape[0]), np.nan)
+    for i, mask in enumerate(masks):
+        if not mask.any():
+            continue
+        rows = np.flatnonzero(inverse == i)
+        Y = values[np.ix_(rows, mask)]
+        if method == 'okrig':
+            if variogram is None:
+                variogram = 'linear'
+            out[rows] = okrig_interpolate_batched(X[mask], Y, Xp, variogram)
+        elif method == 'knn':
+            if n_neighbors is None:
+                n_neighbors = 5
+            out[rows] = knn_interpolate_batched(X[mask], Y, Xp, n_neighbors)
+        else:
+            raise Exception('{} is not supported yet...'.format(method))
+    return out
+
+
+def interpolate_ims_to_gnss_one_year(year, file, end, X, Xp, T_alts, gnss_df,
+                                     lapse_rate=6.5, method='okrig',
+                                     variogram='spherical', n_neighbors=3,
+                                     savepath=ims_path):
+    """interpolate the IMS 10 mins TD of year(up to end) in file to the GNSS
+    stations in gnss_df(coords Xp) and save GNSS_TD_<year>.nc. only the
+    year's slice of file is read. lapse_rate 'dynamic' is fitted to every
+    timestep. returns the saved filename or None if there is no data."""
+    import pandas as pd
+    import xarray as xr
+    ds = xr.open_dataset(file)
+    time_dim = list(set(ds.dims))[0]
+    tdf = ds.sel({time_dim: slice(str(year), end)}).sel(
+        {time_dim: str(year)}).to_dataframe()
+    ds.close()
+    if tdf.empty:
+        return None
+    print('working on {}'.format(year))
+    if lapse_rate == 'dynamic':
+        # the lapse rate of each timestep:
+        lr = compute_lapse_rate_series(tdf, T_alts).values[:, None]
+    else:
+        lr = lapse_rate
+    # neutrilize the lapse rate effect:
+    values = tdf.values + lr * T_alts / 1000.0
+    inter = interpolate_ims_to_gnss_batched(values, X, Xp, method, variogram,
+                                            n_neighbors)
+    # fix for lapse rate:
+    inter -= lr * gnss_df['alt'].values / 1000.0
+    da = xr.DataArray(inter, dims=['time', 'station'])
+    da['station'] = gnss_df.index
+    da['time'] = pd.to_datetime(tdf.index.strftime('%Y-%m-%d %H:%M'))
+    da = da.sortby('time')
+    ds = da.to_dataset(dim='station')
+    for da in ds:
+        ds[da].attrs['units'] = 'degC'
+    filename = 'GNSS_TD_{}.nc'.format(year)
+    ds.to_netcdf(savepath / filename, 'w')
+    print('saved {} to {}'.format(filename, savepath))
+    return filename
+
+
 def IMS_interpolating_to_GNSS_stations_israel(dt='2013-10-19T22:00:00',
                                               stations=None,
                                               lapse_rate='auto',
@@ -114,7 +339,14 @@ def IMS_interpolating_to_GNSS_stations_israel(dt='2013-10-19T22:00:00',
                                               cut_days_ago=3,
                                               plot=False,
                                               verbose=False,
-                                              savepath=ims_path):
+                                              savepath=ims_path,
+                                              batched=True,
+                                              jobs=1):
+    """interpolate the IMS 10 mins TD to the israeli GNSS stations for dt,
+    or for the whole archive(dt=None) saving GNSS_TD_<year>.nc files with
+    jobs processes(one year each). use batched=False for the old per
+    timestep model fitting. lapse_rate is in K/km, 'auto' fits it to the
+    first timestep and 'dynamic'(batched only) fits it to every timestep."""
     from pykrige.rk import Krige
     import pandas as pd
     from aux_gps import path_glob
@@ -179,18 +411,13 @@ def IMS_interpolating_to_GNSS_stations_israel(dt='2013-10-19T22:00:00',
         # Tloc_df = Tloc_df.join(ts, how='right')
         # Tloc_df = Tloc_df.dropna(axis=0)
         ts_vs_alt = pd.Series(ts.values, index=T_alts)
-        ts_vs_alt_for_fit = ts_vs_alt.dropna()
-        [a, b] = np.polyfit(ts_vs_alt_for_fit.index.values,
-                            ts_vs_alt_for_fit.values, 1)
         if lapse_rate == 'auto':
-            lapse_rate = np.abs(a) * 1000
-            if lapse_rate < 5.0:
-                lapse_rate = 5.0
-            elif lapse_rate > 10.0:
-                lapse_rate = 10.0
+            lapse_rate = compute_lapse_rate_series(
+                tdf.loc[[dt], :], T_alts).item()
         return ts_vs_alt, lapse_rate
 #    import time
-    dt = pd.to_datetime(dt)
+    if dt is not None:
+        dt = pd.to_datetime(dt)
     # read Israeli GNSS sites coords:
     df = pd.read_csv(
             cwd /
@@ -221,6 +448,37 @@ def IMS_interpolating_to_GNSS_stations_israel(dt='2013-10-19T22:00:00',
     T_alts = np.array([ds[x].attrs['station_alt'] for x in ds])
     T_lats = np.array([ds[x].attrs['station_lat'] for x in ds])
     T_lons = np.array([ds[x].attrs['station_lon'] for x in ds])
+    if dt is None and batched:
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures import as_completed
+        # the ims coords as in prepare_Xy:
+        X = np.column_stack([np.linspace(T_lons.min(), T_lons.max(), T_lons.shape[0]),
+                             np.linspace(T_lats.min(), T_lats.max(), T_lats.shape[0])])
+        end = None
+        if cut_days_ago is not None:
+            # use cut_days_ago to drop last x days of data:
+            end = pd.Timestamp(ds[time_dim].values[-cut_days_ago * 144 - 1])
+            print('last date to be handled is {}'.format(end))
+        if lapse_rate == 'auto':
+            # the per timestep loop keeps the lapse rate of its first
+            # timestep for the whole archive:
+            first = ds.isel({time_dim: [0]}).to_dataframe()
+            lapse_rate = compute_lapse_rate_series(first, T_alts).item()
+        ds.close()
+        args = (file, end, X, gps_lons_lats_as_cols, T_alts, df, lapse_rate,
+                method, variogram, n_neighbors, savepath)
+        if jobs == 1:
+            for year in years:
+                interpolate_ims_to_gnss_one_year(year, *args)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(interpolate_ims_to_gnss_one_year,
+                                           year, *args) for year in years]
+                for future in as_completed(futures):
+                    future.result()
+        print('concatenating all TD years...')
+        concat_GNSS_TD(savepath)
+        return
     print('loading IMS_TD of israeli stations 10mins freq..')
     # transform to dataframe and add coords data to df:
     tdf = ds.to_dataframe()
@@ -461,7 +719,8 @@ def resample_GNSS_TD(path=ims_path):
 def concat_GNSS_TD(path=ims_path):
     import xarray as xr
     from aux_gps import path_glob
-    files = path_glob(path, 'GNSS_TD_*.nc')
+    files = [x for x in path_glob(path, 'GNSS_TD_*.nc') if 'ALL' not in
+             x.as_posix().split('/')[-1]]
     years = sorted([file.as_posix().split('/')[-1].split('_')[-1].split('.')[0]
                     for file in files])
     ds_list = [xr.open_dataset(x) for x in files]
@@ -1186,119 +1445,181 @@ def ims_api_get_meta(active_only=True, channel_name='TD'):
 #    return
 
 
+def fix_10mins_ims_station(da, meta, field='TD'):
+    """fix the lat/lon/alt of the 10mins ims station da from meta(see
+    read_ims_metadata_from_files) and slice its irrelevant data. returns None
+    for stations that should be skipped"""
+    sid = da.attrs['station_id']
+    row = meta[meta.ID == sid]
+    if da.name == 'ARIEL':
+        da = da.loc['2000-09-01':]
+        print('{} station is sliced!'.format(da.name))
+    elif da.name == 'TEL-YOSEF-20141223':
+        da = da.loc['2007-10-01':]
+        row = meta[meta.ID == 380]
+        print('{} station is sliced and fixed!'.format(da.name))
+    elif da.name == 'PARAN-20060124':
+        da = da.loc['1995-04-01':]
+        row = meta[meta.ID == 207]
+        print('{} station is fixed!'.format(da.name))
+    elif da.name == 'MIZPE-RAMON-20120927':
+        row = meta[meta.ID == 379]
+        print('{} station is fixed!'.format(da.name))
+    elif da.name == 'SHANI':
+        da = da.loc['1995-12-01':]
+        print('{} station is sliced!'.format(da.name))
+    elif da.name == 'BET-ZAYDA':
+        da = da.loc['1995-12-01':]
+        print('{} station is sliced!'.format(da.name))
+    elif da.name == 'BEER-SHEVA-UNI':
+        print('skipping {} station...'.format(da.name))
+        return None
+    no_row_in_meta = row.empty
+    assert not no_row_in_meta
+    if field == 'Rain':
+        if da.name == 'YOTVATA':
+            da = da.loc['2009-09-01':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'ELAT':
+            da = da.loc['2002-11-25':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'ELON':
+            da = da.loc['1999-02-01':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'QEVUZAT-YAVNE':
+            da = da.loc['2000-02-05':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'ZOMET-HANEGEV':
+            da = da.loc['2005-11-21':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'JERUSALEM-CENTRE':
+            da = da.loc['1995-11-13':]
+            print('{} station is sliced!'.format(da.name))                
+        elif da.name == 'NETIV-HALAMED-HE':
+            da = da.loc['1995-10-15':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'GAT':
+            da = da.loc['2007-10-01':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'AVNE-ETAN':
+            da = da.loc['1993-07-01':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'ROSH-HANIQRA':
+            da = da.loc['2007-09-01':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'TAVOR-KADOORIE':
+            da = da.loc['1995-01-15':]
+            print('{} station is sliced!'.format(da.name))
+        elif da.name == 'EN-KARMEL':
+            da = da.loc['1993-12-01':]
+            print('{} station is sliced!'.format(da.name))
+    # if no_row_in_meta:
+    #     print('{} not exist in meta'.format(da.name))
+    da.attrs['station_lat'] = row.lat.values.item()
+    da.attrs['station_lon'] = row.lon.values.item()
+    da.attrs['station_alt'] = row.alt.values.item()
+    return da
+
+
+def fill_one_10mins_ims_station(file_and_path, meta, unique_index=True,
+                                clim='dayofyear', savepath=ims_10mins_path):
+    """fix and fill one 10mins TD ims station file and save it to a
+    _10mins_filled.nc file in savepath, returns the filename or None"""
+    import xarray as xr
+    da = xr.open_dataarray(file_and_path)
+    da = fix_10mins_ims_station(da, meta, 'TD')
+    if da is None:
+        return None
+    fill_missing_single_ims_station(da, unique_index=unique_index,
+                                    clim_period=clim, savepath=savepath,
+                                    verbose=False)
+    return '{}_{}_{}_10mins_filled.nc'.format(da.name, da.attrs['station_id'],
+                                              da.attrs['channel_name'])
+
+
+def stream_stations_to_store(store, files, time, chunk=52560):
+    """write the station dataarrays in files(a generator is fine) one at a
+    time as station fields of the netcdf4 store over the common time, each
+    compressed and chunked along time. only one station is held in memory.
+    time must include all the stations times, otherwise their data is lost"""
+    import xarray as xr
+    tmp_store = store.parent / '{}.tmp'.format(store.name)
+    xr.Dataset(coords={'time': time}).to_netcdf(tmp_store, 'w')
+    chunk = min(chunk, len(time))
+    for file in files:
+        da = xr.load_dataarray(file)
+        assert da.indexes['time'].isin(time).all()
+        da = da.reindex(time=time)
+        encoding = {da.name: dict(zlib=True, complevel=9, chunksizes=(chunk,))}
+        da.drop_vars('time').to_dataset().to_netcdf(tmp_store, 'a',
+                                                    encoding=encoding)
+        print('{} was added to {}'.format(da.name, store.name))
+    tmp_store.replace(store)
+    return store
+
+
 def fill_fix_all_10mins_IMS_stations(path=ims_10mins_path,
                                      savepath=ims_path,
                                      unique_index=True, field='TD',
-                                     clim='dayofyear', fix_only=False):
+                                     clim='dayofyear', fix_only=False,
+                                     jobs=1):
     """loop over all TD 10mins stations and first fix their lat/lon/alt from
     metadata file and then fill them with clim, then save them
-    use specific station names to slice irrelevant data"""
+    use specific station names to slice irrelevant data.
+    when filling TD, the stations are processed concurrently using jobs
+    processes and streamed one at a time into IMS_TD_israeli_10mins_filled.nc
+    (station fields chunked along time) so that only one station is in memory"""
     import xarray as xr
+    import pandas as pd
     from aux_gps import path_glob
+    from concurrent.futures import ProcessPoolExecutor, as_completed
     # TODO: redo this analysis with adding the hourly TD data
     meta = read_ims_metadata_from_files(freq='10mins')
     files = path_glob(path, '*{}_10mins.nc'.format(field))
+    if field == 'TD' and not fix_only:
+        print('filling in missing data for {} stations using {} jobs'.format(
+              len(files), jobs))
+        filled = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(fill_one_10mins_ims_station, file,
+                                       meta, unique_index, clim, path)
+                       for file in files]
+            for cnt, future in enumerate(as_completed(futures)):
+                filename = future.result()
+                print('post-proccessed {}, ({}/{})'.format(filename, cnt + 1,
+                                                          len(files)))
+                if filename is not None:
+                    filled.append(path / filename)
+        print('Done filling all stations!')
+        if savepath is None:
+            return filled
+        # common time axis for all the stations, the union of their times
+        # (so that stations with shifted timestamps keep all their data):
+        time = pd.DatetimeIndex([], name='time')
+        for file in filled:
+            with xr.open_dataarray(file) as da:
+                time = time.union(da.indexes['time'])
+        time.name = 'time'
+        filename = 'IMS_TD_israeli_10mins_filled.nc'
+        print('streaming all stations to {} in {}'.format(filename, savepath))
+        stream_stations_to_store(savepath / filename, sorted(filled), time)
+        print('Done!')
+        return xr.open_dataset(savepath / filename)
     cnt = 1
     da_list = []
     for file_and_path in files:
         da = xr.open_dataarray(file_and_path)
         print('post-proccessing {} data for {} station, ({}/{})'.format(field,
               da.name, cnt, len(files)))
-        sid = da.attrs['station_id']
-        row = meta[meta.ID == sid]
-        if da.name == 'ARIEL':
-            da = da.loc['2000-09-01':]
-            print('{} station is sliced!'.format(da.name))
-        elif da.name == 'TEL-YOSEF-20141223':
-            da = da.loc['2007-10-01':]
-            row = meta[meta.ID == 380]
-            print('{} station is sliced and fixed!'.format(da.name))
-        elif da.name == 'PARAN-20060124':
-            da = da.loc['1995-04-01':]
-            row = meta[meta.ID == 207]
-            print('{} station is fixed!'.format(da.name))
-        elif da.name == 'MIZPE-RAMON-20120927':
-            row = meta[meta.ID == 379]
-            print('{} station is fixed!'.format(da.name))
-        elif da.name == 'SHANI':
-            da = da.loc['1995-12-01':]
-            print('{} station is sliced!'.format(da.name))
-        elif da.name == 'BET-ZAYDA':
-            da = da.loc['1995-12-01':]
-            print('{} station is sliced!'.format(da.name))
-        elif da.name == 'BEER-SHEVA-UNI':
-            print('skipping {} station...'.format(da.name))
+        da = fix_10mins_ims_station(da, meta, field)
+        if da is None:
             continue
-        no_row_in_meta = row.empty
-        assert not no_row_in_meta
-        if field == 'Rain':
-            if da.name == 'YOTVATA':
-                da = da.loc['2009-09-01':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'ELAT':
-                da = da.loc['2002-11-25':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'ELON':
-                da = da.loc['1999-02-01':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'QEVUZAT-YAVNE':
-                da = da.loc['2000-02-05':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'ZOMET-HANEGEV':
-                da = da.loc['2005-11-21':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'JERUSALEM-CENTRE':
-                da = da.loc['1995-11-13':]
-                print('{} station is sliced!'.format(da.name))                
-            elif da.name == 'NETIV-HALAMED-HE':
-                da = da.loc['1995-10-15':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'GAT':
-                da = da.loc['2007-10-01':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'AVNE-ETAN':
-                da = da.loc['1993-07-01':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'ROSH-HANIQRA':
-                da = da.loc['2007-09-01':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'TAVOR-KADOORIE':
-                da = da.loc['1995-01-15':]
-                print('{} station is sliced!'.format(da.name))
-            elif da.name == 'EN-KARMEL':
-                da = da.loc['1993-12-01':]
-                print('{} station is sliced!'.format(da.name))
-        # if no_row_in_meta:
-        #     print('{} not exist in meta'.format(da.name))
-        da.attrs['station_lat'] = row.lat.values.item()
-        da.attrs['station_lon'] = row.lon.values.item()
-        da.attrs['station_alt'] = row.alt.values.item()
-        if field == 'TD' and not fix_only:
-            fill_missing_single_ims_station(da, unique_index=unique_index,
-                                            clim_period=clim, savepath=path,
-                                            verbose=False)
-        elif field == 'TD' and fix_only:
-            da_list.append(da)
-        else:
-            da_list.append(da)
+        da_list.append(da)
         cnt += 1
-    if field == 'TD' and not fix_only:
-        print('Done filling all stations!')
-        files = path_glob(path, '*TD_10mins_filled.nc')
-        dsl = [xr.open_dataarray(file) for file in files]
-    elif field == 'TD' and fix_only:
-        dsl = da_list
-    else:
-        dsl = da_list
     print('merging all files...')
-    ds = xr.merge(dsl)
+    ds = xr.merge(da_list)
     if savepath is not None:
-        if field == 'TD' and not fix_only:
-            filename = 'IMS_TD_israeli_10mins_filled.nc'
-        elif field == 'TD' and fix_only:
-            filename = 'IMS_{}_israeli_10mins.nc'.format(field)
-        else:
-            filename = 'IMS_{}_israeli_10mins.nc'.format(field)
+        filename = 'IMS_{}_israeli_10mins.nc'.format(field)
         print('saving {} to {}'.format(filename, savepath))
         comp = dict(zlib=True, complevel=9)  # best compression
         encoding = {var: comp for var in ds.data_vars}
@@ -1328,6 +1649,75 @@ def fill_fix_all_10mins_IMS_stations(path=ims_10mins_path,
 #    return ds
 
 
+def gather_clim_and_diurnal(clim, clim_keys, diurnal, hours, time,
+                            clim_period='dayofyear'):
+    """return the climatology(clim, with clim_keys periods) plus the diurnal
+    anomaly(diurnal, with hours) values for all of time(DatetimeIndex) with
+    integer indexing, NaN where the period or hour is missing"""
+    import numpy as np
+    import pandas as pd
+    ci = pd.Index(clim_keys).get_indexer(getattr(time, clim_period))
+    hi = pd.Index(hours).get_indexer(time.hour)
+    values = np.asarray(clim)[ci] + np.asarray(diurnal)[hi]
+    values[(ci < 0) | (hi < 0)] = np.nan
+    return values
+
+
+def fill_missing_ims_stations(ds, clim_period='dayofyear', verbose=True):
+    """fill in the missing time data of all the ims stations in ds(station
+    fields over a common time) in one call with the clim_period long term
+    mean and the hourly diurnal anomaly. each station is reindexed to its own
+    regular grid between its first and last valid times, so the output of
+    each station is the same as fill_missing_single_ims_station. returns the
+    filled dataset"""
+    import numpy as np
+    import pandas as pd
+    import xarray as xr
+    # make sure no coords are in xarray:
+    ds = ds.reset_coords(drop=True)
+    grpby = 'time.{}'.format(clim_period)
+    if verbose:
+        print('computing anomalies:')
+    climatology = ds.groupby(grpby).mean('time')
+    anom = ds.groupby(grpby) - climatology
+    if verbose:
+        print('computing diurnal change:')
+    diurnal = anom.groupby('time.hour').mean('time')
+    if verbose:
+        print('proccessing missing data...')
+    da_list = []
+    for name in ds.data_vars:
+        da = ds[name].dropna('time')
+        if da.size < 3:
+            continue
+        old_time = pd.to_datetime(da.time.values)
+        freq = pd.infer_freq(old_time)
+        if freq is None:
+            # the station has gaps, use its most common step:
+            freq = pd.Series(np.diff(old_time.values)).mode()[0]
+        new_time = pd.date_range(old_time.min(), old_time.max(), freq=freq)
+        missing_time = new_time[~new_time.isin(old_time)]
+        missing_data = gather_clim_and_diurnal(climatology[name].values,
+                                               climatology[clim_period].values,
+                                               diurnal[name].values,
+                                               diurnal['hour'].values,
+                                               missing_time, clim_period)
+        series = pd.Series(data=missing_data, index=missing_time)
+        series.index.name = 'time'
+        mda = series.to_xarray()
+        mda.name = name
+        new_data = xr.concat([mda, da], 'time').sortby('time')
+        new_data.attrs = ds[name].attrs
+        new_data.attrs['description'] = 'missing data was '\
+                                        'replaced by using ' + clim_period \
+                                        + ' mean and hourly signal.'
+        da_list.append(new_data)
+    filled = xr.merge(da_list)
+    if verbose:
+        print('done!')
+    return filled
+
+
 def fill_missing_single_ims_station(da, unique_index=True,
                                     clim_period='dayofyear', savepath=None,
                                     verbose=True):
@@ -1336,8 +1726,8 @@ def fill_missing_single_ims_station(da, unique_index=True,
         month, weekofyear, dayofyear. return a dataset with original and filled
         dataarray"""
     # da should be dattaarray and not dataset!
-    import pandas as pd
     import numpy as np
+    import pandas as pd
     import xarray as xr
     from aux_gps import get_unique_index
     print('filling in missing data for {}'.format(da.name))
@@ -1379,21 +1769,20 @@ def fill_missing_single_ims_station(da, unique_index=True,
         print('assembeling missing data:')
     old_time = pd.to_datetime(da_no_nans.time.values)
     freq = pd.infer_freq(da.time.values)
+    if freq is None:
+        # the station has gaps, use its most common step:
+        freq = pd.Series(np.diff(old_time.values)).mode()[0]
     new_time = pd.date_range(da_no_nans.time.min().item(),
                              da_no_nans.time.max().item(), freq=freq)
-    missing_time = pd.to_datetime(
-        sorted(
-            set(new_time).difference(
-                set(old_time))))
-    missing_data = np.empty((missing_time.shape))
+    missing_time = new_time[~new_time.isin(old_time)]
     if verbose:
         print('proccessing missing data...')
-    for i in range(len(missing_data)):
-        # replace data as to monthly long term mean and diurnal hour:
-        # missing_data[i] = (climatology.sel(month=missing_time[i].month) +
-        missing_data[i] = (climatology.sel({clim_period: getattr(missing_time[i],
-                                                                 clim_period)}) +
-                           diurnal.sel(hour=missing_time[i].hour))
+    # replace data as to long term clim_period mean and diurnal hour:
+    missing_data = gather_clim_and_diurnal(climatology.values,
+                                           climatology[clim_period].values,
+                                           diurnal.values,
+                                           diurnal['hour'].values,
+                                           missing_time, clim_period)
     series = pd.Series(data=missing_data, index=missing_time)
     series.index.name = 'time'
     mda = series.to_xarray()
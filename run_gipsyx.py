@@ -8,6 +8,7 @@ Methodology:
     datarecords files
     2) run code with --gd2e 30hr or --gd2e 24hr for either solve ppp on 24hr
     folder or 30hr folder
+    all of the above can run on several files at once with --jobs N
 @author: ziskin
 """
 
@@ -43,13 +44,82 @@ def move_files(path_orig, path_dest, files, out_files=None, verbose=False):
     return
 
 
+def compute_30hr_eligibility(rinex):
+    """rinex is a daily series of rinex file names(NaN for missing days).
+    return the 30hr flag series: 1 for a day with both neighbours present
+    (can be merged to 30hr), 0 for a lonely day (or the first/last day) and
+    NaN for a missing day"""
+    import numpy as np
+    import pandas as pd
+    present = rinex.notnull().values
+    flag = np.full(present.shape, np.nan)
+    if present.size == 0:
+        return pd.Series(flag, index=rinex.index, name='30hr')
+    both = np.zeros(present.shape, dtype=bool)
+    both[1:-1] = present[:-2] & present[2:]
+    flag[present] = 0
+    flag[present & both] = 1
+    flag[0] = 0
+    flag[-1] = 0
+    return pd.Series(flag, index=rinex.index, name='30hr')
+
+
+def compute_30hr_eligibility_loop(df):
+    """the original day by day loop over 3-day windows of df (rinex
+    column first), kept as a reference for compute_30hr_eligibility"""
+    import numpy as np
+    df = df[['rinex']].copy()
+    df['30hr'] = np.nan
+    df.iat[0, 1] = 0
+    df.iat[-1, 1] = 0
+    for i in range(1, len(df)-1):
+        nums = np.array([i-1, i, i+1])
+        nan3days = df.iloc[nums, 0].isnull().values
+        if not nan3days[0] and not nan3days[1] and not nan3days[2]:
+            df.iat[i, 1] = 1
+        elif not nan3days[0] and not nan3days[1] and nan3days[2]:
+            df.iat[i, 1] = 0
+        elif nan3days[0] and not nan3days[1] and not nan3days[2]:
+            df.iat[i, 1] = 0
+        elif not nan3days[1] and nan3days[0] and nan3days[2]:
+            df.iat[i, 1] = 0
+    return df['30hr']
+
+
+def benchmark_30hr_eligibility(years=30, gap_frac=0.1, seed=42):
+    """compare compute_30hr_eligibility to the day by day loop on a synthetic
+    daily calendar of years with random gaps(gap_frac of the days)"""
+    import numpy as np
+    import pandas as pd
+    import time
+    rng = np.random.default_rng(seed)
+    time_index = pd.date_range('1990-01-01', periods=int(years * 365.25),
+                               freq='1D')
+    rinex = pd.Series(['tela{:03d}0.{:02d}d'.format(x.dayofyear, x.year % 100)
+                       for x in time_index], index=time_index, dtype=object)
+    gaps = rng.random(len(rinex)) < gap_frac
+    gaps[0] = gaps[-1] = False
+    rinex[gaps] = np.nan
+    df = rinex.to_frame('rinex')
+    t0 = time.perf_counter()
+    loop = compute_30hr_eligibility_loop(df)
+    t_loop = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    vect = compute_30hr_eligibility(df['rinex'])
+    t_vect = time.perf_counter() - t0
+    if not np.array_equal(loop.values, vect.values, equal_nan=True):
+        raise ValueError('vectorized 30hr flags differ from the loop!')
+    print('{} days, {} gaps: loop {:.3f} s, vectorized {:.5f} s ({:.0f}x)'.format(
+        len(df), gaps.sum(), t_loop, t_vect, t_loop / t_vect))
+    return t_loop, t_vect
+
+
 def read_organize_rinex(path, glob_str='*.Z', date_range=None):
     """read and organize the rinex file names for 30 hour run"""
     from aux_gps import get_timedate_and_station_code_from_rinex
     from aux_gps import path_glob
     from aux_gps import slice_task_date_range
     import pandas as pd
-    import numpy as np
     import logging
     logger = logging.getLogger('gipsyx')
     dts = []
@@ -75,26 +145,7 @@ def read_organize_rinex(path, glob_str='*.Z', date_range=None):
     df = df.reindex(full_time)
     df.columns = ['rinex']
     df.index.name = 'time'
-    df['30hr'] = np.nan
-    df.iat[0, 1] = 0
-    df.iat[-1, 1] = 0
-    for i in range(1, len(df)-1):
-        nums = np.array([i-1, i, i+1])
-        nan3days = df.iloc[nums, 0].isnull()
-        if not nan3days[0] and not nan3days[1] and not nan3days[2]:
-            # print('all')
-            df.iat[i, 1] = 1
-        elif not nan3days[0] and not nan3days[1] and nan3days[2]:
-            # print('0')
-            df.iat[i, 1] = 0
-        elif nan3days[0] and not nan3days[1] and not nan3days[2]:
-            # print('00')
-            df.iat[i, 1] = 0
-        elif not nan3days[1] and nan3days[0] and nan3days[2]:
-            # print('000')
-            df.iat[i, 1] = 0
-        # print(i, nan3days, df.iat[i, 1])
-        # input("Press Enter to continue...")
+    df['30hr'] = compute_30hr_eligibility(df['rinex'])
     return df
 
 
@@ -118,8 +169,239 @@ def check_file_in_cwd(filename):
     return file_and_path
 
 
+def check_abs_int(num):
+    try:
+        num = int(num)
+    except ValueError:
+        raise argparse.ArgumentTypeError('{} is not an integer.'.format(num))
+    if num < 1:
+        raise argparse.ArgumentTypeError('{} should be at least 1.'.format(num))
+    return num
+
+
+def run_dataRecordDump_one_file(file_and_path, out_path, rewrite,
+                                workdir=None):
+    """runs dataRecordDump on a single rinex file (file_and_path) and saves
+    the datarecord file to out_path, logs are written in workdir(default: cwd)
+    and then moved to out_path. returns 'skipped', 'succ' or 'failed'."""
+    from pathlib import Path
+    import subprocess
+    from subprocess import CalledProcessError
+    from subprocess import TimeoutExpired
+    import logging
+    logger = logging.getLogger('gipsyx')
+    if workdir is None:
+        workdir = Path().cwd()
+    filename = file_and_path.as_posix().split('/')[-1][0:12]
+    dr_file = out_path / '{}.dr.gz'.format(filename)
+    if not rewrite:
+        if (dr_file).is_file():
+            logger.warning(
+                '{} already exists in {}, skipping...'.format(
+                    filename + '.dr.gz', out_path))
+            return 'skipped'
+    files_to_move = [filename + x for x in ['.log', '.err']]
+    command = 'dataRecordDump -rnx {} -drFileNmOut {} > {}.log 2>{}.err'.format(
+        file_and_path.as_posix(), dr_file.as_posix(), filename, filename)
+    try:
+        subprocess.run(command, shell=True, check=True, cwd=workdir)
+        status = 'succ'
+    except CalledProcessError:
+        logger.error('dataRecordDump failed on {}...'.format(filename))
+        status = 'failed'
+    except TimeoutExpired:
+        logger.error('dataRecordDump timed out on {}, copying log files.'.format(filename))
+        status = 'failed'
+        with open(workdir / files_to_move[1], 'a') as f:
+            f.write('dataRecordDump has Timed out !')
+    move_files(workdir, out_path, files_to_move)
+    return status
+
+
+def run_rnxEditGde_one_file(filename, in_path, out_path, staDb, rewrite,
+                            suffix=24, workdir=None):
+    """runs rnxEditGde on filename that exists in in_path and writes the
+    edited file (with suffix) to out_path. it first checks wether filename
+    exists in out_path and if it is, it skipps this filename. rewrite flag
+    overwrites the filename regardless. returns 'skipped', 'succ' or
+    'failed'."""
+    from pathlib import Path
+    import subprocess
+    from subprocess import CalledProcessError
+    from subprocess import TimeoutExpired
+    import logging
+    logger = logging.getLogger('gipsyx')
+    if workdir is None:
+        workdir = Path().cwd()
+    rfn = filename[0:12]
+    station = rfn[0:4].upper()
+    dr_edited_file = out_path / '{}_edited{}hr.dr.gz'.format(rfn, suffix)
+    file_and_path = in_path / filename
+    if not rewrite:
+        if (dr_edited_file).is_file():
+            logger.warning(
+                '{} already exists in {}, skipping...'.format(
+                    filename, out_path))
+            return 'skipped'
+    files_to_move = [rfn + x for x in ['.log', '.err']]
+    command = 'rnxEditGde.py -type datarecord -recNm {} -data {} -out {} -staDb {} > {}.log 2>{}.err'.format(
+        station, file_and_path.as_posix(), dr_edited_file.as_posix(),
+        staDb.as_posix(), rfn, rfn)
+    try:
+        subprocess.run(command, shell=True, check=True, cwd=workdir)
+        status = 'succ'
+    except CalledProcessError:
+        logger.error('rnxEditGde.py failed on {}...'.format(filename))
+        status = 'failed'
+    except TimeoutExpired:
+        logger.error('rnxEditGde.py timed out on {}, copying log files.'.format(rfn))
+        status = 'failed'
+        with open(workdir / files_to_move[1], 'a') as f:
+            f.write('rnxEditGde.py has Timed out !')
+    move_files(workdir, out_path, files_to_move)
+    return status
+
+
+def run_drMerge_one_triplet(filenames, in_path, duration='30hr',
+                            workdir=None):
+    """runs drMerge.py on 3 consecutive datarecords files (filenames) in
+    in_path and writes the merged file to workdir(default: cwd). returns the
+    merged file name or None if drMerge.py failed."""
+    from pathlib import Path
+    import subprocess
+    from subprocess import CalledProcessError
+    from subprocess import TimeoutExpired
+    import logging
+    from aux_gps import get_timedate_and_station_code_from_rinex
+    logger = logging.getLogger('gipsyx')
+    if workdir is None:
+        workdir = Path().cwd()
+    rfns = [x[0:12] for x in filenames]
+    dts = [get_timedate_and_station_code_from_rinex(x, True) for x in rfns]
+    if duration == '30hr':
+        start = dts[0].strftime('%Y-%m-%d') + ' 21:00:00'
+        end = dts[2].strftime('%Y-%m-%d') + ' 03:00:00'
+    rfn = rfns[1]
+    dr_merged_file = workdir / '{}_merged.dr.gz'.format(rfn)
+    logger.info('merging {}, {} and {} to {}'.format(*rfns, rfn + '_merged.dr.gz'))
+    f_and_paths = [in_path / x for x in filenames]
+    files_to_move = [rfn + x for x in ['_drmerge.log', '_drmerge.err']]
+    command = 'drMerge.py -inFiles {} {} {} -outFile {} -start {} -end {} > {}.log 2>{}.err'.format(
+            f_and_paths[0].as_posix(), f_and_paths[1].as_posix(),
+            f_and_paths[2].as_posix(), dr_merged_file.as_posix(),
+            start, end, rfn + '_drmerge', rfn + '_drmerge')
+    try:
+        subprocess.run(command, shell=True, check=True, timeout=60,
+                       cwd=workdir)
+    except CalledProcessError:
+        logger.error('drMerge.py failed on {}...'.format(filenames))
+        return None
+    except TimeoutExpired:
+        logger.error('drMerge.py timed out on {}, copying log files.'.format(filenames))
+        with open(workdir / files_to_move[1], 'a') as f:
+            f.write('drMerge.py run has Timed out !')
+        return None
+    return dr_merged_file.name
+
+
+def run_edit30hr_one_triplet(filenames, dr_path, hr30, staDb, rewrite,
+                             workdir=None):
+    """merges 3 consecutive datarecords files (filenames) in dr_path from
+    yesterday 21:00 to tommorow 03:00, i.e., 30 hr, and then runs rnxEditGde
+    with staDb on the merged file and saves it to hr30. the merged file is
+    written to workdir(default: cwd) and deleted after.
+    returns 'skipped', 'succ' or 'failed'."""
+    from pathlib import Path
+    import logging
+    logger = logging.getLogger('gipsyx')
+    if workdir is None:
+        workdir = Path().cwd()
+    rfn = filenames[1][0:12]
+    merged_filename = '{}_edited30hr.dr.gz'.format(rfn)
+    if not rewrite:
+        if (hr30 / merged_filename).is_file():
+            logger.warning(
+                    '{} already merged and edited in {}, skipping...'.format(
+                            merged_filename, hr30))
+            return 'skipped'
+    merged_file = run_drMerge_one_triplet(filenames, dr_path, duration='30hr',
+                                          workdir=workdir)
+    move_files(workdir, hr30, [rfn + x for x in ['_drmerge.log',
+                                                 '_drmerge.err']])
+    if merged_file is None:
+        return 'failed'
+    # rnxEditGde the merged datarecord with staDb and move to 30hr folder:
+    status = run_rnxEditGde_one_file(merged_file, workdir, hr30, staDb,
+                                     rewrite, 30, workdir=workdir)
+    # delete the merged file:
+    merged_file_path = workdir / merged_file
+    if merged_file_path.is_file():
+        merged_file_path.resolve().unlink()
+    return status
+
+
+def run_in_scratch_dir(func, name, scratch_path, *args, **kwargs):
+    """runs func(*args, workdir=scratch, **kwargs) inside its own temporary
+    scratch directory under scratch_path so that several gipsyX runs do not
+    overwrite each others outputs in cwd, deletes the scratch dir after.
+    returns name and the result of func."""
+    import shutil
+    import tempfile
+    from pathlib import Path
+    workdir = Path(tempfile.mkdtemp(prefix='{}_'.format(name),
+                                    dir=scratch_path))
+    try:
+        result = func(*args, workdir=workdir, **kwargs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return name, result
+
+
+def run_tasks_with_pool(tasks, scratch_path, jobs=1):
+    """runs tasks, a list of (name, func, args) tuples where func returns
+    'skipped', 'succ' or 'failed'. jobs=1 runs them one by one in cwd,
+    jobs>1 runs them in a process pool each in its own scratch dir under
+    scratch_path. returns the success/failure counter dict and the number
+    of files actually run (i.e., not skipped)."""
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import as_completed
+    import logging
+    logger = logging.getLogger('gipsyx')
+    cnt = {'succ': 0, 'failed': 0}
+    tot = len(tasks)
+    ran = 0
+
+    def count(status):
+        nonlocal ran
+        if status == 'failed':
+            cnt['failed'] += 1
+        else:
+            cnt['succ'] += 1
+        if status != 'skipped':
+            ran += 1
+        return
+
+    if jobs > 1:
+        logger.info('running {} tasks with {} workers.'.format(tot, jobs))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(run_in_scratch_dir, func, name,
+                                       scratch_path, *args)
+                       for name, func, args in tasks]
+            for future in as_completed(futures):
+                name, status = future.result()
+                count(status)
+                logger.info('finished {} ({}/{})'.format(
+                    name, cnt['succ'] + cnt['failed'], tot))
+    else:
+        for name, func, args in tasks:
+            logger.info('processing {} ({}/{})'.format(
+                name, cnt['succ'] + cnt['failed'], tot))
+            count(func(*args))
+    return cnt, ran
+
+
 def prepare_gipsyx_for_run_one_station(rinexpath, staDb, prep, rewrite,
-                                       date_range=None):
+                                       date_range=None, jobs=1):
     """rinex editing and merging command-line utility, 3 values for prep:
         0) drdump: run dataRecordDump on all rinex files in rinexpath
         1) edit24hr: run rnxEditGde.py with staDb on all datarecords files in
@@ -129,197 +411,82 @@ def prepare_gipsyx_for_run_one_station(rinexpath, staDb, prep, rewrite,
             files)
             and then rnxEditGde.py with staDb on merged datarecords files,
             save them to rinexpath / 30hr
-        rewrite: overwrite all files - supported with all modes of prep"""
-    import subprocess
-    from subprocess import CalledProcessError
-    from subprocess import TimeoutExpired
+        rewrite: overwrite all files - supported with all modes of prep
+        jobs: number of files to prep at once, each in its own scratch dir"""
+    from pathlib import Path
+    import time
     from aux_gps import slice_task_date_range
     from aux_gps import path_glob
     import logging
     import pandas as pd
-    global cnt
-    global tot
-    # from itertools import count
-    from pathlib import Path
-
-    def run_dataRecorDump_on_all_files(rinexpath, out_path, rewrite,
-                                       date_range=None):
-        """runs dataRecordDump on all files in rinexpath(where all and only
-        rinex files exist), saves the datarecord files to out_path. rewrite
-        is a flag that overwrites the files in out_path even if they already
-        exist there."""
+    logger = logging.getLogger('gipsyx')
+    logger.info(
+        'starting preparation utility utility for gipsyX run.')
+    logger.info('working with {}'.format(staDb))
+    if rewrite:
+        logger.warning('overwrite files mode initiated.')
+    if jobs > 1:
+        # scratch dirs mean the tools no longer run in cwd, so use abs paths:
+        rinexpath = rinexpath.resolve()
+        # leave the default $GOA_VAR staDb string as is:
+        if isinstance(staDb, Path):
+            staDb = staDb.resolve()
+    rinex_df = read_organize_rinex(rinexpath, date_range=date_range)
+    dr_path = rinexpath / 'dr'
+    tasks = []
+    if prep == 'drdump':
         logger.info('running dataRecordDump...')
         est_time_per_single_run = 1.0  # seconds
+        out_path = dr_path
         out_path.mkdir(parents=True, exist_ok=True)
         files = path_glob(rinexpath, '*.Z')
         files_already_done = path_glob(out_path, '*.dr.gz', True)
-        if date_range is not None:
-            files = slice_task_date_range(files, date_range, 'drdump')
-            files_already_done = slice_task_date_range(files_already_done,
-                                                       date_range,
-                                                       'already done drdump')
         tot = len(files)
         logger.info('found {} rinex Z files in {} to run.'.format(tot,
                                                                   rinexpath))
         tot_final = len(files_already_done)
         logger.info('found {} data records dr.gz files in {}'.format(tot_final,
                     out_path))
-        tot_to_run = tot - tot_final
-        dtt = pd.to_timedelta(est_time_per_single_run, unit='s') * tot_to_run
-        logger.info('estimated time to completion of run: {}'.format(dtt))
-        logger.info('check again in {}'.format(pd.Timestamp.now() + dtt))
         for file_and_path in files:
             filename = file_and_path.as_posix().split('/')[-1][0:12]
-            dr_file = out_path / '{}.dr.gz'.format(filename)
-            if not rewrite:
-                if (dr_file).is_file():
-                    logger.warning(
-                        '{} already exists in {}, skipping...'.format(
-                            filename + '.dr.gz', out_path))
-                    cnt['succ'] += 1
-                    continue
-            logger.info('processing {} ({}/{})'.format(
-                filename, cnt['succ'] + cnt['failed'], tot))
-            files_to_move = [filename + x for x in ['.log', '.err']]
-            command = 'dataRecordDump -rnx {} -drFileNmOut {} > {}.log 2>{}.err'.format(
-                file_and_path.as_posix(), dr_file.as_posix(), filename, filename)
-            try:
-                subprocess.run(command, shell=True, check=True)
-#                next(succ)
-                cnt['succ'] += 1
-            except CalledProcessError:
-                logger.error('dataRecordDump failed on {}...'.format(filename))
-#                next(failed)
-                cnt['failed'] += 1
-            except TimeoutExpired:
-                logger.error('dataRecordDump timed out on {}, copying log files.'.format(rfn))
-                # next(failed)
-                cnt['failed'] += 1
-                with open(Path().cwd() / files_to_move[1], 'a') as f:
-                    f.write('dataRecordDump has Timed out !')
-            move_files(Path().cwd(), out_path, files_to_move)
-        return
-
-    def run_rnxEditGde(filename, in_path, out_path, rewrite, suffix=24):
-        """runs rnxEditGde on filename that exists in in_path and writes the
-        edited file (with suffix) to out_path. it first checks wether filename
-        exists in out_path and if it is, it skipps this filename. rewrite flag
-        overwrites the filename regardless."""
-        rfn = filename[0:12]
-        station = rfn[0:4].upper()
-        dr_edited_file = out_path / '{}_edited{}hr.dr.gz'.format(rfn, suffix)
-        file_and_path = in_path / filename
-        if not rewrite:
-            if (dr_edited_file).is_file():
-                logger.warning(
-                    '{} already exists in {}, skipping...'.format(
-                        filename, out_path))
-                cnt['succ'] += 1
-                return
-        logger.info(
-            'processing {} ({}, {}/{})'.format(
-                filename,
-                date.strftime('%Y-%m-%d'), cnt['succ'] + cnt['failed'], tot))
-        files_to_move = [rfn + x for x in ['.log', '.err']]
-        command = 'rnxEditGde.py -type datarecord -recNm {} -data {} -out {} -staDb {} > {}.log 2>{}.err'.format(
-            station, file_and_path.as_posix(), dr_edited_file.as_posix(),
-            staDb.as_posix(), rfn, rfn)
-        try:
-            subprocess.run(command, shell=True, check=True)
-#            next(succ)
-            cnt['succ'] += 1
-        except CalledProcessError:
-#            next(failed)
-            cnt['failed'] += 1
-            logger.error('rnxEditGde.py failed on {}...'.format(filename))
-        except TimeoutExpired:
-            logger.error('rnxEditGde.py timed out on {}, copying log files.'.format(rfn))
-            # next(failed)
-            cnt['failed'] += 1
-            with open(Path().cwd() / files_to_move[1], 'a') as f:
-                f.write('rnxEditGde.py has Timed out !')
-        move_files(Path().cwd(), out_path, files_to_move)
-        return
-
-    def run_drMerge(filenames, in_path, duration):
-        from aux_gps import get_timedate_and_station_code_from_rinex
-        rfns = [x[0:12] for x in filenames]
-        dts = [get_timedate_and_station_code_from_rinex(x, True) for x in rfns]
-        if duration == '30hr':
-            start = dts[0].strftime('%Y-%m-%d') + ' 21:00:00'
-            end = dts[2].strftime('%Y-%m-%d') + ' 03:00:00'
-        dr_merged_file = Path().cwd() / '{}_merged.dr.gz'.format(rfns[1])
-        logger.info('merging {}, {} and {} to {}'.format(*rfns,rfns[1] + '_merged.dr.gz'))
-        f_and_paths = [in_path / x for x in filenames]
-        files_to_move = [rfn + x for x in ['_drmerge.log', '_drmerge.err']]
-        command = 'drMerge.py -inFiles {} {} {} -outFile {} -start {} -end {} > {}.log 2>{}.err'.format(
-                f_and_paths[0].as_posix(), f_and_paths[1].as_posix(),
-                f_and_paths[2].as_posix(), dr_merged_file.as_posix(),
-                start, end, rfn + '_drmerge', rfn + '_drmerge')
-        try:
-            subprocess.run(command, shell=True, check=True, timeout=60)
-        except CalledProcessError:
-            logger.error('drMerge.py failed on {}...'.format(filenames))
-        except TimeoutExpired:
-            logger.error('drMerge.py timed out on {}, copying log files.'.format(filenames))
-            # next(failed)
-            cnt['failed'] += 1
-            with open(Path().cwd() / files_to_move[1], 'a') as f:
-                f.write('drMerge.py run has Timed out !')
-            return None
-        move_files(Path().cwd(), Path().cwd(), files_to_move)
-        return rfns[1] + '_merged.dr.gz'
-    logger = logging.getLogger('gipsyx')
-    logger.info(
-        'starting preparation utility utility for gipsyX run.')
-    logger.info('working with {}'.format(staDb))
-    if rewrite:
-        logger.warning('overwrite files mode initiated.')
-    rinex_df = read_organize_rinex(rinexpath, date_range=date_range)
-    cnt = {'succ': 0, 'failed': 0}
-#    succ = count(1)
-#    failed = count(1)
-    # rinex_df = rinex_df.fillna(999)
-    dr_path = rinexpath / 'dr'
-    if prep == 'drdump':
-        run_dataRecorDump_on_all_files(rinexpath, dr_path, rewrite,
-                                       date_range=None)
+            tasks.append((filename, run_dataRecordDump_one_file,
+                          (file_and_path, out_path, rewrite)))
     elif prep == 'edit24hr':
         logger.info('running rnxEditGde.py with 24hr setting for all files.')
-        hr24 = rinexpath / '24hr'
+        est_time_per_single_run = 4.0  # seconds
+        out_path = rinexpath / '24hr'
         try:
-            hr24.mkdir()
+            out_path.mkdir()
         except FileExistsError:
-            logger.info('{} already exists, using that folder.'.format(hr24))
+            logger.info('{} already exists, using that folder.'.format(out_path))
+        tot_final = len(path_glob(out_path, '*.dr.gz', True))
         for date, row in rinex_df.iterrows():
             rfn = row['rinex']
             if pd.isna(rfn):
                 continue
             filename = rfn + '.dr.gz'
-            run_rnxEditGde(filename, dr_path, hr24, rewrite)
+            tasks.append((rfn, run_rnxEditGde_one_file,
+                          (filename, dr_path, out_path, staDb, rewrite)))
     elif prep == 'edit30hr':
         logger.info(
             'running drMerge.py/rnxEditGde.py with 30hr setting for all files(when available).')
-        hr30 = rinexpath / '30hr'
+        out_path = rinexpath / '30hr'
         est_time_per_single_run = 4.0  # seconds
         tot = rinex_df['30hr'].value_counts().sum()  # len(path_glob(dr_path, '*.dr.gz'))
         logger.info('found {} data records dr.gz files in {} to run.'.format(tot, dr_path))
-        files_already_done = path_glob(hr30, '*.dr.gz', True)
+        files_already_done = path_glob(out_path, '*.dr.gz', True)
         if date_range is not None:
             files_already_done = slice_task_date_range(files_already_done,
                                                        date_range,
                                                        'already done edit30hr')
         tot_final = len(files_already_done)
         logger.info('found {} edited and merged dr.gz files in {}'.format(tot_final,
-                    hr30))
-        tot_to_run = tot - tot_final
-        dtt = pd.to_timedelta(est_time_per_single_run, unit='s') * tot_to_run
-        logger.info('estimated time to completion of run: {}'.format(dtt))
-        logger.info('check again in {}'.format(pd.Timestamp.now() + dtt))
+                    out_path))
         try:
-            hr30.mkdir()
+            out_path.mkdir()
         except FileExistsError:
-            logger.info('{} already exists, using that folder.'.format(hr30))
+            logger.info('{} already exists, using that folder.'.format(out_path))
+        # build the lonely files and drMerge triplets ahead of time:
         for i, date in enumerate(rinex_df.index):
             rfn = rinex_df.loc[date, 'rinex']
             # missing datarecords files:
@@ -330,53 +497,96 @@ def prepare_gipsyx_for_run_one_station(rinexpath, staDb, prep, rewrite,
                 logger.warning(
                     '{} is lonely, doing 24hr prep only...'.format(rfn))
                 filename = rfn + '.dr.gz'
-                run_rnxEditGde(filename, dr_path, hr30, rewrite)
+                tasks.append((rfn, run_rnxEditGde_one_file,
+                              (filename, dr_path, out_path, staDb, rewrite)))
             # check for 3 consecutive datarecords files:
             elif rinex_df.loc[date, '30hr'] == 1:
-                merged_filename = '{}_edited30hr.dr.gz'.format(rfn)
-                if not rewrite:
-                    if (hr30 / merged_filename).is_file():
-                        logger.warning(
-                                '{} already merged and edited in {}, skipping...'.format(
-                                        merged_filename, hr30))
-                        cnt['succ'] += 1
-                        continue
                 yesterday = rinex_df.index[i - 1]
                 tommorow = rinex_df.index[i + 1]
                 rfns = [rinex_df.loc[yesterday, 'rinex'],
                         rfn, rinex_df.loc[tommorow, 'rinex']]
                 filenames = [x + '.dr.gz' for x in rfns]
-                # merge them from yesterday 21:00 to tommorow 03:00
-                # i.e., 30 hr:
-                merged_file = run_drMerge(filenames, dr_path, duration='30hr')
-                if merged_file is None:
-                    continue
-                # rnxEditGde the merged datarecord with staDb and move
-                # to 30hr folder:
-                run_rnxEditGde(merged_file, Path().cwd(), hr30, rewrite, 30)
-                merged_file_path = Path().cwd() / merged_file
-                # delete the merged file:
-                merged_file_path.resolve().unlink()
+                tasks.append((rfn, run_edit30hr_one_triplet,
+                              (filenames, dr_path, out_path, staDb, rewrite)))
+    tot_to_run = max(len(tasks) - tot_final, 0)
+    dtt = pd.to_timedelta(est_time_per_single_run, unit='s') * tot_to_run / jobs
+    logger.info('estimated time to completion of run: {}'.format(dtt))
+    logger.info('check again in {}'.format(pd.Timestamp.now() + dtt))
+    start_time = time.time()
+    cnt, ran = run_tasks_with_pool(tasks, out_path, jobs=jobs)
+    elapsed = time.time() - start_time
     logger.info('Done!')
-#    total = next(failed) + next(succ) - 2
-#    succses = next(succ) - 2
-#    failure = next(failed) - 2
     total = cnt['failed'] + cnt['succ']
     logger.info('Total files: {}, success: {}, failed: {}'.format(
             total, cnt['succ'], cnt['failed']))
+    if elapsed > 0:
+        logger.info('throughput: {:.2f} files per minute ({} runs in {})'.format(
+            ran / (elapsed / 60.0), ran,
+            pd.to_timedelta(elapsed, unit='s').round('s')))
     return
 
 
-def run_gd2e_for_one_station(dr_path, staDb, tree, rewrite, date_range=None):
-    """runs gd2e.py for all datarecodrs in one folder(dr_path) with staDb.
-    rewrite: overwrite the results tdp in dr_path / results."""
+def run_gd2e_one_file(file_and_path, staDb, tree, results_path, rewrite,
+                      workdir=None):
+    """runs gd2e.py on a single datarecord file (file_and_path) and moves the
+    outputs to results_path. workdir is the directory gd2e.py runs in and
+    writes its outputs to (default: cwd), giving each run its own workdir
+    allows several runs at once. returns 'skipped', 'succ' or 'failed'."""
     from pathlib import Path
     import subprocess
-    # from itertools import count
     from subprocess import CalledProcessError
     from subprocess import TimeoutExpired
     import logging
     from aux_gps import get_timedate_and_station_code_from_rinex
+    logger = logging.getLogger('gipsyx')
+    if workdir is None:
+        workdir = Path().cwd()
+    rfn = file_and_path.as_posix().split('/')[-1][0:12]
+    dt, station = get_timedate_and_station_code_from_rinex(rfn)
+    final_tdp = '{}_smoothFinal.tdp'.format(rfn)
+    if not rewrite:
+        if (results_path / final_tdp).is_file():
+            logger.warning(
+                '{} already exists in {}, skipping...'.format(
+                    final_tdp, results_path))
+            return 'skipped'
+    command = 'gd2e.py -drEditedFile {} -recList {} -staDb {} -treeS {} \
+    > {}.log 2>{}.err'.format(
+        file_and_path.as_posix(), station, staDb.as_posix(), tree, rfn,
+        rfn)
+    files_to_move = ['{}{}'.format(rfn, x)
+                     for x in ['.log', '.err']]
+    more_files = ['finalResiduals.out', 'smoothFinal.tdp']
+    more_files_rfn = ['{}_{}'.format(rfn, x) for x in more_files]
+    try:
+        subprocess.run(command, shell=True, check=True, timeout=300,
+                       cwd=workdir)
+        move_files(workdir, results_path, more_files,
+                   more_files_rfn)
+        move_files(workdir, results_path, 'Summary',
+                   '{}_Summary.txt'.format(rfn))
+        status = 'succ'
+    except CalledProcessError:
+        logger.error('gipsyx failed on {}, copying log files.'.format(rfn))
+        status = 'failed'
+    except TimeoutExpired:
+        logger.error('gipsyx timed out on {}, copying log files.'.format(rfn))
+        status = 'failed'
+        with open(workdir / files_to_move[1], 'a') as f:
+            f.write('GipsyX run has Timed out !')
+    move_files(workdir, results_path, files_to_move)
+    move_files(workdir, results_path, 'debug.tree', '{}_debug.tree'.format(rfn))
+    return status
+
+
+def run_gd2e_for_one_station(dr_path, staDb, tree, rewrite, date_range=None,
+                             jobs=1):
+    """runs gd2e.py for all datarecodrs in one folder(dr_path) with staDb.
+    rewrite: overwrite the results tdp in dr_path / results.
+    jobs: number of gd2e.py runs at once, each in its own scratch dir."""
+    from pathlib import Path
+    import time
+    import logging
     from aux_gps import path_glob
     from aux_gps import slice_task_date_range
     import pandas as pd
@@ -394,9 +604,6 @@ def run_gd2e_for_one_station(dr_path, staDb, tree, rewrite, date_range=None):
     except FileExistsError:
         logger.info(
             '{} already exists, using that folder.'.format(results_path))
-#    succ = count(1)
-#    failed = count(1)
-    cnt = {'succ': 0, 'failed': 0}
     files = path_glob(dr_path, '*.dr.gz')
     if date_range is not None:
         files = slice_task_date_range(files, date_range, 'run')
@@ -407,59 +614,34 @@ def run_gd2e_for_one_station(dr_path, staDb, tree, rewrite, date_range=None):
                 results_path))
     tot_to_run = tot - tot_final
     est_time_per_single_run = 22.0  # seconds
-    dtt = pd.to_timedelta(est_time_per_single_run, unit='s') * tot_to_run
+    dtt = pd.to_timedelta(est_time_per_single_run, unit='s') * tot_to_run / jobs
     logger.info('estimated time to completion of run: {}'.format(dtt))
     logger.info('check again in {}'.format(pd.Timestamp.now() + dtt))
+    if jobs > 1:
+        # scratch dirs mean gd2e.py no longer runs in cwd, so use abs paths:
+        files = [x.resolve() for x in files]
+        results_path = results_path.resolve()
+        # leave the default $GOA_VAR staDb string as is:
+        if isinstance(staDb, Path):
+            staDb = staDb.resolve()
+        if tree.as_posix().strip():
+            tree = tree.resolve()
+    tasks = []
     for file_and_path in files:
         rfn = file_and_path.as_posix().split('/')[-1][0:12]
-        dt, station = get_timedate_and_station_code_from_rinex(rfn)
-        final_tdp = '{}_smoothFinal.tdp'.format(rfn)
-        logger.info(
-            'processing {} ({}, {}/{})'.format(
-                rfn,
-                dt.strftime('%Y-%m-%d'), cnt['succ'] + cnt['failed'], tot))
-        if not rewrite:
-            if (results_path / final_tdp).is_file():
-                logger.warning(
-                    '{} already exists in {}, skipping...'.format(
-                        final_tdp, results_path))
-                cnt['succ'] += 1
-                continue
-        command = 'gd2e.py -drEditedFile {} -recList {} -staDb {} -treeS {} \
-        > {}.log 2>{}.err'.format(
-            file_and_path.as_posix(), station, staDb.as_posix(), tree, rfn,
-            rfn)
-        files_to_move = ['{}{}'.format(rfn, x)
-                         for x in ['.log', '.err']]
-        more_files = ['finalResiduals.out', 'smoothFinal.tdp']
-        more_files_rfn = ['{}_{}'.format(rfn, x) for x in more_files]
-        try:
-            subprocess.run(command, shell=True, check=True, timeout=300)
-            move_files(Path().cwd(), results_path, more_files,
-                       more_files_rfn)
-            move_files(Path().cwd(), results_path, 'Summary',
-                       '{}_Summary.txt'.format(rfn))
-            # next(succ)
-            cnt['succ'] += 1
-        except CalledProcessError:
-            logger.error('gipsyx failed on {}, copying log files.'.format(rfn))
-            # next(failed)
-            cnt['failed'] += 1
-        except TimeoutExpired:
-            logger.error('gipsyx timed out on {}, copying log files.'.format(rfn))
-            # next(failed)
-            cnt['failed'] += 1
-            with open(Path().cwd() / files_to_move[1], 'a') as f:
-                f.write('GipsyX run has Timed out !')
-        move_files(Path().cwd(), results_path, files_to_move)
-        move_files(Path().cwd(), results_path, 'debug.tree', '{}_debug.tree'.format(rfn))
+        tasks.append((rfn, run_gd2e_one_file,
+                      (file_and_path, staDb, tree, results_path, rewrite)))
+    start_time = time.time()
+    cnt, ran = run_tasks_with_pool(tasks, results_path, jobs=jobs)
+    elapsed = time.time() - start_time
     logger.info('Done!')
-    # total = next(failed) + next(succ) - 2
     total = cnt['succ'] + cnt['failed']
-#    succses = next(succ) - 2
-#    failure = next(failed) - 2
     logger.info('Total files: {}, success: {}, failed: {}'.format(
             total, cnt['succ'], cnt['failed']))
+    if elapsed > 0:
+        logger.info('throughput: {:.2f} files per minute ({} gd2e.py runs in {})'.format(
+            ran / (elapsed / 60.0), ran,
+            pd.to_timedelta(elapsed, unit='s').round('s')))
     return
 
 
@@ -505,9 +687,11 @@ if __name__ == '__main__':
             dest='rewrite',
             action='store_true',
             help='overwrite files in prep/run mode')
+    optional.add_argument('--jobs', help='number of files to prep/run at once',
+                          type=check_abs_int)
 
     parser._action_groups.append(optional)  # added this line
-    parser.set_defaults(rewrite=False)
+    parser.set_defaults(rewrite=False, jobs=1)
     args = parser.parse_args()
     if args.rinexpath is None:
         print('rinexpath is a required argument, run with -h...')
@@ -517,9 +701,9 @@ if __name__ == '__main__':
     if args.prep is not None:
         prepare_gipsyx_for_run_one_station(args.rinexpath, args.staDb,
                                            args.prep, args.rewrite,
-                                           args.daterange)
+                                           args.daterange, args.jobs)
     elif args.prep is None:
         if args.tree is None:
             args.tree = Path(' ')
         run_gd2e_for_one_station(args.rinexpath, args.staDb, args.tree,
-                                 args.rewrite, args.daterange)
+                                 args.rewrite, args.daterange, args.jobs)
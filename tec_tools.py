@@ -41,76 +41,126 @@ def assemble_epochs_arcs_stec(stec):
     return da
 
 
+def hatch_arc_starts(valid, l4=None, l4_jump=None):
+    """mark the first epoch of every carrier-smoothing arc in the (sv, time)
+    bool array valid: an arc starts after a gap (no P4/L4) and, if l4_jump is
+    given, after an L4 jump larger than l4_jump (cycle slip)"""
+    import numpy as np
+    valid = np.atleast_2d(valid)
+    starts = valid.copy()
+    starts[:, 1:] &= ~valid[:, :-1]
+    if l4_jump is not None:
+        dl4 = np.abs(np.diff(np.atleast_2d(l4), axis=1))
+        with np.errstate(invalid='ignore'):
+            starts[:, 1:] |= valid[:, 1:] & (dl4 > l4_jump)
+    return starts
+
+
+def hatch_filter_arcs(p4, l4, starts):
+    """run the Hatch filter on all arcs at once. p4, l4 are the 1D
+    concatenated arcs and starts marks the first epoch of each arc.
+    the recursion steps over the epoch within the arc for all the arcs
+    together, so it gives the same values as looping arc by arc"""
+    import numpy as np
+    p4 = np.asarray(p4)
+    l4 = np.asarray(l4)
+    if p4.size == 0:
+        return np.empty(p4.shape)
+    first = np.flatnonzero(starts)
+    arc = np.cumsum(starts) - 1
+    lengths = np.diff(np.append(first, p4.size))
+    # longest arcs first, so the arcs still running at epoch t are [:n]:
+    order = np.argsort(-lengths, kind='stable')
+    col = np.empty_like(order)
+    col[order] = np.arange(order.size)
+    col = col[arc]
+    epoch = np.arange(p4.size) - first[arc]
+    running = np.searchsorted(-lengths[order], -np.arange(lengths.max()),
+                              side='left')
+    # (epoch, arc) arrays:
+    P = np.full((lengths.max(), first.size), np.nan)
+    L = np.full((lengths.max(), first.size), np.nan)
+    P[epoch, col] = p4
+    L[epoch, col] = l4
+    p_sm = np.empty(P.shape)
+    p_sm[0] = P[0]
+    for t in range(1, lengths.max()):
+        n = running[t]
+        p4_prd = p_sm[t-1, :n] + L[t, :n] - L[t-1, :n]
+        w = 1.0 / (t + 1)
+        p_sm[t, :n] = w*P[t, :n] + (1 - w)*p4_prd
+    return p_sm[epoch, col]
+
+
 def smooth_p4_one_sat(p4, l4):
     import numpy as np
     import xarray as xr
     # from aux_gps import xr_reindex_with_date_range
-    p4_arcs = []
-    for arc in p4.event.values:
-        time = p4.sel(event=arc).dropna('time')['time']
-        p4_arc = p4.sel(event=arc).dropna('time').values
-        l4_arc = l4.sel(event=arc).dropna('time').values
-        epochs = len(p4_arc)
-        if epochs > 0:
-            # w = np.ones(p4_arc.shape) / np.arange(1, epochs+1)
-            p_sm = np.empty(p4_arc.shape)
-            p_sm[0] = p4_arc[0]
-            for t in np.arange(1, epochs):
-                p4_prd = p_sm[t-1] + l4_arc[t] - l4_arc[t-1]
-                w = 1.0 / (t + 1)
-                p_sm[t] = w*p4_arc[t] + (1 - w)*p4_prd
-            p_sm = xr.DataArray(p_sm, dims=['time'])
-            p_sm['time'] = time
-            p4_arcs.append(p_sm)
-    p4_smoothed_sat = xr.concat(p4_arcs, 'time')
+    p4 = p4.transpose('event', 'time')
+    l4 = l4.transpose('event', 'time')
+    valid = p4.notnull().values
+    # every event is one arc:
+    starts = valid & (np.cumsum(valid, axis=1) == 1)
+    p_sm = hatch_filter_arcs(p4.values[valid], l4.values[l4.notnull().values],
+                             starts[valid])
+    time = np.broadcast_to(p4['time'].values, valid.shape)[valid]
+    p4_smoothed_sat = xr.DataArray(p_sm, dims=['time'])
+    p4_smoothed_sat['time'] = time
     # p4_smoothed_sat = xr_reindex_with_date_range(p4_smoothed_sat, freq='30S')
     return p4_smoothed_sat
 
 
-def smooth_all_p4_in_long_term_rinex(rinex_ds, sat='GPS'):
-    from aux_gps import compute_consecutive_events_datetimes
+def smooth_all_p4_in_long_term_rinex(rinex_ds, sat='GPS', minimum_epochs=30,
+                                     l4_jump=None):
+    """carrier-smooth P4 of all the sat satellites together. arcs are split
+    on gaps and (if l4_jump is given) on L4 jumps, arcs with no more than
+    minimum_epochs epochs are dropped"""
+    import numpy as np
     import xarray as xr
     print('smoothing all P4 in rinex dataset...')
     sat_dict = dict(rinex_ds.attrs['satellite system identifier'])
     sat_id = sat_dict.get(sat)
     sat_grp = [x for x in rinex_ds.sv.values if sat_id in x]
     rinex = rinex_ds.sel(sv=sat_grp)
-    P4 = rinex['P4'].to_dataset('sv')
-    L4 = rinex['L4'].to_dataset('sv')
-    p4_list = []
-    l4_list = []
-    for sat_num in rinex.sv.values:
-        p4_list.append(compute_consecutive_events_datetimes(P4[sat_num],
-                                                            minimum_epochs=30))
-        l4_list.append(compute_consecutive_events_datetimes(L4[sat_num],
-                                                            minimum_epochs=30))
-    P4 = xr.merge(p4_list)
-    P4.attrs['name'] = 'P4'
-    L4 = xr.merge(l4_list)
-    L4.attrs['name'] = 'L4'
-    p4_list = []
-    for p4, l4 in zip(P4.data_vars.values(), L4.data_vars.values()):
-        p4_smoothed = smooth_p4_one_sat(p4, l4)
-        p4_list.append(p4_smoothed)
-    P4_smoothed = xr.concat(p4_list, 'sv')
-    P4_smoothed['sv'] = rinex.sv
+    p4 = rinex['P4'].transpose('sv', 'time').values
+    l4 = rinex['L4'].transpose('sv', 'time').values
+    valid = ~np.isnan(p4) & ~np.isnan(l4)
+    starts = hatch_arc_starts(valid, l4, l4_jump)[valid]
+    # filter out minimum consecutive epochs:
+    arc = np.cumsum(starts) - 1
+    keep = np.bincount(arc)[arc] > minimum_epochs
+    ind = np.flatnonzero(valid)[keep]
+    p_sm = np.full(p4.shape, np.nan)
+    p_sm.flat[ind] = hatch_filter_arcs(p4.flat[ind], l4.flat[ind],
+                                       starts[keep])
+    P4_smoothed = xr.DataArray(p_sm, dims=['sv', 'time'])
+    P4_smoothed['sv'] = rinex.sv.values
+    P4_smoothed['time'] = rinex.time.values
+    P4_smoothed = P4_smoothed.isel(time=np.isfinite(p_sm).any(axis=0))
     P4_smoothed.name = 'P4_smoothed'
-    P4_smoothed = P4_smoothed.reset_coords(drop=True).sortby('sv')
+    P4_smoothed = P4_smoothed.sortby('sv')
     print('Done!')
     return P4_smoothed
 
 
-def read_all_rinex_files_in_path(path=ionex_path):
+def read_all_rinex_files_in_path(path=ionex_path, jobs=1):
+    """read all the rinex obs files in path using jobs processes"""
     import xarray as xr
     from aux_gps import path_glob
+    from concurrent.futures import ProcessPoolExecutor
     files = path_glob(path, '*.*o')
-    rnxs = [read_rinex_obs_with_attrs(x) for x in files]
+    if jobs == 1:
+        rnxs = [read_rinex_obs_with_attrs(x) for x in files]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            rnxs = list(executor.map(read_rinex_obs_with_attrs, files))
     rinex_ds = xr.concat(rnxs, 'time')
     rinex_ds = rinex_ds.sortby('time')
     return rinex_ds
 
 
-def read_all_dcb_files_in_path(path=ionex_path, source='cddis'):
+def read_all_dcb_files_in_path(path=ionex_path, source='cddis',
+                               cache_path=None):
     import xarray as xr
     from aux_gps import path_glob
     import pandas as pd
@@ -118,7 +168,7 @@ def read_all_dcb_files_in_path(path=ionex_path, source='cddis'):
         files = path_glob(path, '*.*i')
         dcb_list = []
         for file in files:
-            _, dcb = read_ionex_xr(file, plot=None)
+            _, dcb = read_ionex_xr(file, plot=None, cache_path=cache_path)
             dcb_list.append(dcb)
     elif source == 'bern':
         files = path_glob(path, '*.DCB')
@@ -206,6 +256,101 @@ def compute_stec(rinex_ds, dcb_ds, sat='GPS', station='bshm'):
     return stec
 
 
+def stec_day_jobs(files, dcb_ds, station='bshm'):
+    """yield the per-day stec jobs of the rinex files: the day's rinex file,
+    the dcbs of the satellites(dict) and of the station in meters. days with
+    no dcbs are skipped"""
+    from aux_gps import get_timedate_and_station_code_from_rinex
+    for file in files:
+        day = get_timedate_and_station_code_from_rinex(file.name, just_dt=True)
+        try:
+            dcb = dcb_ds.sel(time=day)
+            dcb_st = dcb.station_bias.sel(station=station) * 1e-9 * speed_of_light
+        except KeyError:
+            print('no dcb for {}, skipping...'.format(file.name))
+            continue
+        dcb_sat = dcb.bias * 1e-9 * speed_of_light
+        dcb_sat = {sv: dcb_sat.sel(sv=sv).values.item() for sv in
+                   dcb_sat.sv.values}
+        yield file, dcb_sat, dcb_st.values.item()
+
+
+def compute_daily_stec(rinex_file, dcb_sat, dcb_station, sat='GPS'):
+    """compute the slant tec of one day from its rinex file and its dcbs in
+    meters(dcb_sat is a dict of the satellites dcbs). P4 is smoothed within
+    the day. returns None if none of the day's satellites has a dcb"""
+    import xarray as xr
+    rinex_ds = read_rinex_obs_with_attrs(rinex_file)
+    P4_smoothed = smooth_all_p4_in_long_term_rinex(rinex_ds, sat=sat)
+    tec_list = [compute_via_p(P4_smoothed.sel(sv=sv), F1, F2, dcb_sat[sv],
+                              dcb_station)
+                for sv in P4_smoothed.sv.values if sv in dcb_sat]
+    if not tec_list:
+        return None
+    stec = xr.Dataset()
+    stec['tec_p4'] = xr.concat(tec_list, 'sv')
+    stec['tec_p4'].attrs['name'] = 'tec from P1 and P2'
+    stec['tec_p4'].attrs['unit'] = 'TECU'
+    stec.attrs['position'] = rinex_ds.attrs['position']
+    return stec
+
+
+def compute_all_stec(path=ionex_path, dcb_ds=None, station='bshm', sat='GPS',
+                     jobs=1, savepath=ionex_path):
+    """compute the slant tec of all the daily rinex files of station in path,
+    each day is a job run on jobs processes. the days are streamed into the
+    station's store(stec_station.nc in savepath), one netcdf group per day
+    chunked by satellite, see read_stec_store"""
+    import xarray as xr
+    from aux_gps import path_glob
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    if dcb_ds is None:
+        dcb_ds = read_all_dcb_files_in_path(path)
+    files = path_glob(path, '{}*.*o'.format(station))
+    store = savepath / 'stec_{}.nc'.format(station)
+    tmp_store = savepath / 'stec_{}.nc.tmp'.format(station)
+    attrs = {'station': station, 'satellite system': sat,
+             'dcb source': dcb_ds.attrs['data source']}
+    xr.Dataset(attrs=attrs).to_netcdf(tmp_store, 'w')
+    print('computing stec for {} days of {} using {} jobs'.format(
+          len(files), station, jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(compute_daily_stec, *job, sat=sat): job[0]
+                   for job in stec_day_jobs(files, dcb_ds, station)}
+        for future in as_completed(futures):
+            stec = future.result()
+            if stec is None:
+                print('no dcb for the satellites of {}, skipping...'.format(
+                      futures[future].name))
+                continue
+            day = stec['time'][0].dt.strftime('%Y-%m-%d').item()
+            chunks = (1, stec['time'].size)
+            encoding = {'tec_p4': dict(zlib=True, complevel=9,
+                                       chunksizes=chunks)}
+            stec.to_netcdf(tmp_store, 'a', group=day, encoding=encoding)
+            print('{} stec of {} was added to {}'.format(day, station,
+                                                         store.name))
+    tmp_store.replace(store)
+    return store
+
+
+def read_stec_store(store, start=None, end=None):
+    """read the daily stec groups of a station stec store(see
+    compute_all_stec) between start and end"""
+    import netCDF4
+    import xarray as xr
+    with netCDF4.Dataset(store) as nc:
+        days = sorted(nc.groups.keys())
+        attrs = {x: nc.getncattr(x) for x in nc.ncattrs()}
+    if start is not None:
+        days = [x for x in days if x >= str(start)[0:10]]
+    if end is not None:
+        days = [x for x in days if x <= str(end)[0:10]]
+    stec = xr.concat([xr.open_dataset(store, group=x) for x in days], 'time')
+    stec.attrs.update(attrs)
+    return stec
+
+
 def tec_factor(f1, f2):
     """Tec_factor(f1, f2) -> the factor.
 
@@ -239,6 +384,9 @@ def compute_via_p(p4, f1, f2, dcb_sat=None, dcb_station=None):
     """
     if dcb_station is None and dcb_sat is None:
         tec = -tec_factor(f1, f2) * (p4)
+    elif not hasattr(dcb_sat, 'time'):
+        # the dcbs of a single day:
+        tec = tec_factor(f1, f2) * (p4 + dcb_sat + dcb_station)
     else:
         tecs = []
         for time in dcb_sat.time.values:
@@ -370,12 +518,84 @@ def read_code_dcb_xr(filepath=ionex_path/'COD20021.DCB'):
     return ds
 
 
+def plot_ionex_tec(tec_ds, plot='every_hour', extent=None):
+    """plot the tec maps of one ionex day, plot is 'every_hour' or a list of
+    start and end hours"""
+    import cartopy.crs as ccrs
+    import pandas as pd
+    dt = pd.to_datetime(tec_ds['time'].values[0]).floor('D')
+    if plot == 'every_hour':
+        times = tec_ds['time'].values[::4][:-1]
+        da = tec_ds['tec'].sel(time=times)
+        if extent is not None:
+            da = da.sel(lon=slice(extent[0], extent[1]), lat=slice(extent[0],extent[1]))
+        proj = ccrs.PlateCarree()
+        fg = da.plot.contourf(col='time', col_wrap=6,
+                              add_colorbar=False,
+                              cmap='viridis', extend=None, levels=41,
+                              subplot_kws={'projection': proj},
+                              transform=ccrs.PlateCarree(),
+                              figsize=(20, 30))
+        fg = add_horizontal_colorbar(fg,
+                                     cbar_kwargs_dict={'label': 'TECU'})
+        fg.fig.subplots_adjust(top=0.965,
+                               bottom=0.116,
+                               left=0.006,
+                               right=0.985,
+                               hspace=0.0,
+                               wspace=0.046)
+    elif isinstance(plot, list):
+        time1 = dt + pd.Timedelta(plot[0], unit='H')
+        time2 = dt + pd.Timedelta(plot[1], unit='H')
+        da = tec_ds['tec'].sel(time=slice(time1, time2))
+        if extent is not None:
+            da = da.sel(lon=slice(extent[0], extent[1]), lat=slice(extent[0],extent[1]))
+        proj = ccrs.PlateCarree()
+        fg = da.plot.contourf(col='time', col_wrap=6,
+                              add_colorbar=False,
+                              cmap='viridis', extend=None, levels=41,
+                              subplot_kws={'projection': proj},
+                              transform=ccrs.PlateCarree(),
+                              figsize=(20, 30), robust=True)
+        fg = add_horizontal_colorbar(fg,
+                                     cbar_kwargs_dict={'label': 'TECU'})
+        fg.fig.subplots_adjust(top=0.965,
+                               bottom=0.116,
+                               left=0.006,
+                               right=0.985,
+                               hspace=0.0,
+                               wspace=0.046)
+
+    for i, ax in enumerate(fg.axes.flatten()):
+        ax.coastlines(resolution='110m')
+        gl = ax.gridlines(crs=ccrs.PlateCarree(),
+                          linewidth=1,
+                          color='black',
+                          alpha=0.5,
+                          linestyle='--',
+                          draw_labels=False)
+        # Without this aspect attributes the maps will look chaotic and the
+        # "extent" attribute above will be ignored
+    return fg
+
+
 def read_ionex_xr(filepath=ionex_path/'uqrg0210.20i', plot='every_hour',
-                  extent=None):
+                  extent=None, cache_path=None):
+    """read the tec maps and dcbs of an ionex file, if cache_path is not None
+    the parsed file is taken from(or saved to) the ionex cache there"""
     from getIONEX import read_tec
-    import cartopy.crs as ccrs
     import xarray as xr
     import pandas as pd
+    if cache_path is not None:
+        cache_file = cache_path / '{}.nc'.format(filepath.name)
+        cached = read_cached_ionex_day(cache_file, ionex_cache_key(filepath))
+        if cached is None:
+            cache_ionex_day(filepath, cache_path)
+            cached = read_cached_ionex_day(cache_file)
+        tec_ds, dcb_ds = cached
+        if plot is not None:
+            plot_ionex_tec(tec_ds, plot, extent)
+        return tec_ds, dcb_ds
     print('reading {} ionex file'.format(filepath.as_posix().split('/')[-1]))
     dt, code = get_dt_from_single_ionex(filepath.as_posix().split('/')[-1])
     tecarray, rmsarray, lonarray, latarray, timearray, dcb_list, sta_list = read_tec(
@@ -413,61 +633,135 @@ def read_ionex_xr(filepath=ionex_path/'uqrg0210.20i', plot='every_hour',
     dcb_ds['prn'] = ['G']
     dcb_ds.attrs['data source'] = 'ftp://cddis.nasa.gov/gnss/products/ionex/'
     if plot is not None:
-        if plot == 'every_hour':
-            times = tec_ds['time'].values[::4][:-1]
-            da = tec_ds['tec'].sel(time=times)
-            if extent is not None:
-                da = da.sel(lon=slice(extent[0], extent[1]), lat=slice(extent[0],extent[1]))
-            proj = ccrs.PlateCarree()
-            fg = da.plot.contourf(col='time', col_wrap=6,
-                                  add_colorbar=False,
-                                  cmap='viridis', extend=None, levels=41,
-                                  subplot_kws={'projection': proj},
-                                  transform=ccrs.PlateCarree(),
-                                  figsize=(20, 30))
-            fg = add_horizontal_colorbar(fg,
-                                         cbar_kwargs_dict={'label': 'TECU'})
-            fg.fig.subplots_adjust(top=0.965,
-                                   bottom=0.116,
-                                   left=0.006,
-                                   right=0.985,
-                                   hspace=0.0,
-                                   wspace=0.046)
-        elif isinstance(plot, list):
-            time1 = dt + pd.Timedelta(plot[0], unit='H')
-            time2 = dt + pd.Timedelta(plot[1], unit='H')
-            da = tec_ds['tec'].sel(time=slice(time1, time2))
-            if extent is not None:
-                da = da.sel(lon=slice(extent[0], extent[1]), lat=slice(extent[0],extent[1]))
-            proj = ccrs.PlateCarree()
-            fg = da.plot.contourf(col='time', col_wrap=6,
-                                  add_colorbar=False,
-                                  cmap='viridis', extend=None, levels=41,
-                                  subplot_kws={'projection': proj},
-                                  transform=ccrs.PlateCarree(),
-                                  figsize=(20, 30), robust=True)
-            fg = add_horizontal_colorbar(fg,
-                                         cbar_kwargs_dict={'label': 'TECU'})
-            fg.fig.subplots_adjust(top=0.965,
-                                   bottom=0.116,
-                                   left=0.006,
-                                   right=0.985,
-                                   hspace=0.0,
-                                   wspace=0.046)
-
-        for i, ax in enumerate(fg.axes.flatten()):
-            ax.coastlines(resolution='110m')
-            gl = ax.gridlines(crs=ccrs.PlateCarree(),
-                              linewidth=1,
-                              color='black',
-                              alpha=0.5,
-                              linestyle='--',
-                              draw_labels=False)
-            # Without this aspect attributes the maps will look chaotic and the
-            # "extent" attribute above will be ignored
+        plot_ionex_tec(tec_ds, plot, extent)
     return tec_ds, dcb_ds
 
 
+
+def ionex_cache_key(filepath):
+    """return the name, size and mtime(ns) of the ionex file that key its
+    cache entry"""
+    stat = filepath.stat()
+    return filepath.name, stat.st_size, stat.st_mtime_ns
+
+
+def cache_ionex_day(filepath, cache_path=ionex_path / 'ionex_cache'):
+    """parse the ionex file and save its tec maps and dcbs to a compressed
+    netcdf file in cache_path, chunked by map and keyed by the ionex file
+    name, size and mtime"""
+    name, size, mtime_ns = ionex_cache_key(filepath)
+    tec_ds, dcb_ds = read_ionex_xr(filepath, plot=None)
+    tec_ds.attrs['ionex_file'] = name
+    tec_ds.attrs['ionex_size'] = size
+    tec_ds.attrs['ionex_mtime_ns'] = mtime_ns
+    cache_path.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_path / '{}.nc'.format(name)
+    # write to a temporary file first so that no partial entries are left:
+    tmp_file = cache_path / '{}.nc.tmp'.format(name)
+    chunks = (1, tec_ds['lat'].size, tec_ds['lon'].size)
+    comp = dict(zlib=True, complevel=9, chunksizes=chunks)
+    encoding = {var: comp for var in tec_ds.data_vars}
+    tec_ds.to_netcdf(tmp_file, 'w', group='tec', encoding=encoding)
+    dcb_ds.to_netcdf(tmp_file, 'a', group='dcb')
+    tmp_file.replace(cache_file)
+    return cache_file
+
+
+def read_cached_ionex_day(cache_file, key=None):
+    """lazily open the tec maps and dcbs of a cached ionex day, returns None
+    if the entry is missing, corrupted or stale(i.e., does not match key,
+    see ionex_cache_key)"""
+    import xarray as xr
+    try:
+        tec_ds = xr.open_dataset(cache_file, group='tec')
+        dcb_ds = xr.open_dataset(cache_file, group='dcb')
+        # read the last map to make sure the data is readable:
+        tec_ds['tec'][-1].values
+    except (OSError, ValueError, KeyError, RuntimeError):
+        return None
+    cached_key = (tec_ds.attrs.get('ionex_file'),
+                  tec_ds.attrs.get('ionex_size'),
+                  tec_ds.attrs.get('ionex_mtime_ns'))
+    if key is not None and cached_key != tuple(key):
+        tec_ds.close()
+        dcb_ds.close()
+        return None
+    return tec_ds, dcb_ds
+
+
+def read_ionex_cache_index(cache_path, years):
+    """read the yearly time indices of the ionex cache"""
+    import pandas as pd
+    cols = ['date', 'code', 'ionex_file', 'size', 'mtime_ns']
+    dfs = [pd.read_csv(cache_path / 'ionex_cache_index_{}.csv'.format(year),
+                       parse_dates=['date'])
+           for year in years
+           if (cache_path / 'ionex_cache_index_{}.csv'.format(year)).is_file()]
+    if not dfs:
+        return pd.DataFrame(columns=cols)
+    return pd.concat(dfs)[cols]
+
+
+def save_ionex_cache_index(index, cache_path):
+    """save the ionex cache index to its yearly index files"""
+    for year, df in index.groupby(index['date'].dt.year):
+        df = df.sort_values('date')
+        df.to_csv(cache_path / 'ionex_cache_index_{}.csv'.format(year),
+                  index=False)
+    return
+
+
+def load_ionex_tec(start, end, path=ionex_path, code='uqrg', glob='*.*i',
+                   cache_path=ionex_path / 'ionex_cache'):
+    """return the tec maps between start and end from the ionex cache, the
+    ionex files of these days in path are parsed only if their cache entry is
+    missing, stale or corrupted. days that are only in the cache are used as
+    well. code is the ionex analysis center(None for all)"""
+    import pandas as pd
+    import xarray as xr
+    from aux_gps import path_glob
+    start = pd.to_datetime(start)
+    end = pd.to_datetime(end)
+    index = read_ionex_cache_index(cache_path, range(start.year, end.year + 1))
+    index = index.set_index('ionex_file', drop=False)
+    # validate (or build) the cache entries of the ionex files in range:
+    cached = {}
+    for file in path_glob(path, glob, return_empty_list=True):
+        dt, file_code = get_dt_from_single_ionex(file.name)
+        if (code is not None and file_code != code) or dt < start.floor('D') or dt > end:
+            continue
+        key = ionex_cache_key(file)
+        cache_file = cache_path / '{}.nc'.format(file.name)
+        cached[file.name] = read_cached_ionex_day(cache_file, key)
+        if cached[file.name] is None:
+            print('caching {} ionex file'.format(file.name))
+            cache_ionex_day(file, cache_path)
+            cached[file.name] = read_cached_ionex_day(cache_file, key)
+        index.loc[file.name] = [dt, file_code, file.name, key[1], key[2]]
+    # add the days that are only in the cache:
+    in_range = index[(index['date'] >= start.floor('D')) & (index['date'] <= end)]
+    if code is not None:
+        in_range = in_range[in_range['code'] == code]
+    for name in in_range['ionex_file']:
+        if name not in cached:
+            cached[name] = read_cached_ionex_day(cache_path / '{}.nc'.format(name))
+            if cached[name] is None:
+                print('{} cache entry is corrupted and its ionex file is missing, skipping...'.format(name))
+                index = index.drop(name)
+    if cached:
+        save_ionex_cache_index(index, cache_path)
+    tec_list = [cached[name][0] for name in in_range.sort_values('date')['ionex_file']
+                if cached.get(name) is not None]
+    if not tec_list:
+        raise FileNotFoundError('no ionex data between {} and {}'.format(start, end))
+    tec_ds = xr.concat(tec_list, 'time')
+    # the last map of a day is also the first map of the next day:
+    duplicated = tec_ds.indexes['time'].duplicated(keep='last')
+    tec_ds = tec_ds.isel(time=~duplicated).sel(time=slice(start, end))
+    for attr in ['ionex_file', 'ionex_size', 'ionex_mtime_ns']:
+        tec_ds.attrs.pop(attr, None)
+    return tec_ds
+
     
 def read_ionex_file(file):
     import pandas as pd